@@ -0,0 +1,261 @@
+from __future__ import print_function
+from client import client_context
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from polling import PollBackoff, PollMetrics
+from timing import TaskTimings
+from worker import BATCH_POLL_TIMEOUT, POLLING_INTERVAL
+import asyncio
+import socket
+import threading
+import time
+
+
+class _Handler(object):
+    def __init__(self, exec_function, thread_count, max_in_flight, domain, batch_size, update_delay):
+        self.exec_function = exec_function
+        self.max_in_flight = max_in_flight or max(thread_count, batch_size or 1)
+        self.domain = domain
+        self.in_flight = 0
+
+        # Finished tasks, with the time each was ready, waiting to be sent in one batch update (see worker.Worker)
+        self.batch_size = batch_size
+        self.update_delay = update_delay
+        self.updates = []
+        self.flush_timer = None
+
+        # Coroutine functions are awaited on the loop; anything else runs on this handler's own threads
+        if asyncio.iscoroutinefunction(exec_function):
+            self.executor = None
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=thread_count)
+
+    def free(self):
+        return self.max_in_flight - self.in_flight
+
+
+class AsyncRuntime(object):
+    # Serves any number of task types from a single asyncio event loop.
+    #
+    # Rather than one sleeping poller per task type, each cycle fetches the queue depth of every registered
+    # type in one request and polls only the types with pending work, as many times as they have both
+    # backlog and free capacity. A cycle that finds work is followed straight away by the next one; while
+    # every queue is empty the wait between cycles backs off exponentially up to polling_interval seconds (see
+    # polling.PollBackoff), so an idle deployment costs about one request per polling interval in total. Poll
+    # counts and pickup latency are kept in metrics, and per task type timings of each task's phases in timings
+    # (see timing.TaskTimings). All HTTP calls share the server's pooled session.
+    #
+    # Task types registered with a batch_size are polled, acked and updated up to batch_size tasks per request.
+
+    def __init__(self, endpoint='http://localhost:8080/api', polling_interval=POLLING_INTERVAL, io_threads=8,
+                 worker_id=None):
+        # endpoint is a server URL or a client.ClientContext
+        self.context = client_context(endpoint)
+        self.task_client = self.context.task_client
+        self.polling_interval = polling_interval
+        self.worker_id = worker_id or socket.gethostname()
+
+        self.metrics = PollMetrics()
+        self.timings = TaskTimings()
+
+        self.handlers = OrderedDict()
+
+        self._io = ThreadPoolExecutor(max_workers=io_threads)
+        self._queue_sizes_supported = True
+        self._loop = None
+        self._wakeup = None
+        self._stopping = False
+
+    def register(self, task, domain=None):
+        exec_function, thread_count = task._worker_config()
+        self.register_function(task.name, exec_function, thread_count, task.max_in_flight, domain,
+                               task.batch_size)
+
+    def register_function(self, task_type, exec_function, thread_count=1, max_in_flight=None, domain=None,
+                          batch_size=None, update_delay=0.05):
+        # A task type is only served once, even if several workflow steps use it
+        if task_type not in self.handlers:
+            self.handlers[task_type] = _Handler(exec_function, thread_count, max_in_flight, domain,
+                                                batch_size, update_delay)
+
+    def start(self, wait=False):
+        print('Serving {} task types from one event loop: {}'.format(len(self.handlers),
+                                                                     ', '.join(self.handlers.keys())))
+        if wait:
+            self._run()
+        else:
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        # Stop polling; tasks already running are finished and updated first
+        self._stopping = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._wakeup = asyncio.Event()
+        self._loop = loop
+
+        loop.run_until_complete(self._serve())
+        loop.close()
+
+    def _call(self, fn, *args):
+        return self._loop.run_in_executor(self._io, fn, *args)
+
+    async def _serve(self):
+        backoff = PollBackoff(max_interval=self.polling_interval)
+
+        while not self._stopping:
+            self._wakeup.clear()
+            started = self._loop.time()
+
+            ready = [(t, h) for t, h in self.handlers.items() if h.free() > 0]
+            if not ready:
+                # Every task type is at capacity; a finished task or stop() wakes us
+                await self._wakeup.wait()
+                continue
+
+            sizes = await self._queue_sizes([t for t, h in ready])
+
+            polls = []
+            for task_type, handler in ready:
+                count = min(sizes.get(task_type, 0), handler.free())
+                if handler.batch_size:
+                    for i in range(0, count, handler.batch_size):
+                        polls.append(self._poll_batch(task_type, handler, min(handler.batch_size, count - i)))
+                else:
+                    for i in range(count):
+                        handler.in_flight += 1
+                        polls.append(self._poll(task_type, handler))
+
+            found = sum(await asyncio.gather(*polls)) if polls else 0
+            delay = backoff.delay(found > 0, self._loop.time() - started)
+            if delay:
+                # Nothing to do until the wait is over or a running task frees a slot
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+        while any(h.in_flight for h in self.handlers.values()):
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _queue_sizes(self, task_types):
+        if not task_types:
+            return {}
+
+        if self._queue_sizes_supported:
+            try:
+                sizes = await self._call(self.task_client.getTaskQueueSizes, task_types)
+                return {t: int(sizes.get(t) or 0) for t in task_types}
+            except Exception as err:
+                print('Queue sizes unavailable, polling every task type instead: ' + str(err))
+                self._queue_sizes_supported = False
+
+        return {t: 1 for t in task_types}
+
+    async def _poll(self, task_type, handler):
+        try:
+            task = await self._call(self.task_client.pollTask, task_type, self.worker_id, handler.domain)
+            self.metrics.record(task_type, [task] if task is not None else [])
+        except Exception as err:
+            print('Error while polling: ' + str(err))
+            self.metrics.record_error(task_type, err)
+            task = None
+
+        acked = False
+        if task is not None:
+            try:
+                acked = await self._call(self.task_client.ackTask, task['taskId'], self.worker_id)
+            except Exception as err:
+                print('Error acking task: ' + str(err))
+
+        if not acked:
+            handler.in_flight -= 1
+            return 0
+
+        asyncio.ensure_future(self._execute(task, handler))
+        return 1
+
+    async def _poll_batch(self, task_type, handler, count):
+        handler.in_flight += count
+
+        tasks = []
+        try:
+            polled = await self._call(self.task_client.pollTasks, task_type, count, BATCH_POLL_TIMEOUT,
+                                      self.worker_id, handler.domain)
+            self.metrics.record(task_type, polled)
+        except Exception as err:
+            print('Error while polling: ' + str(err))
+            self.metrics.record_error(task_type, err)
+            polled = []
+
+        try:
+            if polled:
+                acked = await self._call(self.task_client.ackTasks, [t['taskId'] for t in polled], self.worker_id)
+                tasks = [t for t in polled if acked.get(t['taskId'])]
+        except Exception as err:
+            print('Error acking tasks: ' + str(err))
+
+        handler.in_flight -= count - len(tasks)
+        for task in tasks:
+            asyncio.ensure_future(self._execute(task, handler))
+        return len(tasks)
+
+    async def _execute(self, task, handler):
+        try:
+            if handler.executor is None:
+                resp = await handler.exec_function(task)
+            else:
+                resp = await self._loop.run_in_executor(handler.executor, handler.exec_function, task)
+
+            task['status'] = resp['status']
+            task['outputData'] = resp['output']
+            task['logs'] = resp['logs']
+            self.timings.record_response(task, resp)
+        except Exception as err:
+            print('Error executing task: ' + str(err))
+            task['status'] = 'FAILED'
+            task['reasonForIncompletion'] = str(err)
+
+        if not handler.batch_size:
+            await self._update(handler, [(task, time.time())])
+            return
+
+        # Hold the result until the batch fills up or the first result in it has waited update_delay
+        handler.updates.append((task, time.time()))
+        if len(handler.updates) >= handler.batch_size:
+            self._flush(handler)
+        elif handler.flush_timer is None:
+            handler.flush_timer = self._loop.call_later(handler.update_delay, self._flush, handler)
+
+    def _flush(self, handler):
+        if handler.flush_timer is not None:
+            handler.flush_timer.cancel()
+            handler.flush_timer = None
+
+        updates, handler.updates = handler.updates, []
+        asyncio.ensure_future(self._update(handler, updates))
+
+    async def _update(self, handler, updates):
+        # updates is of (task, time its result was ready)
+        tasks = [task for task, finished in updates]
+        try:
+            if len(tasks) == 1:
+                await self._call(self.task_client.updateTask, tasks[0])
+            else:
+                await self._call(self.task_client.updateTasks, tasks)
+
+            now = time.time()
+            for task, finished in updates:
+                self.timings.record(task.get('taskType'), 'update', now - finished)
+        except Exception as err:
+            print('Error updating task: ' + str(err))
+        finally:
+            handler.in_flight -= len(tasks)
+            self._wakeup.set()
@@ -0,0 +1,169 @@
+from __future__ import print_function
+from task import Task
+from workflow import Workflow, sweep_cases
+
+# Reference names in the batch definition
+FAN_OUT = 'fan_out_cases'
+FORK = 'fork_cases'
+JOIN = 'join_cases'
+
+
+def case_reference(i):
+    return 'case_{}'.format(i)
+
+
+class CaseFanOut(Task):
+    # Turns a list of design cases into the tasks and inputs of a dynamic fork: one SUB_WORKFLOW task per case,
+    # running the given workflow with the defaults overridden by the case (see nc_kitchen_sink.execute4). One
+    # task type serves every batch workflow, since the workflow to run is an input.
+    cost = 0.0
+
+    def __init__(self, *args, **kwargs):
+        super(CaseFanOut, self).__init__(*args, **kwargs)
+
+        self.name = FAN_OUT
+        self.description = 'Dynamic fork of one sub workflow per design case'
+
+        self.add_input('workflow')
+        self.add_input('version', 1)
+        self.add_input('defaults', {})
+        self.add_input('cases', [])
+
+        self.add_output('dynamicTasks')
+        self.add_output('inputs')
+
+    def run(self, inputs, outputs):
+        dynamic_tasks = []
+        case_inputs = {}
+        for i, case in enumerate(inputs.get('cases') or []):
+            ref = case_reference(i)
+
+            dynamic_tasks.append({
+                'name': inputs['workflow'],
+                'taskReferenceName': ref,
+                'type': 'SUB_WORKFLOW',
+                'subWorkflowParam': {'name': inputs['workflow'], 'version': inputs.get('version') or 1},
+                # A failed case leaves a gap in the results instead of failing the whole study
+                'optional': True,
+            })
+
+            case_inputs[ref] = dict(inputs.get('defaults') or {})
+            case_inputs[ref].update(case)
+
+        outputs['dynamicTasks'] = dynamic_tasks
+        outputs['inputs'] = case_inputs
+
+
+class BatchWorkflow(Workflow):
+    # Runs a workflow once per design case in a single execution: a CaseFanOut task makes a SUB_WORKFLOW task
+    # per case, a FORK_JOIN_DYNAMIC runs them all in parallel and a JOIN collects their outputs. A study of N
+    # cases then costs one start and one status check instead of N of each (compare Workflow.sweep), and the
+    # server schedules the cases itself.
+    #
+    # run() returns one output dict per case, in case order, or None for a case that failed.
+
+    def __init__(self, workflow, name=None):
+        super(BatchWorkflow, self).__init__(name or workflow.name + ' batch',
+                                            'Design cases of ' + workflow.name)
+
+        self.workflow = workflow
+
+        self.add_task(FAN_OUT, CaseFanOut())
+        self.add_input('cases', [])
+        self.add_input('defaults', {})
+        self.outputs['results'] = '${{{}.output}}'.format(JOIN)
+
+    def _compile(self):
+        return {
+            'name': self.name,
+            'description': self.description,
+            'version': 1,
+            'tasks': [
+                {
+                    'name': FAN_OUT,
+                    'taskReferenceName': FAN_OUT,
+                    'type': 'SIMPLE',
+                    'inputParameters': {
+                        'workflow': self.workflow.name,
+                        'version': self.workflow._definition()['version'],
+                        'defaults': '${workflow.input.defaults}',
+                        'cases': '${workflow.input.cases}',
+                    },
+                },
+                {
+                    'name': FORK,
+                    'taskReferenceName': FORK,
+                    'type': 'FORK_JOIN_DYNAMIC',
+                    'dynamicForkTasksParam': 'dynamicTasks',
+                    'dynamicForkTasksInputParamName': 'dynamicTasksInput',
+                    'inputParameters': {
+                        'dynamicTasks': '${{{}.output.dynamicTasks}}'.format(FAN_OUT),
+                        'dynamicTasksInput': '${{{}.output.inputs}}'.format(FAN_OUT),
+                    },
+                },
+                {
+                    'name': JOIN,
+                    'taskReferenceName': JOIN,
+                    'type': 'JOIN',
+                },
+            ],
+            'outputParameters': self.outputs,
+            'inputParameters': ['cases', 'defaults'],
+            'failureWorkflow': 'cleanup_encode_resources',
+            'restartable': True,
+            'workflowStatusListenerEnabled': True,
+            'schemaVersion': 2,
+        }
+
+    def _all_tasks(self):
+        return list(self.tasks.values()) + self.workflow._all_tasks()
+
+    def register(self, endpoint='http://localhost:8080/api'):
+        # The case workflow has to exist before a definition that runs it; True if either one was sent
+        registered = self.workflow.register(endpoint)
+        return super(BatchWorkflow, self).register(endpoint) or registered
+
+    def run(self, cases, start_tasks=False, endpoint='http://localhost:8080/api'):
+        # Runs every case (see workflow.sweep_cases) on the server and waits for all of them
+        cases = list(sweep_cases(cases))
+        output = self.start(start_tasks=start_tasks, wait=True, endpoint=endpoint,
+                            inputs={'cases': cases, 'defaults': self.workflow.inputs})
+        return self.results(output, len(cases))
+
+    def results(self, output, count):
+        # Per case outputs, in case order, from the output of a finished batch execution
+        joined = output.get('results') or {}
+        keys = list(self.workflow.outputs.keys())
+
+        results = []
+        for i in range(count):
+            # A failed case's sub workflow task is joined too, with only the subWorkflowId in its output
+            case_output = joined.get(case_reference(i))
+            if case_output is None or keys and not any(k in case_output for k in keys):
+                results.append(None)
+            else:
+                # Drop what the server adds to a sub workflow task's output, like subWorkflowId
+                results.append({k: case_output.get(k) for k in keys})
+
+        return results
+
+    def run_local(self, cases, thread_count=None, processes=None):
+        # The same results as run(), without a server
+        return [self.workflow.run_local(case, thread_count, processes) for case in sweep_cases(cases)]
+
+
+if __name__ == '__main__':
+    from sum_task import SumTask
+    import json
+
+    workflow = Workflow('batch_sum')
+    workflow.add_input('x', 1.0)
+    workflow.add_input('y', 2.0)
+    workflow.add_task('total', SumTask('total', num_inputs=2))
+    workflow.connect('x', 'total.i0')
+    workflow.connect('y', 'total.i1')
+    workflow.add_output('total', 'total.sum')
+
+    batch = workflow.batch()
+    print(json.dumps(batch._definition(), indent=2))
+    print(batch.run_local({'x': [1.0, 2.0], 'y': [10.0, 20.0]}))
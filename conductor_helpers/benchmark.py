@@ -0,0 +1,337 @@
+from __future__ import print_function
+from async_runtime import AsyncRuntime
+from client import client_context
+from emulator import Emulator
+from sum_task import SumTask
+from worker import Worker
+from workflow import TERMINAL_STATUSES, Workflow
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+
+def generated_workflow(num_tasks, width=10, fan_in=2, seed=0):
+    # A layered workflow of num_tasks SumTasks, width tasks per layer. Each task sums fan_in outputs of random
+    # tasks in the layer before it; the first layer sums workflow inputs.
+    rng = random.Random(seed)
+
+    workflow = Workflow('generated_{}'.format(num_tasks))
+    for i in range(fan_in):
+        workflow.add_input('x{}'.format(i), 1.0)
+
+    previous = []
+    layer = []
+    for n in range(num_tasks):
+        name = 't{}'.format(n)
+        workflow.add_task(name, SumTask(name, num_inputs=fan_in))
+
+        for i in range(fan_in):
+            src = '{}.sum'.format(rng.choice(previous)) if previous else 'x{}'.format(i)
+            workflow.connect(src, '{}.i{}'.format(name, i))
+
+        layer.append(name)
+        if len(layer) == width:
+            previous, layer = layer, []
+
+    workflow.add_output('sum', 't{}.sum'.format(num_tasks - 1))
+    return workflow
+
+
+def time_compile(workflow, repeat=3):
+    # Best of repeat cold compiles, and one memoized call
+    cold = []
+    for i in range(repeat):
+        workflow._compiled = None
+        start = time.perf_counter()
+        workflow._definition()
+        cold.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    workflow._definition()
+    warm = time.perf_counter() - start
+
+    return min(cold), warm
+
+
+def compile_scaling(sizes=(250, 500, 1000, 2000, 4000, 8000)):
+    results = []
+    for num_tasks in sizes:
+        workflow = generated_workflow(num_tasks)
+        cold, warm = time_compile(workflow)
+        results.append({
+            'tasks': num_tasks,
+            'connections': len(workflow.connections),
+            'compile_s': cold,
+            'compile_us_per_task': cold / num_tasks * 1e6,
+            'cached_s': warm,
+        })
+
+    return results
+
+
+def registration_time(workflow, emulator):
+    # Registering the workflow and its task types on a fresh server, then again with nothing changed
+    timings = {}
+    for run in ['new', 'unchanged']:
+        requests = sum(emulator.requests.values())
+        start = time.perf_counter()
+        workflow.register_tasks(emulator.endpoint)
+        workflow.register(emulator.endpoint)
+        timings[run + '_s'] = time.perf_counter() - start
+        timings[run + '_requests'] = sum(emulator.requests.values()) - requests
+
+    return dict(timings, tasks=len(workflow.tasks))
+
+
+def task_latency(num_tasks=1000, thread_count=4, batch_size=None, batching=False):
+    # Poll-to-update latency of single tasks through a Worker: from the server handing a task out to it receiving
+    # the result, by the server's clock (in whole ms, as the server keeps it). With batching, the server has batch
+    # ack and update endpoints, which a stock server doesn't.
+    emulator = Emulator(batching=batching).start()
+    try:
+        task = SumTask('sum', num_inputs=2)
+        for i in range(num_tasks):
+            emulator.add_task(task.name, {'i0': float(i), 'i1': 1.0})
+
+        worker = Worker(emulator.endpoint, thread_count, polling_interval=0.01, batch_size=batch_size)
+        start = time.perf_counter()
+        worker.start(task_type=task.name, exec_function=task._run_task)
+        if not emulator.wait(num_tasks, timeout=60.0):
+            raise RuntimeError('Only {} of {} tasks completed'.format(len(emulator.completed), num_tasks))
+        elapsed = time.perf_counter() - start
+        worker.stop()
+
+        latency = [(t['updateTime'] - t['startTime']) / 1000.0 for t in emulator.completed.values()]
+        return {
+            'tasks': num_tasks,
+            'thread_count': thread_count,
+            'batch_size': batch_size,
+            'server_batching': batching,
+            'tasks_per_s': num_tasks / elapsed,
+            'requests': sum(emulator.requests.values()),
+            'latency_s': _summary(latency),
+            'timings': worker.timings.summary(task.name),
+        }
+    finally:
+        emulator.stop()
+
+
+def _serve(workflow, endpoint, thread_count=1):
+    # Workers for every task type of the workflow, polling often so that they don't dominate the timings
+    runtime = AsyncRuntime(endpoint, polling_interval=0.01)
+    for task in workflow._all_tasks():
+        runtime.register_function(task.name, task._run_task, thread_count=thread_count)
+    runtime.start()
+    return runtime
+
+
+def workflow_latency(workflow, repeat=20, interval=0.001):
+    # End-to-end time of one execution, from starting it to seeing it completed, one execution at a time. The
+    # emulator's own record of the execution is checked every interval seconds instead of waiting through
+    # Workflow.wait, whose backoff (10 ms growing to 1 s) would otherwise set the measured latency. The time
+    # between the emulator starting and finishing the execution, by its clock, is reported too.
+    emulator = Emulator().start()
+    try:
+        workflow.register(emulator.endpoint)
+        runtime = _serve(workflow, emulator.endpoint)
+
+        wc = client_context(emulator.endpoint).workflow_client
+        latency = []
+        server_latency = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            id = wc.startWorkflow(wfName=workflow.name, inputjson=workflow.inputs)
+            while emulator.workflows[id]['status'] not in TERMINAL_STATUSES:
+                time.sleep(interval)
+            latency.append(time.perf_counter() - start)
+
+            execution = emulator.workflows[id]
+            if execution['status'] != 'COMPLETED':
+                raise RuntimeError('Workflow {} {}'.format(id, execution['status']))
+            server_latency.append((execution['endTime'] - execution['startTime']) / 1000.0)
+
+        runtime.stop()
+        return {
+            'workflow': workflow.name,
+            'tasks': len(workflow.tasks),
+            'executions': repeat,
+            'requests': sum(emulator.requests.values()),
+            'latency_s': _summary(latency),
+            'server_latency_s': _summary(server_latency),
+        }
+    finally:
+        emulator.stop()
+
+
+def sweep_throughput(workflow, num_cases=200, worker_counts=(1, 2, 4, 8), max_in_flight=32):
+    # Executions per second of Workflow.sweep, with worker_count threads per task type
+    results = []
+    for worker_count in worker_counts:
+        emulator = Emulator().start()
+        try:
+            workflow.register(emulator.endpoint)
+            runtime = _serve(workflow, emulator.endpoint, worker_count)
+
+            start = time.perf_counter()
+            statuses = [status for case, status, output in workflow.sweep([{}] * num_cases, max_in_flight,
+                                                                            emulator.endpoint)]
+            elapsed = time.perf_counter() - start
+            runtime.stop()
+
+            results.append({
+                'workflow': workflow.name,
+                'worker_count': worker_count,
+                'cases': num_cases,
+                'completed': statuses.count('COMPLETED'),
+                'cases_per_s': num_cases / elapsed,
+                'requests': sum(emulator.requests.values()),
+            })
+        finally:
+            emulator.stop()
+
+    return results
+
+
+def _summary(seconds):
+    ordered = sorted(seconds)
+    if not ordered:
+        return {}
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        'mean': sum(ordered) / len(ordered),
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'max': ordered[-1],
+    }
+
+
+def hohmann_workflow():
+    # The example in workflow.py
+    from openmdao.examples.hohmann_transfer import VCircComp, TransferOrbitComp, DeltaVComp
+    from openmdao_wrapper import OpenMdaoWrapper
+
+    workflow = Workflow('hohmann_benchmark')
+    workflow.add_task('leo', OpenMdaoWrapper(VCircComp()))
+    workflow.add_task('geo', OpenMdaoWrapper(VCircComp()))
+    workflow.add_task('transfer', OpenMdaoWrapper(TransferOrbitComp()))
+    workflow.add_task('dv1', OpenMdaoWrapper(DeltaVComp()))
+    workflow.add_task('dv2', OpenMdaoWrapper(DeltaVComp()))
+    workflow.add_task('dv_total', SumTask('dv_total', num_inputs=2))
+    workflow.add_task('dinc_total', SumTask('dinc_total', num_inputs=2))
+
+    workflow.add_input('dinc1', 28.5 / 2)
+    workflow.add_input('dinc2', 28.5 / 2)
+    workflow.add_input('r1', 6778.137)
+    workflow.add_input('r2', 42164.0)
+    workflow.add_input('mu', 398600.4418)
+
+    for src, dst in [('r1', 'leo.r'), ('r1', 'transfer.rp'), ('r2', 'geo.r'), ('r2', 'transfer.ra'),
+                     ('mu', 'leo.mu'), ('mu', 'geo.mu'), ('mu', 'transfer.mu'),
+                     ('leo.vcirc', 'dv1.v1'), ('transfer.vp', 'dv1.v2'), ('dinc1', 'dv1.dinc'),
+                     ('transfer.va', 'dv2.v1'), ('geo.vcirc', 'dv2.v2'), ('dinc2', 'dv2.dinc'),
+                     ('dv1.delta_v', 'dv_total.i0'), ('dv2.delta_v', 'dv_total.i1'),
+                     ('dinc1', 'dinc_total.i0'), ('dinc2', 'dinc_total.i1')]:
+        workflow.connect(src, dst)
+
+    workflow.add_output('dv_total', 'dv_total.sum')
+    workflow.add_output('dinc_total', 'dinc_total.sum')
+    return workflow
+
+
+def vahana_workflow():
+    # The cruise and hover power graph of nc_dynamic_builder.py; vahana_scripts is next to conductor_helpers
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from vahana_scripts.cruise_power import CruisePower
+    from vahana_scripts.hover_power import HoverPower
+    from openmdao_wrapper import OpenMdaoWrapper
+
+    workflow = Workflow('vahana_benchmark')
+    workflow.add_task('cp', OpenMdaoWrapper(CruisePower()))
+    workflow.add_task('hp', OpenMdaoWrapper(HoverPower()))
+
+    workflow.add_input('Vehicle', 'tiltwing')
+    workflow.add_input('rProp', 1.4)
+    workflow.add_input('W', 2000.0)
+    workflow.add_input('V', 50.0)
+
+    for src, dst in [('Vehicle', 'cp.Vehicle'), ('rProp', 'cp.rProp'), ('W', 'cp.W'), ('V', 'cp.V'),
+                     ('Vehicle', 'hp.Vehicle'), ('rProp', 'hp.rProp'), ('W', 'hp.W'),
+                     ('cp.omega', 'hp.cruisePower_omega')]:
+        workflow.connect(src, dst)
+
+    for output in ['hoverPower_PBattery', 'hoverPower_PMax', 'hoverPower_VAutoRotation', 'hoverPower_Vtip',
+                   'TMax', 'hoverPower_PMaxBattery', 'QMax']:
+        workflow.add_output(output, 'hp.' + output)
+    return workflow
+
+
+def run_all(quick=False):
+    # Every benchmark, as one JSON-serializable dict; quick runs fewer and smaller cases. The emulated server runs
+    # in this process, so it competes with the workers for the interpreter: compare results between commits on
+    # the same machine rather than reading them as what a real server would sustain.
+    scale = 0.1 if quick else 1.0
+
+    def n(count):
+        return max(1, int(count * scale))
+
+    results = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'quick': quick,
+    }
+
+    results['compile'] = compile_scaling((250, 1000) if quick else (250, 500, 1000, 2000, 4000, 8000))
+
+    emulator = Emulator().start()
+    try:
+        results['registration'] = registration_time(generated_workflow(n(200)), emulator)
+    finally:
+        emulator.stop()
+
+    # Batches against a stock server (batch polls only) and against one with every batch endpoint
+    results['task_latency'] = [task_latency(n(2000), 4, batch_size, batching)
+                               for batch_size, batching in [(None, False), (25, False), (25, True)]]
+
+    results['workflow_latency'] = {}
+    for name, build in [('hohmann', hohmann_workflow), ('vahana', vahana_workflow)]:
+        try:
+            workflow = build()
+        except ImportError as err:
+            results['workflow_latency'][name] = {'error': str(err)}
+            continue
+        results['workflow_latency'][name] = workflow_latency(workflow, n(50))
+
+    results['sweep'] = sweep_throughput(generated_workflow(20, width=5), n(200))
+    return results
+
+
+def _commit():
+    # The commit benchmarked, if this is a git checkout
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode('utf-8').strip()
+    except Exception:
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark conductor_helpers against a local emulated server')
+    parser.add_argument('--output', help='write the results to this JSON file instead of printing them')
+    parser.add_argument('--quick', action='store_true', help='fewer and smaller runs')
+    args = parser.parse_args()
+
+    results = run_all(args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,236 @@
+from __future__ import print_function
+from conductor.conductor import MetadataClient, TaskClient, WorkflowClient
+from requests.adapters import HTTPAdapter
+import json
+import requests
+import threading
+
+
+def _unsupported(err):
+    # A server without a batch endpoint answers 404 (no such path) or 405 (path exists, but not for this method)
+    return isinstance(err, requests.HTTPError) and err.response is not None and \
+        err.response.status_code in (404, 405)
+
+
+class ClientContext(object):
+    # One pooled keep-alive HTTP session for a Conductor server, and the clients that share it.
+    #
+    # Everything that talks to the server (Task, Workflow, Worker, AsyncRuntime) takes an endpoint that can be
+    # either a URL, which gets the shared context for that server from client_context(), or a ClientContext
+    # built with its own pool size and timeouts. Either way every request for that server goes over up to
+    # pool_size reused connections instead of a new TCP connection each.
+
+    def __init__(self, endpoint='http://localhost:8080/api', pool_size=16, connect_timeout=5.0, read_timeout=60.0):
+        self.endpoint = endpoint
+        self.timeout = (connect_timeout, read_timeout)
+
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+
+        self.metadata_client = SessionMetadataClient(endpoint, self)
+        self.task_client = SessionTaskClient(endpoint, self)
+        self.workflow_client = SessionWorkflowClient(endpoint, self)
+
+    def stats(self):
+        # Requests sent and TCP connections opened so far; every request beyond the first on a connection reused it
+        pools = self._adapter.poolmanager.pools
+        requests_sent = 0
+        connections = 0
+        for key in pools.keys():
+            pool = pools[key]
+            requests_sent += pool.num_requests
+            connections += pool.num_connections
+
+        return {
+            'requests': requests_sent,
+            'connections': connections,
+            'reused': requests_sent - connections,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_contexts = {}
+_contexts_lock = threading.Lock()
+
+
+def client_context(endpoint='http://localhost:8080/api'):
+    # The shared ClientContext for a server URL, or endpoint itself if it already is a ClientContext
+    if isinstance(endpoint, ClientContext):
+        return endpoint
+
+    with _contexts_lock:
+        if endpoint not in _contexts:
+            _contexts[endpoint] = ClientContext(endpoint)
+        return _contexts[endpoint]
+
+
+class SessionMixin(object):
+    # The conductor clients call requests.get/post/... directly, which opens a new connection per request.
+    # This reimplements their HTTP helpers on the session of a ClientContext so connections are pooled and kept
+    # alive across calls and across every client of the same server.
+
+    def __init__(self, baseURL, context=None):
+        super(SessionMixin, self).__init__(baseURL)
+        self.context = context or client_context(baseURL)
+        self.session = self.context.session
+
+    def get(self, resPath, queryParams=None):
+        resp = self.session.get(self._url(resPath), params=queryParams, timeout=self.context.timeout)
+        self._check(resp)
+        if resp.content == b'':
+            return None
+        return resp.json()
+
+    def post(self, resPath, queryParams, body, headers=None):
+        headers = self._headers(headers)
+        data = json.dumps(body, ensure_ascii=False) if body is not None else None
+        resp = self.session.post(self._url(resPath), params=queryParams, data=data, headers=headers,
+                                 timeout=self.context.timeout)
+        self._check(resp)
+        return self._value(resp, headers)
+
+    def put(self, resPath, queryParams=None, body=None, headers=None):
+        headers = self._headers(headers)
+        data = json.dumps(body, ensure_ascii=False) if body is not None else None
+        resp = self.session.put(self._url(resPath), params=queryParams, data=data, headers=headers,
+                                timeout=self.context.timeout)
+        self._check(resp)
+        return self._value(resp, headers)
+
+    def delete(self, resPath, queryParams):
+        resp = self.session.delete(self._url(resPath), params=queryParams, timeout=self.context.timeout)
+        self._check(resp)
+
+    def _url(self, resPath):
+        return '{}/{}'.format(self.baseURL, resPath)
+
+    def _headers(self, headers):
+        merged = dict(self.headers)
+        if headers is not None:
+            merged.update(headers)
+        return merged
+
+    def _check(self, resp):
+        try:
+            resp.raise_for_status()
+        except requests.HTTPError:
+            print('ERROR: ' + resp.text)
+            raise
+
+    def _value(self, resp, headers):
+        if not resp.text:
+            return ''
+        if headers['Accept'] == 'application/json':
+            return resp.json()
+        return resp.text
+
+
+class SessionMetadataClient(SessionMixin, MetadataClient):
+    pass
+
+
+class SessionTaskClient(SessionMixin, TaskClient):
+    # Adds batched poll, ack and update. Each one tries the server's batch endpoint first; if the server doesn't
+    # have it, the client falls back for good to one call per task, so callers never need to know which they got.
+    #
+    # TaskClient's polls print errors and answer None, the same as an empty queue. pollTask and pollTasks raise
+    # them instead, so that a server that is down or failing shows up as errors rather than as an idle queue.
+
+    def __init__(self, baseURL, context=None):
+        super(SessionTaskClient, self).__init__(baseURL, context)
+        self.batch_poll_supported = True
+        self.batch_ack_supported = True
+        self.batch_update_supported = True
+
+        # The error of each thread's last GET, which TaskClient.pollForTask and pollForBatch print and swallow
+        self._failed = threading.local()
+
+    def pollTask(self, taskType, workerid, domain=None):
+        # pollForTask, raising errors instead of answering None for them
+        self._failed.error = None
+        task = self.pollForTask(taskType, workerid, domain)
+        if task is None and self._failed.error is not None:
+            raise self._failed.error
+        return task
+
+    def pollTasks(self, taskType, count, timeout, workerid, domain=None):
+        if self.batch_poll_supported:
+            self._failed.error = None
+            tasks = self.pollForBatch(taskType, count, timeout, workerid, domain)
+            if tasks is not None:
+                return tasks
+
+            err = self._failed.error
+            if err is None:
+                # An empty answer
+                return []
+            if not _unsupported(err):
+                raise err
+            print('Batch poll not supported by the server, polling one task at a time')
+            self.batch_poll_supported = False
+
+        tasks = []
+        while len(tasks) < count:
+            try:
+                task = self.pollTask(taskType, workerid, domain)
+            except Exception:
+                # Tasks already polled are handed out, or they would wait for their response timeout
+                if tasks:
+                    break
+                raise
+            if task is None:
+                break
+            tasks.append(task)
+        return tasks
+
+    def ackTasks(self, taskIds, workerid):
+        # Returns {taskId: acked}
+        if self.batch_ack_supported:
+            try:
+                return self.post(self.makeUrl('ack/batch'), {'workerid': workerid}, taskIds)
+            except requests.HTTPError as err:
+                if not _unsupported(err):
+                    raise
+                print('Batch ack not supported by the server, acking one task at a time')
+                self.batch_ack_supported = False
+
+        acked = {}
+        for taskId in taskIds:
+            try:
+                acked[taskId] = self.ackTask(taskId, workerid)
+            except Exception as err:
+                print('Error acking task: ' + str(err))
+                acked[taskId] = False
+        return acked
+
+    def updateTasks(self, taskObjs):
+        if self.batch_update_supported:
+            try:
+                self.post(self.makeUrl('update/batch'), None, taskObjs)
+                return
+            except requests.HTTPError as err:
+                if not _unsupported(err):
+                    raise
+                print('Batch update not supported by the server, updating one task at a time')
+                self.batch_update_supported = False
+
+        for taskObj in taskObjs:
+            try:
+                self.updateTask(taskObj)
+            except Exception as err:
+                print('Error updating task: ' + str(err))
+
+    def get(self, resPath, queryParams=None):
+        try:
+            return super(SessionTaskClient, self).get(resPath, queryParams)
+        except Exception as err:
+            self._failed.error = err
+            raise
+
+
+class SessionWorkflowClient(SessionMixin, WorkflowClient):
+    pass
@@ -0,0 +1,655 @@
+from __future__ import print_function
+from collections import Counter, OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Set on the per-server subclass built by Emulator
+    emulator = None
+
+    # Keep connections alive between requests, as the real server does. Headers and body are written separately,
+    # so Nagle's algorithm would hold back each response on a kept-alive connection.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    routes = [
+        ('GET', r'^tasks/poll/batch/([^/]+)$', 'poll_batch'),
+        ('GET', r'^tasks/poll/([^/]+)$', 'poll'),
+        ('POST', r'^tasks/ack/batch$', 'ack_batch'),
+        ('POST', r'^tasks/update/batch$', 'update_batch'),
+        ('POST', r'^tasks/queue/sizes$', 'queue_sizes'),
+        ('POST', r'^tasks/([^/]+)/ack$', 'ack'),
+        ('POST', r'^tasks/?$', 'update'),
+        ('GET', r'^metadata/taskdefs$', 'get_task_defs'),
+        ('POST', r'^metadata/taskdefs$', 'register_task_defs'),
+        ('GET', r'^metadata/workflow/([^/]+)$', 'get_workflow_def'),
+        ('PUT', r'^metadata/workflow$', 'update_workflow_defs'),
+        ('DELETE', r'^metadata/taskdefs/([^/]+)$', 'unregister_task_def'),
+        ('GET', r'^metadata/workflow$', 'get_workflow_defs'),
+        ('POST', r'^workflow/([^/]+)$', 'start_workflow'),
+        ('GET', r'^workflow/([^/]+)$', 'get_workflow'),
+        ('DELETE', r'^workflow/([^/]+)$', 'terminate_workflow'),
+    ]
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        path = unquote(url.path)
+        path = path[len('/api/'):] if path.startswith('/api/') else path.lstrip('/')
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length).decode('utf-8')) if length else None
+
+        for route_method, pattern, name in self.routes:
+            match = re.match(pattern, path)
+            if route_method == method and match:
+                break
+        else:
+            return self._send(404, 'Not found: {} {}'.format(method, path))
+
+        if name == 'poll_batch' and not self.emulator.batch_poll or \
+                name in ('ack_batch', 'update_batch') and not self.emulator.batching:
+            return self._send(404, 'Not found: {} {}'.format(method, path))
+
+        self.emulator.requests[name] += 1
+
+        delay = _setting(self.emulator.latency, name)
+        if delay:
+            time.sleep(delay)
+
+        error_rate = _setting(self.emulator.error_rate, name)
+        if error_rate and self.emulator._random.random() < error_rate:
+            self.emulator.errors[name] += 1
+            return self._send(500, 'Injected failure: {} {}'.format(method, path))
+
+        try:
+            result = getattr(self.emulator, '_' + name)(query, body, *match.groups())
+        except KeyError as err:
+            return self._send(404, 'Not found: {}'.format(err))
+
+        self._send(200, result)
+
+    def _send(self, status, result):
+        if result is None and status == 200:
+            self.send_response(204)
+            self.end_headers()
+            return
+
+        if isinstance(result, str):
+            data, content_type = result.encode('utf-8'), 'text/plain'
+        else:
+            data, content_type = json.dumps(result).encode('utf-8'), 'application/json'
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class Emulator(object):
+    # A small in-process stand-in for the task, metadata and workflow endpoints of a Conductor server, for
+    # exercising workers without running the real server. Tasks are queued with add_task() and served to pollers in
+    # order; every request is counted by endpoint in requests, and finished tasks are collected in completed.
+    # Registered definitions are kept in task_defs and workflow_defs, with some of the defaults the server fills in
+    # added.
+    #
+    # Started workflows are kept in workflows and run like the server runs them: SIMPLE tasks are queued for
+    # workers, FORK_JOIN starts its branches in parallel, FORK_JOIN_DYNAMIC does the same for the tasks and inputs
+    # a task before it produced, SUB_WORKFLOW runs another registered workflow and JOIN waits for the tasks it
+    # joins on (by default, those of the dynamic fork before it). Every task update moves its workflow on. There
+    # are no retries: a failed task that isn't optional fails its workflow.
+    #
+    # For load and failure testing, every request can be slowed down by latency seconds, and a random error_rate
+    # fraction of them answered with a 500 instead (counted in errors). Either can be a dict by endpoint name
+    # (the names in requests) to target some endpoints only. With response_timeout set, a task a worker polled but
+    # didn't update within that many seconds is queued again, as the server does with responseTimeoutSeconds,
+    # so a workflow survives a lost ack or update.
+    #
+    # By default the endpoints are those of a stock server: tasks can be polled in batches, but are acked and
+    # updated one at a time. batching=True adds batch ack and update endpoints, which the stock server doesn't
+    # have, and batch_poll=False takes away the batch poll, like an older server; either answers 404 when it isn't
+    # served. A batch poll of an empty queue is held open for up to its timeout until a task arrives
+    # (long-polling); a single-task poll returns straight away.
+
+    def __init__(self, port=0, batching=False, latency=0.0, error_rate=0.0, response_timeout=None, seed=None,
+                 batch_poll=True):
+        self.batching = batching
+        self.batch_poll = batch_poll
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.response_timeout = response_timeout
+        self._random = random.Random(seed)
+
+        self.requests = Counter()
+        self.errors = Counter()
+        self.tasks = OrderedDict()
+        self.completed = OrderedDict()
+
+        self.task_defs = OrderedDict()
+        self.workflow_defs = {}
+        self.workflows = OrderedDict()
+
+        self._queues = {}
+        # (deadline, task id, start time) of polled tasks, oldest first, when response_timeout is set
+        self._in_progress = deque()
+        self._lock = threading.Lock()
+        self._queued = threading.Condition(self._lock)
+
+        handler = type('Handler', (_Handler,), {'emulator': self})
+        self._server = ThreadingHTTPServer(('localhost', port), handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        return 'http://localhost:{}/api'.format(self._server.server_address[1])
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_task(self, task_type, input_data):
+        task = {
+            'taskId': str(uuid.uuid4()),
+            'taskType': task_type,
+            'status': 'SCHEDULED',
+            'inputData': input_data,
+            'scheduledTime': int(time.time() * 1000),
+        }
+
+        with self._lock:
+            self._queue(task)
+
+        return task['taskId']
+
+    def _queue(self, task):
+        # With the lock held
+        self.tasks[task['taskId']] = task
+        self._queues.setdefault(task['taskType'], deque()).append(task['taskId'])
+        self._queued.notify_all()
+
+    def wait(self, count, timeout=10.0):
+        # Block until count tasks have completed (or failed); True if they did within timeout
+        end = time.time() + timeout
+        while len(self.completed) < count:
+            if time.time() > end:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _poll(self, query, body, task_type):
+        tasks = self._poll_batch(dict(query, count=1, timeout=0), body, task_type)
+        return tasks[0] if tasks else None
+
+    def _poll_batch(self, query, body, task_type):
+        count = int(query.get('count', 1))
+        end = time.time() + int(query.get('timeout', 0)) / 1000.0
+
+        tasks = []
+        with self._lock:
+            self._requeue_timed_out()
+
+            pending = self._queues.setdefault(task_type, deque())
+            while not pending and time.time() < end:
+                self._queued.wait(end - time.time())
+
+            while pending and len(tasks) < count:
+                task = self.tasks[pending.popleft()]
+                if task['status'] != 'SCHEDULED':
+                    # Canceled along with its workflow
+                    continue
+                task['status'] = 'IN_PROGRESS'
+                task['workerId'] = query.get('workerid')
+                task['startTime'] = int(time.time() * 1000)
+                tasks.append(dict(task))
+
+                if self.response_timeout is not None:
+                    self._in_progress.append((time.time() + self.response_timeout, task['taskId'], task['startTime']))
+
+        return tasks
+
+    def _requeue_timed_out(self):
+        # With the lock held
+        now = time.time()
+        while self._in_progress and self._in_progress[0][0] < now:
+            deadline, task_id, start_time = self._in_progress.popleft()
+
+            task = self.tasks[task_id]
+            if task['status'] == 'IN_PROGRESS' and task['startTime'] == start_time:
+                task['status'] = 'SCHEDULED'
+                task['retried'] = task.get('retried', 0) + 1
+                self._queues[task['taskType']].append(task_id)
+
+    def _ack(self, query, body, task_id):
+        return 'true' if self._acked(task_id, query.get('workerid')) else 'false'
+
+    def _ack_batch(self, query, body):
+        return {task_id: self._acked(task_id, query.get('workerid')) for task_id in body}
+
+    def _acked(self, task_id, worker_id):
+        with self._lock:
+            task = self.tasks.get(task_id)
+            return task is not None and task['status'] == 'IN_PROGRESS' and task.get('workerId') == worker_id
+
+    def _update(self, query, body):
+        with self._lock:
+            task = self.tasks[body['taskId']]
+            task.update(body)
+            task['updateTime'] = int(time.time() * 1000)
+            if task['status'] in ('COMPLETED', 'FAILED'):
+                self.completed[task['taskId']] = task
+
+                workflow = self.workflows.get(task.get('workflowInstanceId'))
+                if workflow is not None:
+                    self._decide(workflow)
+
+        return body['taskId']
+
+    def _update_batch(self, query, body):
+        return [self._update(query, task) for task in body]
+
+    def _queue_sizes(self, query, body):
+        with self._lock:
+            self._requeue_timed_out()
+            return {task_type: len(self._queues.get(task_type, ())) for task_type in body}
+
+    def _get_task_defs(self, query, body):
+        with self._lock:
+            return list(self.task_defs.values())
+
+    def _register_task_defs(self, query, body):
+        with self._lock:
+            for task_def in body:
+                stored = dict(_TASK_DEF_DEFAULTS, createTime=int(time.time() * 1000))
+                stored.update(task_def)
+                self.task_defs[task_def['name']] = stored
+
+    def _get_workflow_def(self, query, body, name):
+        version = int(query.get('version', 1))
+        with self._lock:
+            return self.workflow_defs[(name, version)]
+
+    def _unregister_task_def(self, query, body, name):
+        with self._lock:
+            del self.task_defs[name]
+
+    def _get_workflow_defs(self, query, body):
+        with self._lock:
+            return list(self.workflow_defs.values())
+
+    def _update_workflow_defs(self, query, body):
+        with self._lock:
+            for workflow_def in body:
+                stored = dict(workflow_def, createTime=int(time.time() * 1000))
+                stored['tasks'] = _with_task_defaults(workflow_def['tasks'])
+                self.workflow_defs[(workflow_def['name'], workflow_def.get('version', 1))] = stored
+
+    def _start_workflow(self, query, body, name):
+        with self._lock:
+            workflow = self._create_workflow(name, int(query.get('version') or 1), body or {},
+                                             query.get('correlationId'))
+        return workflow['workflowId']
+
+    def _create_workflow(self, name, version, input, correlation_id=None, parent=None):
+        # With the lock held. parent is the SUB_WORKFLOW task that runs this one, if any.
+        workflow_def = self.workflow_defs[(name, version)]
+
+        workflow = {
+            'workflowId': str(uuid.uuid4()),
+            'workflowType': name,
+            'version': version,
+            'correlationId': correlation_id,
+            'status': 'RUNNING',
+            'input': input,
+            'output': {},
+            'tasks': [],
+            'startTime': int(time.time() * 1000),
+        }
+        if parent is not None:
+            workflow['parentWorkflowId'] = parent['workflowInstanceId']
+
+        # Tasks of this execution by reference name, and the task lists of its dynamic forks by fork
+        workflow['_refs'] = {}
+        workflow['_dynamic'] = {}
+        workflow['_def'] = workflow_def
+        workflow['_parent'] = parent
+
+        self.workflows[workflow['workflowId']] = workflow
+        self._decide(workflow)
+        return workflow
+
+    def _terminate_workflow(self, query, body, workflow_id):
+        with self._lock:
+            workflow = self.workflows[workflow_id]
+            if workflow['status'] == 'RUNNING':
+                workflow['reasonForIncompletion'] = query.get('reason')
+                self._finish(workflow, 'TERMINATED')
+
+    def _get_workflow(self, query, body, workflow_id):
+        include_tasks = query.get('includeTasks', 'true').lower() != 'false'
+
+        with self._lock:
+            workflow = self.workflows[workflow_id]
+            result = {k: v for k, v in workflow.items() if not k.startswith('_')}
+            if include_tasks:
+                result['tasks'] = [dict(task) for task in workflow['tasks']]
+            else:
+                del result['tasks']
+
+        return result
+
+    def _decide(self, workflow):
+        # With the lock held: schedule whatever can run now, and finish the workflow if nothing is left
+        if workflow['status'] != 'RUNNING':
+            return
+
+        state = self._run_sequence(workflow, workflow['_def']['tasks'])
+        if state == 'RUNNING' or workflow['status'] != 'RUNNING':
+            # Still going, or finished already by a sub workflow that completed on the way
+            return
+
+        if state == 'COMPLETED':
+            workflow['output'] = _resolve(workflow['_def'].get('outputParameters') or {}, workflow)
+        self._finish(workflow, state)
+
+    def _finish(self, workflow, status):
+        # With the lock held
+        workflow['status'] = status
+        workflow['endTime'] = int(time.time() * 1000)
+
+        if status != 'COMPLETED':
+            # Nothing else of this workflow runs once it has failed, including its sub workflows
+            for task in workflow['tasks']:
+                if task['status'] in ('SCHEDULED', 'IN_PROGRESS'):
+                    task['status'] = 'CANCELED'
+                    child = self.workflows.get(task.get('outputData', {}).get('subWorkflowId'))
+                    if child is not None and child['status'] == 'RUNNING':
+                        self._finish(child, 'TERMINATED')
+
+        # A sub workflow's result is the result of the task that ran it
+        parent = workflow['_parent']
+        if parent is not None and parent['status'] == 'IN_PROGRESS':
+            parent['status'] = 'COMPLETED' if status == 'COMPLETED' else 'FAILED'
+            parent['outputData'] = dict(workflow['output'], subWorkflowId=workflow['workflowId'])
+            if status != 'COMPLETED':
+                parent['reasonForIncompletion'] = 'Sub workflow {} {}'.format(workflow['workflowId'], status)
+            self._decide(self.workflows[parent['workflowInstanceId']])
+
+    def _run_sequence(self, workflow, task_defs):
+        # The state of a list of tasks run one after another: RUNNING, COMPLETED or FAILED. Tasks that can start
+        # are scheduled on the way.
+        previous = None
+        for task_def in task_defs:
+            if task_def['type'] == 'JOIN' and not task_def.get('joinOn') and previous in workflow['_dynamic']:
+                # A JOIN after a dynamic fork joins on whatever the fork started
+                forked = workflow['_dynamic'][previous]
+                task_def = dict(task_def, joinOn=[branch[-1]['taskReferenceName'] for branch in forked])
+
+            state = getattr(self, '_run_' + task_def['type'].lower())(workflow, task_def)
+            if state != 'COMPLETED':
+                return state
+            previous = task_def['taskReferenceName']
+        return 'COMPLETED'
+
+    def _run_simple(self, workflow, task_def):
+        task = workflow['_refs'].get(task_def['taskReferenceName'])
+        if task is None:
+            task = self._add_workflow_task(workflow, task_def, 'SCHEDULED')
+            self._queue(task)
+
+        return self._task_state(workflow, task_def, task)
+
+    def _run_sub_workflow(self, workflow, task_def):
+        task = workflow['_refs'].get(task_def['taskReferenceName'])
+        if task is None:
+            task = self._add_workflow_task(workflow, task_def, 'IN_PROGRESS')
+
+            param = task_def['subWorkflowParam']
+            try:
+                child = self._create_workflow(param['name'], int(param.get('version') or 1), task['inputData'],
+                                              workflow.get('correlationId'), task)
+                if task['status'] == 'IN_PROGRESS':
+                    task['outputData'] = {'subWorkflowId': child['workflowId']}
+            except KeyError:
+                task['status'] = 'FAILED'
+                task['reasonForIncompletion'] = 'No workflow definition {} version {}'.format(
+                    param['name'], param.get('version') or 1)
+
+        return self._task_state(workflow, task_def, task)
+
+    def _task_state(self, workflow, task_def, task):
+        # A task's part in its workflow's state
+        if task['status'] == 'FAILED' and task_def.get('optional'):
+            return 'COMPLETED'
+        if task['status'] == 'FAILED':
+            workflow['reasonForIncompletion'] = 'Task {} failed: {}'.format(
+                task['referenceTaskName'], task.get('reasonForIncompletion'))
+            return 'FAILED'
+        return 'COMPLETED' if task['status'] == 'COMPLETED' else 'RUNNING'
+
+    def _run_fork_join(self, workflow, task_def):
+        if task_def['taskReferenceName'] not in workflow['_refs']:
+            self._add_workflow_task(workflow, task_def, 'COMPLETED')
+
+        # Branches run independently; the JOIN after the fork waits for them
+        states = [self._run_sequence(workflow, branch) for branch in task_def['forkTasks']]
+        return 'FAILED' if 'FAILED' in states else 'COMPLETED'
+
+    def _run_fork_join_dynamic(self, workflow, task_def):
+        ref = task_def['taskReferenceName']
+        if ref not in workflow['_refs']:
+            fork = self._add_workflow_task(workflow, task_def, 'COMPLETED')
+
+            tasks = fork['inputData'].get(task_def['dynamicForkTasksParam']) or []
+            inputs = fork['inputData'].get(task_def['dynamicForkTasksInputParamName']) or {}
+
+            # Each forked task gets its input as given, without looking for expressions in it
+            workflow['_dynamic'][ref] = [[dict(t, _inputData=inputs.get(t['taskReferenceName']) or {})]
+                                         for t in tasks]
+
+        states = [self._run_sequence(workflow, branch) for branch in workflow['_dynamic'][ref]]
+        return 'FAILED' if 'FAILED' in states else 'COMPLETED'
+
+    def _run_join(self, workflow, task_def):
+        task = workflow['_refs'].get(task_def['taskReferenceName'])
+        if task is None:
+            task = self._add_workflow_task(workflow, task_def, 'IN_PROGRESS')
+
+        joined = [workflow['_refs'].get(ref) for ref in task_def.get('joinOn') or []]
+        if any(t is None or t['status'] not in _TERMINAL for t in joined):
+            return 'RUNNING'
+
+        task['status'] = 'COMPLETED'
+        task['outputData'] = {t['referenceTaskName']: t.get('outputData') or {} for t in joined}
+        return 'COMPLETED'
+
+    def _add_workflow_task(self, workflow, task_def, status):
+        task = {
+            'taskId': str(uuid.uuid4()),
+            'taskType': task_def['name'] if task_def['type'] == 'SIMPLE' else task_def['type'],
+            'referenceTaskName': task_def['taskReferenceName'],
+            'workflowInstanceId': workflow['workflowId'],
+            'workflowType': workflow['workflowType'],
+            'status': status,
+            'inputData': task_def['_inputData'] if '_inputData' in task_def else
+            _resolve(task_def.get('inputParameters') or {}, workflow),
+            'outputData': {},
+            'scheduledTime': int(time.time() * 1000),
+        }
+
+        workflow['tasks'].append(task)
+        workflow['_refs'][task['referenceTaskName']] = task
+        return task
+
+
+_TERMINAL = ('COMPLETED', 'FAILED', 'CANCELED')
+
+
+def _setting(value, name):
+    # An injection setting for the endpoint name: the same for every endpoint, or by endpoint from a dict
+    if isinstance(value, dict):
+        return value.get(name)
+    return value
+
+# ${workflow.input.x}, ${task.output.x}, or a whole ${task.output}
+_EXPRESSION = re.compile(r'^\$\{([^.}]+)\.(input|output)(?:\.([^}]+))?\}$')
+
+
+def _resolve(value, workflow):
+    # A task's or workflow's parameters with every expression in them replaced by the value it refers to
+    if isinstance(value, dict):
+        return {k: _resolve(v, workflow) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve(v, workflow) for v in value]
+
+    match = _EXPRESSION.match(value) if isinstance(value, str) else None
+    if match is None:
+        return value
+
+    source, kind, key = match.groups()
+    if source == 'workflow':
+        values = workflow['input'] if kind == 'input' else workflow['output']
+    else:
+        task = workflow['_refs'].get(source) or {}
+        values = task.get('inputData' if kind == 'input' else 'outputData') or {}
+
+    return values if key is None else values.get(key)
+
+
+_TASK_DEF_DEFAULTS = {
+    'retryCount': 3,
+    'retryLogic': 'FIXED',
+    'retryDelaySeconds': 60,
+    'timeoutPolicy': 'TIME_OUT_WF',
+    'responseTimeoutSeconds': 3600,
+    'inputTemplate': {},
+}
+
+
+def _with_task_defaults(tasks):
+    stored = []
+    for task in tasks:
+        task = dict({'startDelay': 0, 'optional': False}, **task)
+        if 'forkTasks' in task:
+            task['forkTasks'] = [_with_task_defaults(branch) for branch in task['forkTasks']]
+        stored.append(task)
+    return stored
+
+
+def _self_check():
+    # The same tasks through a batching worker, with and without server support for batch ack and update
+    from async_runtime import AsyncRuntime
+    from sum_task import SumTask
+    from worker import Worker
+    from workflow import Workflow
+
+    for batching in [True, False]:
+        emulator = Emulator(batching=batching).start()
+
+        t = SumTask('sum', num_inputs=2)
+        for i in range(200):
+            emulator.add_task(t.name, {'i0': float(i), 'i1': 1.0})
+
+        w = Worker(emulator.endpoint, thread_count=4, polling_interval=0.01, batch_size=25)
+        w.start(task_type=t.name, exec_function=t._run_task)
+
+        assert emulator.wait(200), 'Only {} of 200 tasks completed'.format(len(emulator.completed))
+        for task in emulator.completed.values():
+            assert task['status'] == 'COMPLETED'
+            assert task['outputData']['sum'] == task['inputData']['i0'] + task['inputData']['i1']
+
+        print('batching={}: {} requests {}'.format(batching, sum(emulator.requests.values()),
+                                                   dict(emulator.requests)))
+        w.stop()
+        emulator.stop()
+
+    # A batch of workflows (dynamic fork of sub workflows, each with a FORK_JOIN) through slow, unreliable
+    # endpoints, against the same cases run locally
+    workflow = Workflow('emulator_check')
+    workflow.add_input('x', 1.0)
+    workflow.add_input('y', 2.0)
+    for name in ['a', 'b', 'total']:
+        workflow.add_task(name, SumTask(name, num_inputs=2))
+    workflow.connect('x', 'a.i0')
+    workflow.connect('y', 'a.i1')
+    workflow.connect('x', 'b.i0')
+    workflow.connect('x', 'b.i1')
+    workflow.connect('a.sum', 'total.i0')
+    workflow.connect('b.sum', 'total.i1')
+    workflow.add_output('total', 'total.sum')
+
+    batch = workflow.batch()
+    cases = {'x': [1.0, 2.0, 3.0], 'y': [10.0, 20.0]}
+
+    emulator = Emulator(latency=0.001, error_rate={'update': 0.1, 'ack': 0.1}, response_timeout=0.5,
+                        seed=0).start()
+    batch.register(emulator.endpoint)
+
+    runtime = AsyncRuntime(emulator.endpoint, polling_interval=0.01)
+    for task in batch._all_tasks():
+        runtime.register(task)
+    runtime.start()
+
+    results = batch.run(cases, endpoint=emulator.endpoint)
+    runtime.stop()
+    emulator.stop()
+
+    assert results == batch.run_local(cases), results
+    print('batch of {} cases: {} requests, {} injected errors'.format(len(results), sum(emulator.requests.values()),
+                                                                     sum(emulator.errors.values())))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='A stand-in Conductor server. Without --serve, checks itself.')
+    parser.add_argument('--serve', action='store_true', help='serve until interrupted')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 500')
+    parser.add_argument('--response-timeout', type=float, help='seconds before an unanswered task is queued again')
+    parser.add_argument('--batching', action='store_true', help='serve batch ack and update, unlike a stock server')
+    parser.add_argument('--no-batch-poll', action='store_true', help='answer 404 to batch polls, like an old server')
+    args = parser.parse_args()
+
+    if args.serve:
+        emulator = Emulator(args.port, args.batching, args.latency, args.error_rate, args.response_timeout,
+                            batch_poll=not args.no_batch_poll)
+        print('Serving at ' + emulator.endpoint)
+        emulator.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            emulator.stop()
+    else:
+        _self_check()
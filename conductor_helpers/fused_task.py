@@ -0,0 +1,62 @@
+from task import Task
+
+
+def port(member, name):
+    # The composite's name for a member's input or output
+    return '{}__{}'.format(member, name)
+
+
+class FusedTask(Task):
+    # Several connected cheap tasks run as one, so they cost one schedule/poll/update cycle on the server
+    # instead of one each (see Workflow.fused).
+    #
+    # members maps each member's name in the workflow to its Task, in an order where every member comes after
+    # the members it takes inputs from. links maps each connected member input, as (member, input), to its
+    # source: (member, output) inside the composite, or None if it comes from outside, in which case it is an
+    # input of the composite. Every member output is an output of the composite. Both are named member__port.
+
+    def __init__(self, name, members, links, *args, **kwargs):
+        super(FusedTask, self).__init__(*args, **kwargs)
+
+        self.name = name
+        self.description = 'fused ' + ', '.join(members.keys())
+
+        self.members = members
+
+        # Part of the result cache key, so a change to any member invalidates the composite's results (and of the
+        # surrogate's model keys, so a tuple)
+        self.version = tuple(task.version for task in members.values())
+
+        # Large outputs of members that offload them are offloaded by the composite too
+        stores = [task.payload_store for task in members.values() if task.payload_store is not None]
+        if stores:
+            self.payload_store = stores[0]
+
+        self._links = {member: [] for member in members.keys()}
+        for (member, k), src in sorted(links.items()):
+            self._links[member].append((k, src))
+            if src is None:
+                self.add_input(port(member, k), members[member].inputs.get(k))
+
+        for member, task in members.items():
+            for k in task.outputs.keys():
+                self.add_output(port(member, k))
+
+    def run(self, inputs, outputs):
+        values = {}
+        for member, task in self.members.items():
+            # Member input templates are applied here, since the composite registers none of its own
+            member_inputs = dict(task.inputs) if task.use_defaults else {}
+
+            for k, src in self._links[member]:
+                if src is not None:
+                    member_inputs[k] = values[src[0]].get(src[1])
+                elif port(member, k) in inputs:
+                    member_inputs[k] = inputs[port(member, k)]
+
+            member_outputs = {k: None for k in task.outputs.keys()}
+            task.run(member_inputs, member_outputs)
+            values[member] = member_outputs
+
+            for k, v in member_outputs.items():
+                outputs[port(member, k)] = v
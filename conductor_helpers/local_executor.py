@@ -0,0 +1,118 @@
+from __future__ import print_function
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import networkx as nx
+import re
+
+# ${workflow.input.x} or ${task.output.x}
+_EXPRESSION = re.compile(r'^\$\{([^.}]+)\.(input|output)\.([^}]+)\}$')
+
+
+def resolve(expression, workflow_inputs, task_outputs):
+    # The value a workflow or task parameter expression refers to; like the server, a missing value is None
+    match = _EXPRESSION.match(expression)
+    if match is None:
+        return expression
+
+    source, kind, key = match.groups()
+    if source == 'workflow':
+        return workflow_inputs.get(key)
+    return task_outputs.get(source, {}).get(key)
+
+
+class LocalExecutor(object):
+    # Runs a Workflow in this process, without a Conductor server.
+    #
+    # Each task starts as soon as every task it takes inputs from has finished, on a pool of thread_count
+    # threads or, if processes is set, of that many worker processes (the tasks must then be picklable). Tasks
+    # run through Task._run_task, as they do under a worker, so result caches apply. run() returns the
+    # workflow's outputs, the same dict Workflow.start(wait=True) gets back from the server.
+
+    def __init__(self, workflow, thread_count=None, processes=None):
+        self.workflow = workflow
+        self.thread_count = thread_count
+        self.processes = processes
+
+    def run(self, inputs=None):
+        workflow = self.workflow
+
+        workflow_inputs = dict(workflow.inputs)
+        if inputs:
+            workflow_inputs.update(inputs)
+
+        graph = workflow._graph()
+        if not nx.is_directed_acyclic_graph(graph):
+            raise ValueError('The connections between tasks form a cycle')
+
+        # Tasks still to run, with the tasks each one is waiting for
+        waiting = {name: set(p for p in graph.predecessors(name) if p in workflow.tasks) for name in workflow.tasks}
+        outputs = {}
+
+        if self.processes:
+            executor = ProcessPoolExecutor(max_workers=self.processes)
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.thread_count)
+
+        ready = [name for name, deps in waiting.items() if not deps]
+
+        with executor:
+            running = {}
+            while ready or running:
+                for name in ready:
+                    del waiting[name]
+                    task = workflow.tasks[name]
+                    running[executor.submit(task._run_task, self._task(name, workflow_inputs, outputs))] = name
+                ready = []
+
+                done, pending = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        response = future.result()
+                    except Exception as err:
+                        raise RuntimeError('Task {} failed: {}'.format(name, err))
+
+                    if response['status'] != 'COMPLETED':
+                        raise RuntimeError('Task {} finished with status {}'.format(name, response['status']))
+
+                    outputs[name] = response['output']
+                    for successor in graph.successors(name):
+                        deps = waiting.get(successor)
+                        if deps:
+                            deps.discard(name)
+                            if not deps:
+                                ready.append(successor)
+
+        return {name: resolve(expression, workflow_inputs, outputs) for name, expression in workflow.outputs.items()}
+
+    def _task(self, name, workflow_inputs, outputs):
+        task = self.workflow.tasks[name]
+
+        # Like the server, start from the task's input template if it registers one
+        inputs = dict(task.inputs) if task.use_defaults else {}
+        for input, (source_task, expression) in self.workflow._task_inputs.get(name, {}).items():
+            inputs[input] = resolve(expression, workflow_inputs, outputs)
+
+        return {'inputData': inputs}
+
+
+if __name__ == '__main__':
+    from sum_task import SumTask
+    from workflow import Workflow
+
+    workflow = Workflow('local_sum')
+    workflow.add_input('x', 1.0)
+    workflow.add_input('y', 2.0)
+
+    for name in ['a', 'b', 'total']:
+        workflow.add_task(name, SumTask(name, num_inputs=2))
+
+    workflow.connect('x', 'a.i0')
+    workflow.connect('y', 'a.i1')
+    workflow.connect('y', 'b.i0')
+    workflow.connect('y', 'b.i1')
+    workflow.connect('a.sum', 'total.i0')
+    workflow.connect('b.sum', 'total.i1')
+    workflow.add_output('total', 'total.sum')
+
+    print(LocalExecutor(workflow).run())
+    print(LocalExecutor(workflow, processes=2).run({'x': 10.0}))
@@ -2,9 +2,13 @@ from task import Task
 
 
 class OpenMdaoWrapper(Task):
-    def __init__(self, component, use_defaults=False, *args, **kwargs):
+    def __init__(self, component, use_defaults=False, cost=None, *args, **kwargs):
         super(OpenMdaoWrapper, self).__init__(*args, **kwargs)
 
+        # Rough solve_nonlinear() time in seconds, if known (see Task.cost); unknown keeps the task out of fusion
+        if cost is not None:
+            self.cost = cost
+
         self.name = component.__class__.__name__
         self.description = 'wrapped OpenMDAO Component ' + component.__class__.__name__
 
@@ -21,12 +25,6 @@ class OpenMdaoWrapper(Task):
     def run(self, inputs, outputs):
         self.component.solve_nonlinear(inputs, outputs, {})
 
-        return {
-            'status': 'COMPLETED',
-            'output': outputs,
-            'logs': ['one', 'two']
-        }
-
 
 if __name__ == '__main__':
     from conductor.conductor import MetadataClient, WorkflowClient
@@ -0,0 +1,254 @@
+from __future__ import print_function
+import hashlib
+import io
+import numpy as np
+import os
+import tempfile
+import time
+
+# Marks a reference to a stored value in place of the value
+REFERENCE_KEY = '__payload__'
+
+# Task input, added by Workflow, with how many tasks read each of the task's outputs (see shared_memory.SharedArrays)
+READERS_KEY = '__readers__'
+
+
+def is_reference(value):
+    return isinstance(value, dict) and REFERENCE_KEY in value
+
+
+class PayloadStore(object):
+    # Content-addressed store of large task values, so they don't travel through the server.
+    #
+    # encode() replaces each numpy array output of at least threshold bytes with a small reference, after
+    # writing the array to directory as a .npy file named after the sha256 of its contents (so the same array is
+    # only ever stored once); smaller arrays become plain lists. The reference names the directory it was written
+    # to, so any task that can see that directory (the same host, or a shared filesystem) can read it, whether or
+    # not it has a store of its own. Downstream tasks get inputs that load referenced arrays when run() first
+    # reads them (see LazyInputs). Only task outputs are offloaded, not workflow inputs, and only references that
+    # are themselves an input are loaded, not ones nested inside a list or dict.
+    #
+    # Without limits the store only grows. With max_age (seconds) and max_size (bytes), every sweep_every puts
+    # cleanup() removes the arrays last written more than max_age ago, then the oldest ones beyond max_size. An
+    # array that is put again counts as new. The limits must leave room for the slowest consumer: a reference to
+    # an array that was removed can't be read any more.
+    #
+    # Offloading is opt-in per Task subclass (or instance) by setting its payload_store attribute:
+    #
+    #     class Trajectory(OpenMdaoWrapper):
+    #         payload_store = PayloadStore('/shared/payloads', threshold=64 * 1024, max_age=7 * 24 * 3600)
+
+    def __init__(self, directory='payloads', threshold=64 * 1024, max_age=None, max_size=None, sweep_every=100):
+        self.directory = os.path.abspath(directory)
+        self.threshold = threshold
+        self.max_age = max_age
+        self.max_size = max_size
+        self.sweep_every = sweep_every
+
+        self.puts = 0
+
+    def put(self, array, readers=None):
+        # A reference to array, written to the store unless it's there already. readers, the number of tasks that
+        # will read it, is for stores that count them.
+        self.puts += 1
+        self._maybe_cleanup()
+
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(array), allow_pickle=False)
+        data = buffer.getvalue()
+
+        digest = hashlib.sha256(data).hexdigest()
+        self._write(self._path(self.directory, digest), data, readers)
+
+        return {
+            REFERENCE_KEY: digest,
+            'store': self.directory,
+            'dtype': str(array.dtype),
+            'shape': list(array.shape),
+        }
+
+    def _write(self, path, data, readers):
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # Written under a temporary name, so readers never see part of a file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        else:
+            # Rewriting an array that is already there makes it young again
+            os.utime(path)
+
+    def _maybe_cleanup(self):
+        if (self.max_age is not None or self.max_size is not None) and self.puts % self.sweep_every == 0:
+            self.cleanup()
+
+    @classmethod
+    def get(cls, reference):
+        return np.load(cls._path(reference['store'], reference[REFERENCE_KEY]), allow_pickle=False)
+
+    def encode(self, outputs, readers=None):
+        # outputs with large arrays stored and replaced by references, and small ones turned into lists. readers,
+        # if known, is how many tasks read each output.
+        readers = readers or {}
+        encoded = {}
+        for k, v in outputs.items():
+            if isinstance(v, np.ndarray):
+                v = self.put(v, readers.get(k)) if v.nbytes >= self.threshold else v.tolist()
+            encoded[k] = v
+        return encoded
+
+    def cleanup(self):
+        # Removes the arrays older than max_age, then the oldest beyond max_size; returns how many
+        arrays = []
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.npy'):
+                    path = os.path.join(root, name)
+                    try:
+                        arrays.append((os.path.getmtime(path), os.path.getsize(path), path))
+                    except OSError:
+                        pass
+        arrays.sort()
+
+        now = time.time()
+        size = sum(nbytes for mtime, nbytes, path in arrays)
+        removed = 0
+        for mtime, nbytes, path in arrays:
+            expired = self.max_age is not None and now - mtime > self.max_age
+            if not expired and (self.max_size is None or size <= self.max_size):
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            size -= nbytes
+
+        return removed
+
+    @staticmethod
+    def _path(directory, digest):
+        return os.path.join(directory, digest[:2], digest + '.npy')
+
+
+def store_of(reference):
+    # The store class that wrote a reference
+    if 'host' in reference:
+        from shared_memory import SharedArrays
+        return SharedArrays
+    return PayloadStore
+
+
+def cacheable(outputs):
+    # Whether outputs can be kept and sent again later: not if they refer to arrays that are removed once their
+    # readers are done with them (see shared_memory.SharedArrays)
+    return not any(is_reference(v) and hasattr(store_of(v), 'release') for v in outputs.values())
+
+
+class LazyInputs(dict):
+    # A task's inputs, where a referenced value is loaded from its store the first time it is read, and kept.
+    # Reading through [], get(), items(), values(), pop() or setdefault() loads it, and so does copying with
+    # copy() (which gives a plain dict), dict() or ** (which go through keys() and [] because __iter__ is
+    # overridden); the raw references are left alone until then. close() gives back what was read from stores
+    # that count their readers (see shared_memory.SharedArrays), and the counts held for this task on references
+    # it never read.
+
+    def __init__(self, *args, **kwargs):
+        super(LazyInputs, self).__init__(*args, **kwargs)
+        self._loaded = []
+        self._closed = False
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if is_reference(value):
+            reference = value
+            value = store_of(reference).get(reference)
+            dict.__setitem__(self, key, value)
+            self._loaded.append(reference)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def pop(self, key, *default):
+        if key not in self:
+            return dict.pop(self, key, *default)
+        value = self[key]
+        dict.__delitem__(self, key)
+        return value
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        dict.__setitem__(self, key, default)
+        return default
+
+    def copy(self):
+        return dict(self.items())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+
+        unread = [v for v in dict.values(self) if is_reference(v) and v.get('claimed')]
+        loaded, self._loaded = self._loaded, []
+        for reference in loaded + unread:
+            release = getattr(store_of(reference), 'release', None)
+            if release is not None:
+                release(reference)
+
+
+def decode(inputs):
+    # inputs, as LazyInputs if any of them is a reference
+    if any(is_reference(v) for v in inputs.values()):
+        return LazyInputs(inputs)
+    return inputs
+
+
+if __name__ == '__main__':
+    from task import Task
+    import json
+
+    class Ramp(Task):
+        payload_store = PayloadStore(tempfile.mkdtemp(), threshold=1024)
+
+        def __init__(self, *args, **kwargs):
+            super(Ramp, self).__init__(*args, **kwargs)
+            self.name = 'ramp'
+            self.description = 'ramp'
+            self.add_input('n', 10)
+            self.add_output('ramp')
+            self.add_output('ends')
+
+        def run(self, inputs, outputs):
+            outputs['ramp'] = np.linspace(0.0, 1.0, inputs['n'])
+            outputs['ends'] = outputs['ramp'][[0, -1]]
+
+    class Mean(Task):
+        def __init__(self, *args, **kwargs):
+            super(Mean, self).__init__(*args, **kwargs)
+            self.name = 'mean'
+            self.description = 'mean'
+            self.add_input('values')
+            self.add_output('mean')
+
+        def run(self, inputs, outputs):
+            outputs['mean'] = float(np.mean(inputs['values']))
+
+    response = Ramp()._run_task({'inputData': {'n': 100001}})
+    print('Sent:', json.dumps(response['output']))
+
+    # A downstream task reads the ramp without knowing it was stored
+    print('Mean:', Mean()._run_task({'inputData': {'values': response['output']['ramp']}})['output'])
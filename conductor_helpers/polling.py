@@ -0,0 +1,124 @@
+from __future__ import print_function
+from collections import deque
+import random
+import threading
+import time
+
+
+class PollBackoff(object):
+    # How long to wait before the next poll of one queue.
+    #
+    # After a poll that found work there is no wait at all, so a busy queue is drained back to back. Each empty
+    # poll in a row doubles the wait, from min_interval up to max_interval, and a random part of it (up to
+    # jitter, as a fraction) is taken off so that many idle workers don't end up polling in lockstep.
+    #
+    # Time already spent inside the poll counts toward the wait, so a long-poll that the server held open for
+    # the whole interval is followed immediately by the next one.
+
+    def __init__(self, min_interval=0.01, max_interval=1.0, factor=2.0, jitter=0.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+
+        self.empty_polls = 0
+
+    def delay(self, found, elapsed=0.0):
+        if found:
+            self.empty_polls = 0
+            return 0.0
+
+        interval = min(self.max_interval, self.min_interval * self.factor ** self.empty_polls)
+        if interval < self.max_interval:
+            # Stop counting once at the cap, so a long idle spell can't overflow the power
+            self.empty_polls += 1
+
+        interval *= 1.0 - self.jitter * random.random()
+        return max(0.0, interval - elapsed)
+
+    def reset(self):
+        self.empty_polls = 0
+
+
+class PollMetrics(object):
+    # Per task type poll counts, and pickup latency: the time from the server scheduling a task to a worker
+    # receiving it. Latency is measured against the task's scheduledTime, so it includes any clock offset
+    # between the worker and the server. Latency statistics cover the last window tasks of each type.
+    #
+    # Polls that failed (the server down, or answering with an error) are counted in errors, with the last
+    # error's message, rather than as empty polls.
+
+    def __init__(self, window=1000):
+        self.window = window
+
+        self._types = {}
+        self._lock = threading.Lock()
+
+    def record(self, task_type, tasks):
+        now = time.time()
+
+        with self._lock:
+            stats = self._stats(task_type)
+            stats['polls'] += 1
+            if not tasks:
+                stats['empty_polls'] += 1
+
+            for task in tasks:
+                stats['tasks'] += 1
+                if task.get('scheduledTime'):
+                    stats['latency'].append(max(0.0, now - task['scheduledTime'] / 1000.0))
+
+    def record_error(self, task_type, err):
+        with self._lock:
+            stats = self._stats(task_type)
+            stats['polls'] += 1
+            stats['errors'] += 1
+            stats['last_error'] = str(err)
+
+    def _stats(self, task_type):
+        # With the lock held
+        stats = self._types.get(task_type)
+        if stats is None:
+            stats = self._types[task_type] = {
+                'polls': 0,
+                'empty_polls': 0,
+                'errors': 0,
+                'last_error': None,
+                'tasks': 0,
+                'latency': deque(maxlen=self.window),
+            }
+        return stats
+
+    def summary(self):
+        summary = {}
+        with self._lock:
+            for task_type, stats in self._types.items():
+                latency = sorted(stats['latency'])
+
+                summary[task_type] = {
+                    'polls': stats['polls'],
+                    'empty_polls': stats['empty_polls'],
+                    'errors': stats['errors'],
+                    'last_error': stats['last_error'],
+                    'tasks': stats['tasks'],
+                    'pickup_latency': {
+                        'mean': sum(latency) / len(latency) if latency else None,
+                        'p50': _percentile(latency, 0.50),
+                        'p95': _percentile(latency, 0.95),
+                        'max': latency[-1] if latency else None,
+                    },
+                }
+
+        return summary
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+if __name__ == '__main__':
+    backoff = PollBackoff()
+    print('Waits after empty polls:', ['{:.3f}'.format(backoff.delay(False)) for i in range(10)])
+    print('Wait after finding work:', backoff.delay(True))
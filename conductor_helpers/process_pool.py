@@ -0,0 +1,62 @@
+from __future__ import print_function
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pickle
+import threading
+
+# The Task owned by this worker process, built once by _initialize
+_task = None
+
+
+def _initialize(pickled_task):
+    # Always unpickle, even under fork, so per-process resources (e.g. result cache connections) are reopened
+    global _task
+    _task = pickle.loads(pickled_task)
+
+
+def _run_task(task):
+    return _task._run_task(task)
+
+
+class ProcessPool(object):
+    # Runs Task._run_task in a pool of worker processes, so CPU-bound run() methods are not serialized by the
+    # GIL. Each process gets its own copy of the Task (and of the component it wraps) once, at startup, and
+    # reuses it for every task it handles. If a process dies, the pool is rebuilt and the task resubmitted,
+    # up to max_retries times, before it is reported as failed.
+
+    def __init__(self, task, processes=None, max_retries=3):
+        self.processes = processes
+        self.max_retries = max_retries
+        self.restarts = 0
+
+        self._pickled_task = pickle.dumps(task)
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+
+    def run_task(self, task):
+        for attempt in range(self.max_retries + 1):
+            executor = self._executor
+            try:
+                return executor.submit(_run_task, task).result()
+            except BrokenProcessPool:
+                print('Worker process crashed running task {}, restarting pool'.format(task.get('taskId')))
+                self._restart(executor)
+
+        raise RuntimeError('Worker process crashed {} times running task {}'.format(self.max_retries + 1,
+                                                                                   task.get('taskId')))
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.processes,
+                                   initializer=_initialize,
+                                   initargs=(self._pickled_task,))
+
+    def _restart(self, broken):
+        # Every thread waiting on the broken pool ends up here; only the first one replaces it
+        with self._lock:
+            if self._executor is broken:
+                broken.shutdown(wait=False)
+                self._executor = self._new_executor()
+                self.restarts += 1
@@ -0,0 +1,170 @@
+from __future__ import print_function
+import cProfile
+import os
+import pstats
+import random
+import re
+import threading
+import time
+
+
+class SamplingProfiler(object):
+    # Profiles a random rate fraction of Task.run() calls with cProfile and merges the results per task type, so a
+    # worker can be left running with it on to find out which lines of a component are hot. Calls that aren't
+    # sampled cost one random number.
+    #
+    # Only one call is profiled at a time: a sampled call that comes while another is being profiled (or while
+    # some other profiler is active, which Python 3.12 doesn't allow alongside) runs unprofiled instead.
+    #
+    # dump() writes the merged stats of each task type to directory/<task type>.<pid>.prof, in the format of
+    # pstats and of tools built on it (snakeviz, gprof2dot, ...); with interval set, that also happens every
+    # interval seconds. Worker processes (see process_pool.ProcessPool) each sample and dump their own calls;
+    # pstats.Stats(*paths) merges their files.
+    #
+    # Profiling is opt-in per Task subclass (or instance) by setting its profiler attribute:
+    #
+    #     class ProfiledCruisePower(OpenMdaoWrapper):
+    #         profiler = SamplingProfiler(rate=0.01, directory='profiles', interval=600)
+
+    def __init__(self, rate=0.01, directory='profiles', interval=None, seed=None):
+        self.rate = rate
+        self.directory = directory
+        self.interval = interval
+        self.seed = seed
+
+        self._setup()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ['_stats', '_lock', '_profiling', '_random', '_dumper', '_pid']:
+            del state[k]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup()
+
+    def _setup(self):
+        self.calls = 0
+        self.profiled = 0
+        self.busy = 0
+
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()
+        self._random = random.Random(self.seed)
+        self._dumper = None
+        self._pid = os.getpid()
+
+    def call(self, task_type, fn, *args):
+        # fn(*args), profiled if sampled
+        if self._pid != os.getpid():
+            # Forked: this process's samples are its own
+            self._setup()
+
+        self.calls += 1
+        if self._random.random() >= self.rate:
+            return fn(*args)
+
+        if not self._profiling.acquire(False):
+            self.busy += 1
+            return fn(*args)
+
+        try:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler is active in this process
+                self.busy += 1
+                return fn(*args)
+
+            try:
+                return fn(*args)
+            finally:
+                profile.disable()
+                self._add(task_type, profile)
+        finally:
+            self._profiling.release()
+
+    def _add(self, task_type, profile):
+        with self._lock:
+            if task_type in self._stats:
+                self._stats[task_type].add(profile)
+            else:
+                self._stats[task_type] = pstats.Stats(profile)
+            self.profiled += 1
+
+        if self.interval and self._dumper is None:
+            self._start_dumper()
+
+    def stats(self, task_type):
+        # The merged pstats.Stats of a task type, or None if none of its calls were profiled yet
+        with self._lock:
+            return self._stats.get(task_type)
+
+    def summary(self):
+        return {'calls': self.calls, 'profiled': self.profiled, 'busy': self.busy}
+
+    def dump(self, directory=None):
+        # Writes the stats of every profiled task type, and returns the paths written
+        directory = directory or self.directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        paths = []
+        with self._lock:
+            for task_type, stats in self._stats.items():
+                path = os.path.join(directory, '{}.{}.prof'.format(re.sub(r'[^\w.-]', '_', task_type), os.getpid()))
+                stats.dump_stats(path)
+                paths.append(path)
+
+        return paths
+
+    def _start_dumper(self):
+        with self._lock:
+            if self._dumper is not None:
+                return
+            self._dumper = threading.Thread(target=self._dump_loop)
+            self._dumper.daemon = True
+            self._dumper.start()
+
+    def _dump_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.dump()
+            except Exception as err:
+                print('Error writing profiles: ' + str(err))
+
+
+if __name__ == '__main__':
+    from task import Task
+    import tempfile
+
+    class SlowTask(Task):
+        profiler = SamplingProfiler(rate=0.1, directory=tempfile.mkdtemp(), seed=0)
+
+        def __init__(self, *args, **kwargs):
+            super(SlowTask, self).__init__(*args, **kwargs)
+            self.name = 'slow'
+            self.description = 'slow'
+            self.add_input('n', 20000)
+            self.add_output('total')
+
+        def run(self, inputs, outputs):
+            outputs['total'] = sum(self.square(i) for i in range(inputs['n']))
+
+        def square(self, i):
+            return i * i
+
+    t = SlowTask()
+    for i in range(200):
+        t._run_task({'inputData': {'n': 20000}})
+
+    print(SlowTask.profiler.summary())
+    SlowTask.profiler.stats('slow').sort_stats('cumulative').print_stats(5)
+
+    paths = SlowTask.profiler.dump()
+    print('Wrote', paths)
+    pstats.Stats(*paths).sort_stats('tottime').print_stats(3)
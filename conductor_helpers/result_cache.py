@@ -0,0 +1,171 @@
+from __future__ import print_function
+from collections import OrderedDict
+from sqlitedict import SqliteDict
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def _canonical(value):
+    # JSON fallback for values json can't encode natively (e.g. numpy arrays and scalars)
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return repr(value)
+
+
+class ResultCache(object):
+    # Content-addressed store of Task results, keyed on (task name, task version, inputs).
+    #
+    # Results are persisted to an sqlitedict file so they survive restarts and are shared by every worker
+    # pointed at the same file. An in-memory LRU sits in front of it: it holds at most max_size entries, and
+    # any entry older than max_age seconds (if given) is treated as a miss and dropped from memory and disk.
+    # Every sweep_every puts, the file itself is swept: expired entries are deleted, then the oldest entries
+    # beyond max_disk_size (if given).
+    #
+    # Caching is opt-in per Task subclass (or instance) by setting its result_cache attribute:
+    #
+    #     class CachedHoverPower(OpenMdaoWrapper):
+    #         result_cache = ResultCache('hover_power.sqlite', max_size=4096, max_age=24 * 3600)
+
+    def __init__(self, filename='task_results.sqlite', max_size=1024, max_age=None, max_disk_size=None,
+                 sweep_every=100):
+        self.filename = filename
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_disk_size = max_disk_size
+        self.sweep_every = sweep_every
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.disk_evictions = 0
+        self.puts = 0
+
+        self._open()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ['_memory', '_lock', '_disk', '_pid']:
+            del state[k]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    @staticmethod
+    def key(name, version, inputs):
+        payload = json.dumps([name, version, inputs], sort_keys=True, separators=(',', ':'), default=_canonical)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        self._check_pid()
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is None:
+                entry = self._disk.get(key)
+
+            if entry is not None and self.max_age is not None and time.time() - entry[0] > self.max_age:
+                self._disk.pop(key, None)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._remember(key, entry)
+
+            return copy.deepcopy(entry[1])
+
+    def put(self, key, response):
+        entry = (time.time(), copy.deepcopy(response))
+
+        self._check_pid()
+        with self._lock:
+            self._memory.pop(key, None)
+            self._remember(key, entry)
+            self._disk[key] = entry
+
+            self.puts += 1
+            if self.puts % self.sweep_every == 0:
+                self._sweep()
+
+    def clear(self):
+        self._check_pid()
+        with self._lock:
+            self._memory.clear()
+            self._disk.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'disk_evictions': self.disk_evictions,
+                'memory_size': len(self._memory),
+            }
+
+    def _open(self):
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = SqliteDict(self.filename, autocommit=True)
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        # A forked worker process (see process_pool) can't use the parent's sqlite connection or its writer
+        # thread, so it opens its own connection to the same file. The inherited handle is dropped without
+        # closing it, since closing would wait on a thread that doesn't exist in this process.
+        if self._pid != os.getpid():
+            self._disk.conn = None
+            self._open()
+
+    def _sweep(self):
+        # Deletes expired entries from the file, then the oldest ones beyond max_disk_size
+        if self.max_age is None and self.max_disk_size is None:
+            return
+
+        now = time.time()
+        stored = []
+        for key, entry in list(self._disk.items()):
+            if self.max_age is not None and now - entry[0] > self.max_age:
+                del self._disk[key]
+                self._memory.pop(key, None)
+                self.expirations += 1
+            else:
+                stored.append((entry[0], key))
+
+        if self.max_disk_size is not None and len(stored) > self.max_disk_size:
+            stored.sort()
+            for stored_at, key in stored[:len(stored) - self.max_disk_size]:
+                del self._disk[key]
+                self._memory.pop(key, None)
+                self.disk_evictions += 1
+
+    def _remember(self, key, entry):
+        # Most recently used entries live at the end of the OrderedDict
+        self._memory[key] = entry
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+
+if __name__ == '__main__':
+    from sum_task import SumTask
+    import tempfile
+
+    class CachedSumTask(SumTask):
+        result_cache = ResultCache(os.path.join(tempfile.mkdtemp(), 'sum_task.sqlite'), max_size=2)
+
+    t = CachedSumTask('cached_sum', num_inputs=2)
+    for i in [1.0, 2.0, 1.0, 3.0, 1.0]:
+        print(t._run_task({'inputData': {'i0': i, 'i1': 1.0}})['output'])
+
+    print(CachedSumTask.result_cache.stats())
@@ -0,0 +1,189 @@
+from __future__ import print_function
+from payload_store import REFERENCE_KEY, PayloadStore
+import fcntl
+import numpy as np
+import os
+import socket
+import tempfile
+import time
+
+# Shared memory where there is some, so files there never touch a disk
+DEFAULT_DIRECTORY = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+                                 'conductor_helpers')
+
+
+class SharedArrays(PayloadStore):
+    # Passes large array outputs to tasks on the same host through shared memory: the producer writes each array
+    # once, as a .npy file in directory (by default under /dev/shm), and consumers map it read-only, getting a
+    # numpy view of the producer's copy instead of parsing it again. Used like a PayloadStore, in place of one:
+    #
+    #     class Trajectory(OpenMdaoWrapper):
+    #         payload_store = SharedArrays(threshold=64 * 1024, fallback=PayloadStore('/shared/payloads'))
+    #
+    # A reference names the host it was written on, and never carries the array itself. Every array is also put
+    # in fallback, a PayloadStore on a filesystem every host can see, which is where consumers on other hosts
+    # (and the workflow's own outputs) read it; a store without one is refused.
+    #
+    # A count of readers is kept in a <hash>.refs file next to each array, under an fcntl lock. In a Workflow,
+    # each task that reads an output is counted when the output is put (the workflow passes how many there are
+    # in the producer's READERS_KEY input), so the array stays however long its readers wait in the queue; each
+    # reader gives its count back when its task is done, whether it read the array or not (see LazyInputs), and
+    # the last one removes it. A task run on its own counts its readers only while they run, and an array nobody
+    # is reading is removed once it was written more than linger seconds ago. cleanup(), also run now and then
+    # by put(), removes those, and any array older than max_age even if it is still counted (a reader on another
+    # host, or one that crashed, never gives its count back). A consumer's view stays valid after the file is
+    # removed, and a consumer that comes after it reads the fallback's copy instead.
+    #
+    # Outputs holding these references are never kept in a result cache, since the arrays they refer to go away
+    # (see payload_store.cacheable).
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, threshold=64 * 1024, fallback=None, linger=600.0,
+                 max_age=24 * 3600.0):
+        if fallback is None:
+            raise ValueError('SharedArrays needs a fallback PayloadStore for consumers on other hosts')
+
+        super(SharedArrays, self).__init__(directory, threshold, max_age=max_age)
+
+        self.fallback = fallback
+        self.linger = linger
+        self.host = socket.gethostname()
+
+        self._last_cleanup = 0.0
+
+    def put(self, array, readers=None):
+        reference = super(SharedArrays, self).put(array, readers)
+
+        reference['host'] = self.host
+        reference['linger'] = self.linger
+        if readers is not None:
+            reference['claimed'] = True
+        reference['fallback'] = self.fallback.put(array)
+
+        return reference
+
+    def _write(self, path, data, readers):
+        if readers is not None:
+            # Counted before the file is there, so a cleanup in between can't take it
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _add_reader(path, readers)
+        super(SharedArrays, self)._write(path, data, readers)
+
+    def _maybe_cleanup(self):
+        if time.time() - self._last_cleanup > self.linger / 10.0:
+            self._last_cleanup = time.time()
+            self.cleanup()
+
+    @classmethod
+    def get(cls, reference):
+        # A read-only view of the array if it is on this host, and the fallback's copy otherwise. Every reference
+        # read must be given back with release().
+        if reference.get('host') == socket.gethostname():
+            path = cls._path(reference['store'], reference[REFERENCE_KEY])
+
+            # A claimed reference was counted for this reader when it was put
+            counted = not reference.get('claimed')
+            if counted:
+                _add_reader(path, 1)
+            try:
+                return np.load(path, mmap_mode='r', allow_pickle=False)
+            except (IOError, OSError):
+                if counted:
+                    _add_reader(path, -1)
+
+        return PayloadStore.get(reference['fallback'])
+
+    @classmethod
+    def release(cls, reference):
+        if reference.get('host') != socket.gethostname():
+            return
+
+        path = cls._path(reference['store'], reference[REFERENCE_KEY])
+        if _add_reader(path, -1) == 0:
+            # Every counted reader is done with a claimed array, so it needn't linger
+            _remove_if_unread(path, 0.0 if reference.get('claimed') else reference.get('linger', 0.0))
+
+    def cleanup(self):
+        # Removes the arrays written more than linger seconds ago that nobody is reading, and those older than
+        # max_age; returns how many
+        removed = 0
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith('.npy') and _remove_if_unread(path, self.linger, self.max_age):
+                    removed += 1
+                elif name.endswith('.refs'):
+                    _remove_if_orphaned(path)
+        return removed
+
+
+def _add_reader(path, change):
+    # Changes the count of readers of path, under an exclusive lock on its .refs file, and returns the new count
+    fd = os.open(path[:-len('.npy')] + '.refs', os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+        count = max(0, int(os.read(fd, 32) or 0) + change)
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, str(count).encode('ascii'))
+        return count
+    finally:
+        os.close(fd)
+
+
+def _remove_if_unread(path, linger, max_age=None):
+    # Removes path if nobody is reading it and it was written at least linger seconds ago, or if it is older than
+    # max_age; True if it did
+    refs = path[:-len('.npy')] + '.refs'
+    fd = os.open(refs, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+        try:
+            age = time.time() - os.path.getmtime(path)
+            expired = max_age is not None and age > max_age
+            if not expired and (int(os.read(fd, 32) or 0) > 0 or age < linger):
+                return False
+            os.remove(path)
+        except (IOError, OSError):
+            return False
+
+        os.remove(refs)
+        return True
+    finally:
+        os.close(fd)
+
+
+def _remove_if_orphaned(refs):
+    # Removes a count of no readers left for an array that is gone, by a reader that came after it was removed. A
+    # count above zero may be the readers of an array about to be written.
+    try:
+        fd = os.open(refs, os.O_RDWR)
+    except OSError:
+        return
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if int(os.read(fd, 32) or 0) == 0 and not os.path.exists(refs[:-len('.refs')] + '.npy'):
+            os.remove(refs)
+    except (IOError, OSError):
+        pass
+    finally:
+        os.close(fd)
+
+
+if __name__ == '__main__':
+    store = SharedArrays(tempfile.mkdtemp(), threshold=1024, fallback=PayloadStore(tempfile.mkdtemp()), linger=0.0)
+
+    reference = store.put(np.linspace(0.0, 1.0, 100000))
+    print('Reference:', reference)
+
+    view = SharedArrays.get(reference)
+    print('Same host: {} read-only={} mean={}'.format(type(view).__name__, not view.flags.writeable, view.mean()))
+
+    elsewhere = dict(reference, host='another-host')
+    print('Another host:', type(SharedArrays.get(elsewhere)).__name__)
+
+    SharedArrays.release(reference)
+    print('Removed after release:', not os.path.exists(store._path(store.directory, reference[REFERENCE_KEY])))
+    print('View still readable:', view[-1])
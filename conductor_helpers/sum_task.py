@@ -3,6 +3,8 @@ import json
 
 
 class SumTask(Task):
+    cost = 0.0
+
     def __init__(self, name, description=None, use_defaults=False, num_inputs=2, *args, **kwargs):
         super(SumTask, self).__init__(use_defaults=use_defaults, *args, **kwargs)
 
@@ -0,0 +1,322 @@
+from __future__ import print_function
+from scipy.spatial.distance import cdist
+from timing import RollingHistogram
+import numbers
+import numpy as np
+import random
+import scipy.linalg
+import threading
+
+
+def _split(inputs):
+    # (categorical inputs, numeric inputs) of a task's inputs, each a sorted tuple of (name, value) pairs, or None
+    # if an input is neither (a list, an array, a stored payload reference, ...)
+    categories, features = [], []
+    for k in sorted(inputs):
+        v = inputs[k]
+        if v is None or isinstance(v, (bool, str)):
+            categories.append((k, v))
+        elif isinstance(v, numbers.Real):
+            features.append((k, float(v)))
+        else:
+            return None
+    return tuple(categories), tuple(features)
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def _is_fixed(value):
+    # An output a model can give back as it is, if it is the same at every point
+    return value is None or isinstance(value, (bool, str))
+
+
+def _supported(outputs):
+    # True if every output is a scalar number, or a value a model can give back as it is (not a list, an array,
+    # a stored payload reference, ...)
+    return all(_is_number(v) or _is_fixed(v) for v in outputs.values())
+
+
+class _Model(object):
+    # The evaluations of one task at one set of categorical inputs, and a cubic RBF interpolant of its numeric
+    # outputs (with a linear tail) fitted to them in the unit box of their inputs. Outputs that are None, bools or
+    # strings must be the same at every point, and are answered as they are. A task with any other output (see
+    # _supported), or whose outputs change kind between points, is not modelled: consistent turns False for good.
+
+    def __init__(self, outputs):
+        self.numeric = sorted(k for k, v in outputs.items() if _is_number(v))
+        self.fixed = {k: v for k, v in outputs.items() if _is_fixed(v)}
+        self.consistent = _supported(outputs)
+
+        self.points = {}  # Input values -> output values, oldest first
+        self.fit_size = 0
+        self.fitting = False
+        self.lo = None
+
+    def add(self, x, outputs, max_points):
+        if not self.consistent:
+            return
+        if not _supported(outputs) or sorted(k for k, v in outputs.items() if _is_number(v)) != self.numeric or \
+                {k: v for k, v in outputs.items() if _is_fixed(v)} != self.fixed:
+            self.consistent = False
+            self.points = {}
+            return
+
+        self.points.pop(x, None)
+        self.points[x] = [float(outputs[k]) for k in self.numeric]
+        while len(self.points) > max_points:
+            del self.points[next(iter(self.points))]
+
+    def stale(self):
+        # Refitting costs O(n^3), so it waits for the points to grow by a tenth
+        return len(self.points) - self.fit_size >= max(1, self.fit_size // 10)
+
+    def fit(self, points):
+        # The interpolant fitted to points, a copy of self.points taken under the surrogate's lock, as attributes
+        # to set on the model. Only reads points, so it can run without the lock.
+        try:
+            return self._fit(points)
+        except (np.linalg.LinAlgError, ValueError):
+            # Singular, e.g. with fewer distinct points than inputs
+            return {'fit_size': len(points)}
+
+    def _fit(self, points):
+        X = np.array(list(points.keys()))
+        Y = np.array(list(points.values()))
+        n, dims = X.shape
+
+        lo, hi = X.min(axis=0), X.max(axis=0)
+        scale = np.where(hi > lo, hi - lo, 1.0)
+        X = (X - lo) / scale
+
+        # [[phi, P], [P^T, 0]] [c; b] = [y; 0], with phi(r) = r^3 and P the linear polynomials
+        M = np.zeros((n + dims + 1, n + dims + 1))
+        M[:n, :n] = cdist(X, X) ** 3
+        M[:n, n:] = np.hstack([np.ones((n, 1)), X])
+        M[n:, :n] = M[:n, n:].T
+        Minv = scipy.linalg.inv(M)
+        coefficients = Minv[:, :n].dot(Y)
+
+        # Rippa's leave-one-out errors: what the interpolant without point i would get wrong at point i, for every
+        # i from one inverse, relative to the spread of each output (so an output that never changes is exact)
+        spread = Y.max(axis=0) - Y.min(axis=0)
+        spread = np.where(spread > 0, spread, np.inf)
+        loo = (np.abs(coefficients[:n] / np.diag(Minv)[:n, np.newaxis]) / spread).max(axis=1)
+
+        return {'lo': lo, 'hi': hi, 'scale': scale, 'X': X, 'coefficients': coefficients, 'spread': spread,
+                'loo': loo, 'fit_size': n}
+
+    def predict(self, x):
+        # (output values, estimated error) at x, or None unless x is surrounded by fitted points: among its
+        # 2 * (inputs + 1) nearest, there must be some on either side of it in every input. The estimate is the
+        # largest leave-one-out error among those nearest points. Near the edge of the points seen, where the
+        # nearest points all lie on one side, their leave-one-out errors say little about the error at x.
+        x = np.asarray(x)
+        if self.lo is None or (x < self.lo).any() or (x > self.hi).any():
+            return None
+        z = ((x - self.lo) / self.scale)[np.newaxis, :]
+
+        r = cdist(z, self.X)[0]
+        nearest = np.argsort(r)[:2 * (len(x) + 1)]
+        if not ((self.X[nearest] <= z).any(axis=0) & (self.X[nearest] >= z).any(axis=0)).all():
+            return None
+
+        n = len(r)
+        y = (r ** 3).dot(self.coefficients[:n]) + np.hstack([[1.0], z[0]]).dot(self.coefficients[n:])
+        return y, self.loo[nearest].max()
+
+    def outputs(self, y):
+        outputs = dict(self.fixed)
+        outputs.update(zip(self.numeric, (float(v) for v in y)))
+        return outputs
+
+
+class Surrogate(object):
+    # Answers a task from an interpolating model of its earlier results instead of running it, when the model's
+    # estimated error there is at most tolerance.
+    #
+    # Every real run() adds a point. There is one model per task (and version) and per value of the inputs that
+    # aren't numbers, like Vehicle; once one has min_points points it is a cubic RBF interpolant of the numeric
+    # outputs over the numeric inputs (keeping the newest max_points points). Its error at a point is estimated
+    # as the largest leave-one-out error (Rippa's formula) among the nearest points, relative to the spread of
+    # each output, and it only answers at points surrounded by points it has seen. Anything else falls through to
+    # run(): tasks with list or array inputs or outputs, a model that's still too small, a point at the edge of
+    # the model, or an error estimate too large.
+    #
+    # With audit_rate set, that fraction of the points the model would answer are run anyway, and the real
+    # error of its answer is kept in stats() next to the estimates. Each worker process (see
+    # process_pool.ProcessPool) builds its own models.
+    #
+    # The surrogate is opt-in per Task subclass (or instance) by setting its surrogate attribute:
+    #
+    #     class FastCruisePower(OpenMdaoWrapper):
+    #         surrogate = Surrogate(tolerance=1e-4, min_points=50, audit_rate=0.01)
+
+    def __init__(self, tolerance=1e-3, min_points=20, max_points=500, audit_rate=0.0, window=1000, seed=None):
+        self.tolerance = tolerance
+        self.min_points = min_points
+        self.max_points = max_points
+        self.audit_rate = audit_rate
+        self.window = window
+        self.seed = seed
+
+        self._setup()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ['_lock', '_random']:
+            del state[k]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._random = random.Random(self.seed)
+
+    def _setup(self):
+        self.hits = 0
+        self.misses = {'unsupported': 0, 'too_few_points': 0, 'outside': 0, 'over_tolerance': 0}
+        self.audits = 0
+        self.fits = 0
+        self.estimated_error = RollingHistogram(self.window)
+        self.actual_error = RollingHistogram(self.window)
+
+        self._models = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(self.seed)
+
+    def predict(self, name, version, inputs):
+        # Outputs for inputs from the model, or None to run the task
+        key, x = self._key(name, version, inputs)
+        if key is not None:
+            self._refit(key)
+
+        with self._lock:
+            model = self._models.get(key)
+            if key is None or (model is not None and not model.consistent):
+                self.misses['unsupported'] += 1
+                return None
+            if model is None or model.lo is None:
+                self.misses['too_few_points'] += 1
+                return None
+
+            prediction = model.predict(x)
+            if prediction is None:
+                self.misses['outside'] += 1
+                return None
+
+            y, error = prediction
+            if error > self.tolerance:
+                self.misses['over_tolerance'] += 1
+                return None
+
+            if self.audit_rate and self._random.random() < self.audit_rate:
+                self.audits += 1
+                return None
+
+            self.hits += 1
+            self.estimated_error.add(error)
+            return model.outputs(y)
+
+    def add(self, name, version, inputs, outputs):
+        # Adds a real result. Where the model would have answered, its error is measured first.
+        key, x = self._key(name, version, inputs)
+        if key is None:
+            return
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._models[key] = _Model(outputs)
+
+            if model.consistent and model.lo is not None:
+                prediction = model.predict(x)
+                if prediction is not None and prediction[1] <= self.tolerance:
+                    actual = [outputs.get(k) for k in model.numeric]
+                    if all(_is_number(v) for v in actual):
+                        self.actual_error.add(float((np.abs(prediction[0] - actual) / model.spread).max()))
+
+            model.add(x, outputs, self.max_points)
+
+    @staticmethod
+    def _key(name, version, inputs):
+        # (the key of the model for inputs, their numeric values), or (None, None) if they can't be modelled
+        split = _split(inputs)
+        if split is None:
+            return None, None
+        categories, features = split
+        return (name, version, categories, tuple(k for k, v in features)), tuple(v for k, v in features)
+
+    def _refit(self, key):
+        # Refits the model at key if it has grown. That costs O(n^3), so it's done outside the lock, on a copy of
+        # the points and by one thread at a time; the others keep answering from the previous fit meanwhile.
+        with self._lock:
+            model = self._models.get(key)
+            if model is None or not model.consistent or model.fitting or len(model.points) < self.min_points or \
+                    not model.stale():
+                return
+            model.fitting = True
+            points = dict(model.points)
+
+        fitted = model.fit(points)
+
+        with self._lock:
+            model.fitting = False
+            if model.consistent:
+                vars(model).update(fitted)
+                if 'coefficients' in fitted:
+                    self.fits += 1
+
+    def clear(self):
+        with self._lock:
+            self._models = {}
+
+    def stats(self):
+        with self._lock:
+            misses = sum(self.misses.values())
+            return {
+                'hits': self.hits,
+                'misses': dict(self.misses),
+                'audits': self.audits,
+                'hit_rate': self.hits / float(self.hits + misses + self.audits or 1),
+                'models': len(self._models),
+                'points': sum(len(m.points) for m in self._models.values()),
+                'fits': self.fits,
+                # Of the answers given, and of the answers the model would have given at real evaluations
+                'estimated_error': self.estimated_error.summary(),
+                'actual_error': self.actual_error.summary(),
+            }
+
+
+if __name__ == '__main__':
+    from task import Task
+    import json
+    import math
+
+    class RotorPower(Task):
+        # Induced plus profile power of a rotor, in the shape of vahana_scripts.hover_power
+        surrogate = Surrogate(tolerance=1e-4, min_points=30, audit_rate=0.05, seed=0)
+
+        def __init__(self, *args, **kwargs):
+            super(RotorPower, self).__init__(*args, **kwargs)
+            self.name = 'rotor_power'
+            self.description = 'rotor power'
+            self.add_input('Vehicle', u'helicopter')
+            self.add_input('rProp', 1.4)
+            self.add_input('W', 2000.0)
+            self.add_output('PHover')
+
+        def run(self, inputs, outputs):
+            nProp = 8 if inputs['Vehicle'] == 'tiltwing' else 1
+            T = inputs['W'] / nProp
+            outputs['PHover'] = nProp * T * 1.15 * math.sqrt(T / (2 * 1.225 * math.pi * inputs['rProp'] ** 2)) + \
+                nProp * 0.1 * 0.012 / 8 * 200.0 ** 3 * 1.225 * math.pi * inputs['rProp'] ** 2
+
+    t = RotorPower()
+    rng = random.Random(1)
+    for i in range(2000):
+        vehicle = rng.choice([u'helicopter', u'tiltwing'])
+        t._run_task({'inputData': {'Vehicle': vehicle, 'rProp': rng.uniform(1.0, 2.0), 'W': rng.uniform(1500, 2500)}})
+
+    print(json.dumps(RotorPower.surrogate.stats(), indent=2))
@@ -1,14 +1,59 @@
 from __future__ import print_function
-from conductor.conductor import MetadataClient
-from conductor.ConductorWorker import ConductorWorker
+from client import client_context
+from payload_store import READERS_KEY, LazyInputs, cacheable, decode
+from process_pool import ProcessPool
+from timing import format_timings, queue_wait
+from worker import Worker
+import time
 
 
 class Task(object):
-    def __init__(self, use_defaults=False):  # name=None, description=None):
+    # Implementation version, part of the result cache key. Bump it when run() changes its answers.
+    version = 1
+
+    # Opt-in result cache (see result_cache.ResultCache); set on a subclass or an instance
+    result_cache = None
+
+    # Opt-in surrogate model answering run() near earlier results (see surrogate.Surrogate); set on a subclass or
+    # an instance
+    surrogate = None
+
+    # Opt-in sampling profiler of run() (see profiling.SamplingProfiler); set on a subclass or an instance
+    profiler = None
+
+    # Opt-in store for large array outputs (see payload_store.PayloadStore, or shared_memory.SharedArrays between
+    # tasks on one host); set on a subclass or an instance. Referenced inputs are loaded as run() reads them
+    # either way.
+    payload_store = None
+
+    # Rough run() time in seconds, if known. Workflow.fused merges connected tasks that cost at most its max_cost
+    # into one; fusable set to True or False on a subclass or an instance overrides the cost either way. A task
+    # with neither is never fused.
+    cost = None
+    fusable = None
+
+    # If True, each task's logs are a one-line summary of where its time went (see timing.TaskTimings)
+    timing_logs = False
+
+    def __init__(self, use_defaults=False, thread_count=1, max_in_flight=None,
+                 processes=None, batch_size=None):  # name=None, description=None):
         self.inputs = {}
         self.outputs = {}
         self.use_defaults = use_defaults
 
+        # Worker pool for this task type: run() threads, and tasks held at once (defaults to thread_count)
+        self.thread_count = thread_count
+        self.max_in_flight = max_in_flight
+
+        # If set, run() executes in this many worker processes instead of threads (for CPU-bound tasks). Each
+        # process works on its own copy of the task, so the counters of its result_cache, surrogate and profiler
+        # (and of a wrapped component, like CruisePower.lambda_stats) are kept per process and stay at zero in
+        # this one. Timings come back with every response and are counted by the worker as usual.
+        self.processes = processes
+
+        # If set, poll, ack and update up to this many tasks per request (see worker.Worker)
+        self.batch_size = batch_size
+
         # if name:
         #     self.name = name
         # else:
@@ -26,8 +71,16 @@ class Task(object):
         self.outputs[name] = None
 
     def register(self, endpoint='http://localhost:8080/api'):
-        mc = MetadataClient(endpoint)
+        mc = client_context(endpoint).metadata_client
+
+        task_def = self._definition()
+
+        import json
+        json.dumps(task_def)
+
+        mc.registerTaskDefs([task_def])
 
+    def _definition(self):
         task_def = {
             'name': self.name,
             'description': self.description,
@@ -35,35 +88,118 @@ class Task(object):
             'outputKeys': list(self.outputs.keys()),
         }
 
-        # Only create inputTemplate if we plan to use defaults
+        # Only fill in inputTemplate if we plan to use defaults. The empty one otherwise is what the server stores
+        # anyway, and sending it lets a definition be compared with the server's copy (see Workflow.register_tasks).
         if self.use_defaults:
             task_def['inputTemplate'] = self.inputs
         else:
-            pass
+            task_def['inputTemplate'] = {}
 
-        import json
-        json.dumps(task_def)
-
-        mc.registerTaskDefs([task_def])
+        return task_def
 
     def start(self, endpoint='http://localhost:8080/api', wait=False):
-        cw = ConductorWorker(endpoint, 1, 0.1)
-        cw.start(taskType=self.name,
-                 exec_function=self._run_task,
-                 wait=wait)
+        exec_function, thread_count = self._worker_config()
+
+        w = Worker(endpoint, thread_count, max_in_flight=self.max_in_flight, batch_size=self.batch_size)
+        w.start(task_type=self.name,
+                exec_function=exec_function,
+                wait=wait)
+
+        # Poll counts and pickup latency are in w.metrics
+        return w
+
+    def _worker_config(self):
+        # The function a worker should call per task, and how many threads should call it
+        if self.processes:
+            # One feeding thread per worker process
+            return ProcessPool(self, self.processes).run_task, self.processes
+        else:
+            return self._run_task, self.thread_count
 
     def _run_task(self, task):
-        inputs = task['inputData']
+        # The response to a polled task, with the time spent in each step in 'timings' (which workers keep
+        # rather than send)
+        started = time.perf_counter()
+
+        # How many tasks read each output, if a Workflow said so (see shared_memory.SharedArrays); not an input
+        readers = task['inputData'].get(READERS_KEY)
+        if readers is not None:
+            task = dict(task, inputData={k: v for k, v in task['inputData'].items() if k != READERS_KEY})
+
+        inputs = self._decode_inputs(task)
+        timings = {'decode': time.perf_counter() - started}
+
+        try:
+            return self._respond(task, inputs, readers, timings)
+        finally:
+            # Gives back the referenced inputs, whether run() read them or the answer came from elsewhere
+            if isinstance(inputs, LazyInputs):
+                inputs.close()
+
+    def _respond(self, task, inputs, readers, timings):
+        cache = self.result_cache
+        if cache is not None:
+            # Keyed on the inputs as sent, so stored arrays are keyed by their references and aren't loaded
+            key = cache.key(self.name, self.version, task['inputData'])
+            response = cache.get(key)
+            if response is not None:
+                return self._timed(task, response, timings)
+
+        surrogate = self.surrogate
+        if surrogate is not None:
+            predicted = surrogate.predict(self.name, self.version, task['inputData'])
+            if predicted is not None:
+                started = time.perf_counter()
+                predicted = self._encode_outputs(predicted, readers)
+                timings['encode'] = time.perf_counter() - started
+
+                # Not cached, so the cache only ever holds real results
+                return self._timed(task, {'status': 'COMPLETED', 'output': predicted, 'logs': []}, timings)
+
         outputs = {k: None for k in self.outputs.keys()}
 
-        self.run(inputs, outputs)
+        started = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.call(self.name, self.run, inputs, outputs)
+        else:
+            self.run(inputs, outputs)
+        timings['run'] = time.perf_counter() - started
+
+        if surrogate is not None:
+            surrogate.add(self.name, self.version, task['inputData'], outputs)
 
-        return {
+        started = time.perf_counter()
+        outputs = self._encode_outputs(outputs, readers)
+        timings['encode'] = time.perf_counter() - started
+
+        response = {
             'status': 'COMPLETED',
             'output': outputs,
-            'logs': ['one', 'two']
+            'logs': []
         }
 
+        # Not if it refers to arrays that are removed once read
+        if cache is not None and cacheable(outputs):
+            cache.put(key, response)
+
+        return self._timed(task, response, timings)
+
+    def _decode_inputs(self, task):
+        # The inputs run() takes, from a polled task
+        return decode(task['inputData'])
+
+    def _encode_outputs(self, outputs, readers=None):
+        # What to send back for the outputs run() filled in
+        if self.payload_store is not None:
+            return self.payload_store.encode(outputs, readers)
+        return outputs
+
+    def _timed(self, task, response, timings):
+        response = dict(response, timings=timings)
+        if self.timing_logs:
+            response['logs'] = [format_timings(dict(timings, queue_wait=queue_wait(task)))]
+        return response
+
     def run(self, inputs, outputs):
         pass
 
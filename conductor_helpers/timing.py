@@ -0,0 +1,122 @@
+from __future__ import print_function
+from collections import deque
+import threading
+
+# Where a task's time goes in a worker, in order: waiting in the server's queue, turning its input into what
+# run() takes, run() itself, turning run()'s outputs into what is sent back, and sending them
+PHASES = ('queue_wait', 'decode', 'run', 'encode', 'update')
+
+# Upper bounds of the histogram buckets in seconds; a last bucket takes everything longer
+BUCKETS = (1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+
+def queue_wait(task):
+    # Time from the server scheduling a task to handing it to a worker, by the server's clock; None if unknown
+    if task.get('scheduledTime') and task.get('startTime'):
+        return max(0.0, (task['startTime'] - task['scheduledTime']) / 1000.0)
+    return None
+
+
+def format_timings(timings):
+    # One compact line for a task's logs, e.g. 'queue_wait=3.0ms decode=0.0ms run=12.5ms encode=0.0ms'
+    return ' '.join('{}={:.1f}ms'.format(phase, timings[phase] * 1000)
+                    for phase in PHASES if timings.get(phase) is not None)
+
+
+class RollingHistogram(object):
+    # Durations of the last window events, and the number of events ever added
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self._values = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self._values.append(seconds)
+
+    def summary(self):
+        ordered = sorted(self._values)
+        if not ordered:
+            return {'count': self.count}
+
+        buckets = [0] * (len(BUCKETS) + 1)
+        for value in ordered:
+            i = 0
+            while i < len(BUCKETS) and value > BUCKETS[i]:
+                i += 1
+            buckets[i] += 1
+
+        return {
+            'count': self.count,
+            'mean': sum(ordered) / len(ordered),
+            'p50': _percentile(ordered, 0.50),
+            'p95': _percentile(ordered, 0.95),
+            'p99': _percentile(ordered, 0.99),
+            'max': ordered[-1],
+            'buckets': buckets,
+        }
+
+
+class TaskTimings(object):
+    # Rolling histograms of each phase (see PHASES) per task type, over the last window tasks of the type.
+    #
+    # Task._run_task times decode, run and encode and returns them with its response, so they reach the worker
+    # even from another process (see process_pool.ProcessPool); the worker adds the queue wait and, once the
+    # result is sent, the update latency: the time from the result being ready to the server accepting it,
+    # including any wait for a batch to fill up.
+
+    def __init__(self, window=1000):
+        self.window = window
+
+        self._types = {}
+        self._lock = threading.Lock()
+
+    def record(self, task_type, phase, seconds):
+        if seconds is None:
+            return
+
+        with self._lock:
+            phases = self._types.get(task_type)
+            if phases is None:
+                phases = self._types[task_type] = {p: RollingHistogram(self.window) for p in PHASES}
+            phases[phase].add(seconds)
+
+    def record_response(self, task, response):
+        # The queue wait of a polled task, and the phases timed by the Task that ran it
+        task_type = task.get('taskType')
+        self.record(task_type, 'queue_wait', queue_wait(task))
+        for phase, seconds in (response.get('timings') or {}).items():
+            self.record(task_type, phase, seconds)
+
+    def summary(self, task_type=None):
+        # {task type: {phase: statistics in seconds}}, or the statistics of one task type
+        with self._lock:
+            summary = {t: {phase: h.summary() for phase, h in phases.items()} for t, phases in self._types.items()}
+
+        if task_type is not None:
+            return summary.get(task_type, {})
+        return summary
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+if __name__ == '__main__':
+    from sum_task import SumTask
+    import json
+    import time
+
+    t = SumTask('sum', num_inputs=2)
+    t.timing_logs = True
+
+    timings = TaskTimings()
+    now = int(time.time() * 1000)
+    for i in range(100):
+        task = {'taskType': t.name, 'inputData': {'i0': float(i), 'i1': 1.0}, 'scheduledTime': now - 5,
+                'startTime': now}
+        response = t._run_task(task)
+        timings.record_response(task, response)
+
+    print(response['logs'])
+    print(json.dumps(timings.summary(t.name), indent=2))
@@ -0,0 +1,229 @@
+from __future__ import print_function
+from client import client_context
+from concurrent.futures import ThreadPoolExecutor
+from polling import PollBackoff, PollMetrics
+from timing import TaskTimings
+import queue
+import socket
+import threading
+import time
+
+# How long the server may hold a poll open waiting for tasks, in ms (the server's own default)
+BATCH_POLL_TIMEOUT = 100
+
+# The longest wait between polls of an empty queue, in seconds (the fixed interval workers used to poll at)
+POLLING_INTERVAL = 0.1
+
+
+class Worker(object):
+    # Polls one or more task types and runs each on its own pool of thread_count threads.
+    #
+    # A single poller thread per task type feeds the pool. It only asks the server for work while fewer than
+    # max_in_flight tasks are held (polled but not yet updated), so a busy worker never acks tasks it can't
+    # start, and one slow run() no longer blocks the rest of the queue.
+    #
+    # The poller goes straight back to the server after finding work, and backs off exponentially (with
+    # jitter) up to polling_interval seconds while the queue is empty; see polling.PollBackoff. Polls go
+    # through the server's batch poll endpoint where it has one, which the server holds open for up to
+    # long_poll_timeout ms until a task arrives. By default that covers the whole polling interval, so an idle
+    # worker sends one poll per interval yet still picks up a new task as soon as it is queued; on servers
+    # without long polls a task waits at most polling_interval. Poll counts and pickup latency are kept in
+    # metrics, and where each task type's time goes (queue wait, run, update, ...) in timings; see
+    # timing.TaskTimings.
+    #
+    # With batch_size set, the poller asks for up to batch_size tasks in one request and acks them in one
+    # request, and results go back in batches as well: a finished task waits until batch_size results are
+    # ready or until it has waited update_delay seconds, whichever comes first. Servers without the batch
+    # endpoints get one call per task instead (see client.SessionTaskClient).
+
+    def __init__(self, endpoint, thread_count=1, polling_interval=POLLING_INTERVAL, max_in_flight=None,
+                 worker_id=None, batch_size=None, update_delay=0.05, long_poll_timeout=None):
+        # endpoint is a server URL or a client.ClientContext
+        self.context = client_context(endpoint)
+        self.task_client = self.context.task_client
+        self.thread_count = thread_count
+        self.polling_interval = polling_interval
+        if long_poll_timeout is None:
+            long_poll_timeout = max(BATCH_POLL_TIMEOUT, int(polling_interval * 1000))
+        self.long_poll_timeout = long_poll_timeout
+        self.worker_id = worker_id or socket.gethostname()
+
+        self.metrics = PollMetrics()
+        self.timings = TaskTimings()
+
+        self.batch_size = batch_size
+        self.update_delay = update_delay
+
+        # Finished tasks waiting to be sent still hold a slot, so leave room for a whole batch by default
+        self.max_in_flight = max_in_flight or max(thread_count, batch_size or 1)
+
+        self._updates = None
+        self._stopped = threading.Event()
+
+    def start(self, task_type, exec_function, wait=False, domain=None):
+        print('Polling for task {} at up to a {:.0f} ms interval with {} threads and up to {} tasks in flight'.format(
+            task_type, self.polling_interval * 1000, self.thread_count, self.max_in_flight))
+
+        executor = ThreadPoolExecutor(max_workers=self.thread_count)
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+
+        if self.batch_size:
+            self._start_updater()
+            poll_loop = self._batch_poll_loop
+        else:
+            poll_loop = self._poll_loop
+
+        thread = threading.Thread(target=poll_loop,
+                                  args=(task_type, exec_function, domain, executor, slots))
+        thread.daemon = True
+        thread.start()
+
+        if wait:
+            while True:
+                time.sleep(1)
+
+    def stop(self):
+        # Stop polling every task type; tasks already polled still run and are updated
+        self._stopped.set()
+
+    def _poll_loop(self, task_type, exec_function, domain, executor, slots):
+        backoff = PollBackoff(max_interval=self.polling_interval)
+
+        while not self._stopped.is_set():
+            slots.acquire()
+
+            started = time.time()
+            task = self._poll(task_type, domain)
+            if task is None:
+                slots.release()
+            else:
+                executor.submit(self._execute, task, exec_function, slots)
+
+            self._stopped.wait(backoff.delay(task is not None, time.time() - started))
+
+    def _batch_poll_loop(self, task_type, exec_function, domain, executor, slots):
+        backoff = PollBackoff(max_interval=self.polling_interval)
+
+        while not self._stopped.is_set():
+            # Wait for one free slot, then take every other free one, up to a full batch
+            slots.acquire()
+            count = 1
+            while count < self.batch_size and slots.acquire(False):
+                count += 1
+
+            started = time.time()
+            tasks = self._poll_batch(task_type, domain, count)
+            for i in range(count - len(tasks)):
+                slots.release()
+
+            for task in tasks:
+                executor.submit(self._execute, task, exec_function, slots)
+
+            self._stopped.wait(backoff.delay(len(tasks) > 0, time.time() - started))
+
+    def _poll(self, task_type, domain):
+        # A batch poll of one task, so the server can hold it open when the queue is empty
+        try:
+            polled = self.task_client.pollTasks(task_type, 1, self.long_poll_timeout, self.worker_id, domain)
+        except Exception as err:
+            print('Error while polling: ' + str(err))
+            self.metrics.record_error(task_type, err)
+            return None
+
+        self.metrics.record(task_type, polled)
+        if not polled:
+            return None
+        polled = polled[0]
+
+        # Several pollers may share the queue; only run the task if our ack was accepted
+        try:
+            acked = self.task_client.ackTask(polled['taskId'], self.worker_id)
+        except Exception as err:
+            print('Error acking task: ' + str(err))
+            acked = False
+
+        return polled if acked else None
+
+    def _poll_batch(self, task_type, domain, count):
+        try:
+            polled = self.task_client.pollTasks(task_type, count, self.long_poll_timeout, self.worker_id, domain)
+        except Exception as err:
+            print('Error while polling: ' + str(err))
+            self.metrics.record_error(task_type, err)
+            return []
+
+        self.metrics.record(task_type, polled)
+        if not polled:
+            return []
+
+        try:
+            acked = self.task_client.ackTasks([task['taskId'] for task in polled], self.worker_id)
+        except Exception as err:
+            print('Error acking tasks: ' + str(err))
+            return []
+
+        return [task for task in polled if acked.get(task['taskId'])]
+
+    def _execute(self, task, exec_function, slots):
+        try:
+            resp = exec_function(task)
+            task['status'] = resp['status']
+            task['outputData'] = resp['output']
+            task['logs'] = resp['logs']
+            self.timings.record_response(task, resp)
+        except Exception as err:
+            print('Error executing task: ' + str(err))
+            task['status'] = 'FAILED'
+            task['reasonForIncompletion'] = str(err)
+
+        if self.batch_size:
+            # The update thread sends the result, and frees the slot, with the next batch
+            self._updates.put((task, slots, time.time()))
+        else:
+            self._update([(task, slots, time.time())])
+
+    def _start_updater(self):
+        # One update thread serves every task type this worker polls
+        if self._updates is not None:
+            return
+
+        self._updates = queue.Queue()
+
+        thread = threading.Thread(target=self._update_loop)
+        thread.daemon = True
+        thread.start()
+
+    def _update_loop(self):
+        while True:
+            # The first result starts the clock; send when the batch is full or update_delay has passed
+            batch = [self._updates.get()]
+            deadline = time.time() + self.update_delay
+
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._updates.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._update(batch)
+
+    def _update(self, batch):
+        # batch is of (task, slot semaphore, time its result was ready)
+        tasks = [task for task, slots, finished in batch]
+        try:
+            if len(tasks) == 1:
+                self.task_client.updateTask(tasks[0])
+            else:
+                self.task_client.updateTasks(tasks)
+
+            now = time.time()
+            for task, slots, finished in batch:
+                self.timings.record(task.get('taskType'), 'update', now - finished)
+        except Exception as err:
+            print('Error updating task: ' + str(err))
+        finally:
+            for task, slots, finished in batch:
+                slots.release()
@@ -1,5 +1,67 @@
 from __future__ import print_function
-from conductor.conductor import MetadataClient, WorkflowClient
+from async_runtime import AsyncRuntime
+from client import client_context
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fused_task import FusedTask, port
+from local_executor import LocalExecutor
+from payload_store import READERS_KEY
+from polling import PollBackoff
+import hashlib
+import itertools
+import json
+import networkx as nx
+import time
+
+# Workflow statuses after which an execution won't change any more
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED', 'TIMED_OUT', 'TERMINATED')
+
+
+def definition_hash(definition):
+    return hashlib.sha256(json.dumps(definition, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _project(local, remote):
+    # The part of a server's copy of a definition that the local definition describes. The server fills in
+    # defaults and bookkeeping fields (createTime, retryCount, ...) that we never send, so those are left out.
+    if isinstance(local, dict) and isinstance(remote, dict):
+        return {k: _project(v, remote.get(k)) for k, v in local.items()}
+    if isinstance(local, list) and isinstance(remote, list) and len(local) == len(remote):
+        return [_project(l, r) for l, r in zip(local, remote)]
+    return remote
+
+
+def _unchanged(local, remote):
+    return remote is not None and definition_hash(local) == definition_hash(_project(local, remote))
+
+
+def sweep_cases(cases):
+    # Input dicts from a list or generator of them, or from a grid: a dict of lists of values per input, which is
+    # expanded to every combination
+    if isinstance(cases, dict):
+        names = list(cases.keys())
+        return (dict(zip(names, values)) for values in itertools.product(*[cases[name] for name in names]))
+    return iter(cases)
+
+
+def fused_name(members):
+    # A bounded task name for a group of fused tasks: its first member, how many there are and a hash of them all
+    digest = hashlib.sha1(','.join(members).encode('utf-8')).hexdigest()[:8]
+    return 'fused__{}__{}_{}'.format(members[0], len(members), digest)
+
+
+def _mergeable(graph, a, b):
+    # Whether merging the nodes of edge a -> b keeps the graph acyclic, i.e. there's no other path from a to b.
+    # There can't be if a has no other successor or b no other predecessor, which covers chains and trees
+    # without searching the graph.
+    if len(list(graph.successors(a))) == 1 or len(list(graph.predecessors(b))) == 1:
+        return True
+
+    graph.remove_edge(a, b)
+    try:
+        return not nx.has_path(graph, a, b)
+    finally:
+        graph.add_edge(a, b)
 
 
 class Workflow(object):
@@ -10,58 +72,109 @@ class Workflow(object):
 
         self.connections = {}
 
+        # Outputs as given to add_output, before they are turned into expressions
+        self._output_sources = {}
+
+        # Connections indexed by destination task: {task: {input: (source task or None, source expression)}}
+        self._task_inputs = {}
+
+        # Compiled definition, rebuilt after any change to the workflow
+        self._compiled = None
+
         self.name = name
         if description:
             self.description = description
         else:
             self.description = name
 
-    def add_task(self, name, task):
-        if 'name' in self.tasks:
+    def add_task(self, name, task, thread_count=None, max_in_flight=None, processes=None, batch_size=None):
+        if name in self.tasks:
             raise ValueError('A task with this name already exists')
 
+        # Optionally size the worker pool started for this task type
+        if thread_count is not None:
+            task.thread_count = thread_count
+        if max_in_flight is not None:
+            task.max_in_flight = max_in_flight
+        if processes is not None:
+            task.processes = processes
+        if batch_size is not None:
+            task.batch_size = batch_size
+
         self.tasks[name] = task
+        self._compiled = None
 
     def add_input(self, name, default):
         self.inputs[name] = default
+        self._compiled = None
 
     def add_output(self, name, src):
+        self.outputs[name] = self._source(src)[1]
+        self._output_sources[name] = src
+        self._compiled = None
+
+    def connect(self, src, dst):
+        self.connections[dst] = src
+
+        task_name, input = dst.split('.')
+        self._task_inputs.setdefault(task_name, {})[input] = self._source(src)
+        self._compiled = None
+
+    @staticmethod
+    def _source(src):
+        # (source task or None, expression) for a connection source
         if '.' in src:
             # Src comes from another task
             src_split = src.split('.')
-            source = '${{{}.output.{}}}'.format(src_split[0], src_split[1])
+            return src_split[0], '${{{}.output.{}}}'.format(src_split[0], src_split[1])
         else:
             # Src comes from a workflow input
-            source = '${{workflow.input.{}}}'.format(src)
+            return None, '${{workflow.input.{}}}'.format(src)
 
-        self.outputs[name] = source
+    def _definition(self):
+        # Compiled once and reused until the workflow changes; callers must not modify the result
+        if self._compiled is None:
+            self._compiled = self._compile()
+        return self._compiled
 
-    def connect(self, src, dst):
-        self.connections[dst] = src
+    def _compile(self):
+        readers = self._readers()
 
-    def _definition(self):
         # First, build tasks
-        tasks = []
+        task_defs = {}
         for task_name in self.tasks.keys():
             task = self._task_definition(task_name)
-            task['inputParameters'] = {}
+            task['inputParameters'] = {input: source for input, (source_task, source)
+                                       in self._task_inputs.get(task_name, {}).items()}
 
-            for dst, src in self.connections.items():
-                # If the destination is within this task, we link to the input
-                if dst.startswith(task_name + '.'):
-                    input = dst.split('.')[1]
+            # Stores that count the readers of each output are told how many tasks read it
+            if hasattr(self.tasks[task_name].payload_store, 'release'):
+                task['inputParameters'][READERS_KEY] = {k: readers.get((task_name, k), 0)
+                                                        for k in self.tasks[task_name].outputs.keys()}
 
-                    if '.' in src:
-                        # Src comes from another task
-                        src_split = src.split('.')
-                        source = '${{{}.output.{}}}'.format(src_split[0], src_split[1])
-                    else:
-                        # Src comes from a workflow input
-                        source = '${{workflow.input.{}}}'.format(src)
-
-                    task['inputParameters'][input] = source
+            task_defs[task_name] = task
 
-            tasks.append(task)
+        # Then lay them out by dependency level, running the tasks of each level in parallel
+        tasks = []
+        for i, level in enumerate(self._levels()):
+            if len(level) == 1:
+                tasks.append(task_defs[level[0]])
+                continue
+
+            fork_name = 'fork_level_{}'.format(i)
+            join_name = 'join_level_{}'.format(i)
+            tasks.append({
+                'name': fork_name,
+                'taskReferenceName': fork_name,
+                'type': 'FORK_JOIN',
+                'forkTasks': [[task_defs[task_name]] for task_name in level],
+            })
+            tasks.append({
+                'name': join_name,
+                'taskReferenceName': join_name,
+                'type': 'JOIN',
+                'joinOn': list(level),
+            })
 
         return {
             'name': self.name,
@@ -71,11 +184,154 @@ class Workflow(object):
             'outputParameters': self.outputs,
             'inputParameters': list(self.inputs.keys()),
             'failureWorkflow': 'cleanup_encode_resources',
-            'restarteable': True,
+            'restartable': True,
             'workflowStatusListenerEnabled': True,
             'schemaVersion': 2,
         }
 
+    def fused(self, max_cost=0.01, max_members=None):
+        # A copy of this workflow in which connected cheap tasks (see Task.cost) are merged into FusedTasks, each
+        # of at most max_members tasks. Tasks are only merged if the result still runs every task after the tasks
+        # it depends on. The outputs of the copy are the same; inside it, a member's ports are member__port.
+        #
+        # Only tasks annotated with a cost (or fusable) are ever merged: a task of unknown cost, like an
+        # OpenMdaoWrapper built without one, stays a task of its own.
+        graph = self._graph()
+        order = [n for n in nx.topological_sort(graph) if n in self.tasks]
+
+        def cheap(task_name):
+            task = self.tasks[task_name]
+            if task.fusable is not None:
+                return task.fusable
+            return task.cost is not None and task.cost <= max_cost
+
+        position = {task_name: i for i, task_name in enumerate(order)}
+        edges = sorted(((u, v) for u, v in graph.edges() if u in position and v in position),
+                       key=lambda e: (position[e[0]], position[e[1]]))
+
+        # Graph of the groups merged so far, each named after its first task
+        contracted = nx.DiGraph()
+        contracted.add_nodes_from(order)
+        contracted.add_edges_from(edges)
+
+        group = {task_name: task_name for task_name in order}
+        members = {task_name: [task_name] for task_name in order}
+
+        for src, dst in edges:
+            if not (cheap(src) and cheap(dst)):
+                continue
+
+            a, b = group[src], group[dst]
+            if a == b or (max_members is not None and len(members[a]) + len(members[b]) > max_members):
+                continue
+
+            if not _mergeable(contracted, a, b):
+                continue
+
+            for p in list(contracted.predecessors(b)):
+                if p != a:
+                    contracted.add_edge(p, a)
+            for s in list(contracted.successors(b)):
+                if s != a:
+                    contracted.add_edge(a, s)
+            contracted.remove_node(b)
+
+            for task_name in members[b]:
+                group[task_name] = a
+            members[a] += members.pop(b)
+
+        # Name each group (see fused_name), and give it its tasks in dependency order
+        names = {}
+        fused = {}
+        for g, names_in_group in members.items():
+            if len(names_in_group) > 1:
+                names_in_group = sorted(names_in_group, key=position.get)
+                names[g] = fused_name(names_in_group)
+                fused[g] = OrderedDict((n, self.tasks[n]) for n in names_in_group)
+
+        def source(src):
+            # A connection source, renamed if it's the output of a fused task
+            if '.' not in src:
+                return src
+            task_name, output = src.split('.')
+            g = group.get(task_name)
+            return '{}.{}'.format(names[g], port(task_name, output)) if g in names else src
+
+        workflow = Workflow(self.name, self.description)
+        for name, default in self.inputs.items():
+            workflow.add_input(name, default)
+
+        links = {g: {} for g in fused.keys()}
+        connections = []
+        for dst, src in self.connections.items():
+            task_name, input = dst.split('.')
+            g = group.get(task_name)
+            if g not in names:
+                connections.append((source(src), dst))
+            elif '.' in src and group.get(src.split('.')[0]) == g:
+                links[g][(task_name, input)] = tuple(src.split('.'))
+            else:
+                links[g][(task_name, input)] = None
+                connections.append((source(src), '{}.{}'.format(names[g], port(task_name, input))))
+
+        for task_name in self.tasks.keys():
+            g = group.get(task_name)
+            if g not in names:
+                workflow.add_task(task_name, self.tasks[task_name])
+            elif names[g] not in workflow.tasks:
+                workflow.add_task(names[g], FusedTask(names[g], fused[g], links[g]))
+
+        for src, dst in connections:
+            workflow.connect(src, dst)
+
+        for name, src in self._output_sources.items():
+            workflow.add_output(name, source(src))
+
+        return workflow
+
+    def _graph(self):
+        # Task dependency graph: an edge from each task to every task that uses one of its outputs
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.tasks.keys())
+
+        for task_name, inputs in self._task_inputs.items():
+            for source_task, source in inputs.values():
+                if source_task is not None:
+                    graph.add_edge(source_task, task_name)
+
+        return graph
+
+    def _readers(self):
+        # {(task, output): how many task inputs are connected to it}
+        readers = {}
+        for dst, src in self.connections.items():
+            if '.' in src:
+                source = tuple(src.split('.'))
+                readers[source] = readers.get(source, 0) + 1
+        return readers
+
+    def _levels(self):
+        # Each task's level is the length of the longest chain of tasks it depends on, so every task runs after
+        # all of its inputs are available and tasks on the same level are independent of each other
+        graph = self._graph()
+        if not nx.is_directed_acyclic_graph(graph):
+            raise ValueError('The connections between tasks form a cycle')
+
+        level = {}
+        for task_name in nx.topological_sort(graph):
+            level[task_name] = max([level[p] + 1 for p in graph.predecessors(task_name)] or [0])
+
+        # Keep the order tasks were added in within a level
+        levels = [[] for i in range(max(level.values()) + 1)] if level else []
+        for task_name in self.tasks.keys():
+            levels[level[task_name]].append(task_name)
+
+        return levels
+
+    def _all_tasks(self):
+        # Every task the server will schedule for an execution, including those of any sub workflows
+        return list(self.tasks.values())
+
     def _task_definition(self, task_name):
         return {
             'name': self.tasks[task_name].name,
@@ -84,46 +340,167 @@ class Workflow(object):
         }
 
     def register(self, endpoint='http://localhost:8080/api'):
-        mc = MetadataClient(endpoint)
+        mc = client_context(endpoint).metadata_client
         workflow_def = self._definition()
 
         # import json
         # print(json.dumps(workflow_def, indent=2))
 
+        # Nothing to send if the server already has this exact definition
+        try:
+            current = mc.getWorkflowDef(self.name, workflow_def['version'])
+        except Exception:
+            current = None
+
+        if _unchanged(workflow_def, current):
+            return False
+
         mc.updateWorkflowDefs([workflow_def])
+        return True
 
-    def start(self, start_tasks=False, wait=True):
-        wc = WorkflowClient('http://localhost:8080/api')
+    def start(self, start_tasks=False, wait=True, endpoint='http://localhost:8080/api', inputs=None):
+        # inputs, if given, override the workflow's default inputs for this execution
+        workflow_inputs = dict(self.inputs)
+        if inputs:
+            workflow_inputs.update(inputs)
+
+        wc = client_context(endpoint).workflow_client
         id = wc.startWorkflow(wfName=self.name,
-                              inputjson=self.inputs)
+                              inputjson=workflow_inputs)
         import json
         print(json.dumps(id, indent=2))
 
         if start_tasks:
-            for idx, key in enumerate(self.tasks.keys(), start=1):
-                if wait:
-                    # We will poll the workflow, so no need to keep the last task running.
-                    self.tasks[key].start(wait=False)
-                else:
-                    # We won't poll the workflow, so keep the last task running.
-                    self.tasks[key].start(wait=idx == len(self.tasks.keys()))
+            # One event loop serves every task type in the workflow
+            runtime = AsyncRuntime(endpoint)
+            for task in self._all_tasks():
+                runtime.register(task)
+
+            # If we won't poll the workflow, keep the workers running in the foreground.
+            runtime.start(wait=not wait)
 
         if wait:
-            import time
-            res = wc.getWorkflow(id)
-            while res['status'] != 'COMPLETED':
-                time.sleep(0.1)
-                res = wc.getWorkflow(id)
-
-            print(json.dumps(res['output'], indent=2))
-            return res['output']
+            output = self.wait(id, endpoint)
+            print(json.dumps(output, indent=2))
+            return output
         
         else:
             return id
 
-    def register_tasks(self):
-        for k, v in self.tasks.items():
-            v.register()
+    def wait(self, id, endpoint='http://localhost:8080/api'):
+        # The outputs of execution id once it has completed; checks often at first, then backs off for long runs
+        wc = client_context(endpoint).workflow_client
+        backoff = PollBackoff()
+
+        res = wc.getWorkflow(id, includeTasks=False)
+        while res['status'] not in TERMINAL_STATUSES:
+            time.sleep(backoff.delay(False))
+            res = wc.getWorkflow(id, includeTasks=False)
+
+        if res['status'] != 'COMPLETED':
+            raise RuntimeError('Workflow {} {}: {}'.format(id, res['status'], res.get('reasonForIncompletion')))
+
+        return res['output']
+
+    def sweep(self, cases, max_in_flight=32, endpoint='http://localhost:8080/api', threads=8, check_interval=0.1,
+              max_check_errors=3):
+        # Runs the workflow once per case (see sweep_cases) on the server, with at most max_in_flight executions
+        # running at once, and yields (case, status, output) for each as soon as it finishes. Each case's values
+        # override the workflow's default inputs. Executions are started and checked threads at a time over the
+        # server's shared session. Rounds of checks are at least check_interval seconds apart, and while they find
+        # nothing finished the wait backs off further (see polling.PollBackoff), so a long sweep makes few
+        # requests while it waits.
+        #
+        # A case that fails to start, or whose execution can't be checked max_check_errors times in a row, is
+        # yielded as FAILED with {'error': message} for its output, and the sweep carries on with the rest.
+        wc = client_context(endpoint).workflow_client
+        cases = sweep_cases(cases)
+
+        def start(case):
+            inputs = dict(self.inputs)
+            inputs.update(case)
+            try:
+                return wc.startWorkflow(wfName=self.name, inputjson=inputs), None
+            except Exception as err:
+                return None, err
+
+        def check(id):
+            try:
+                return wc.getWorkflow(id, includeTasks=False), None
+            except Exception as err:
+                return None, err
+
+        in_flight = OrderedDict()
+        check_errors = {}
+        backoff = PollBackoff(min_interval=check_interval)
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            while True:
+                new_cases = list(itertools.islice(cases, max_in_flight - len(in_flight)))
+                for (id, err), case in zip(executor.map(start, new_cases), new_cases):
+                    if err is None:
+                        in_flight[id] = case
+                    else:
+                        print('Error starting workflow: ' + str(err))
+                        yield case, 'FAILED', {'error': str(err)}
+
+                if not in_flight:
+                    if new_cases:
+                        # Every case of this round failed to start; go on with the next ones
+                        continue
+                    return
+
+                started = time.time()
+                finished = 0
+                ids = list(in_flight.keys())
+                for id, (res, err) in zip(ids, executor.map(check, ids)):
+                    if err is not None:
+                        check_errors[id] = check_errors.get(id, 0) + 1
+                        if check_errors[id] >= max_check_errors:
+                            print('Error checking workflow {}: {}'.format(id, err))
+                            del check_errors[id]
+                            finished += 1
+                            yield in_flight.pop(id), 'FAILED', {'error': str(err)}
+                        continue
+
+                    check_errors.pop(id, None)
+                    if res['status'] in TERMINAL_STATUSES:
+                        finished += 1
+                        yield in_flight.pop(id), res['status'], res.get('output')
+
+                delay = max(check_interval, backoff.delay(finished > 0)) - (time.time() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+    def batch(self, name=None):
+        # A workflow that runs this one once per design case in a single execution; see batch_workflow
+        from batch_workflow import BatchWorkflow
+        return BatchWorkflow(self, name)
+
+    def run_local(self, inputs=None, thread_count=None, processes=None):
+        # Runs the workflow in this process instead of on the server, and returns the same outputs as start()
+        return LocalExecutor(self, thread_count, processes).run(inputs)
+
+    def register_tasks(self, endpoint='http://localhost:8080/api'):
+        # One request for the definitions the server has, and at most one to register those that are new or changed
+        mc = client_context(endpoint).metadata_client
+
+        # Several steps may run the same task type
+        task_defs = OrderedDict()
+        for task in self._all_tasks():
+            task_defs[task.name] = task._definition()
+
+        try:
+            current = {task_def['name']: task_def for task_def in mc.getAllTaskDefs() or []}
+        except Exception as err:
+            print('Could not fetch task definitions, registering all of them: ' + str(err))
+            current = {}
+
+        changed = [task_def for name, task_def in task_defs.items() if not _unchanged(task_def, current.get(name))]
+        if changed:
+            mc.registerTaskDefs(changed)
+
+        return [task_def['name'] for task_def in changed]
 
 
 if __name__ == '__main__':
@@ -132,11 +509,12 @@ if __name__ == '__main__':
     from sum_task import SumTask
     from json import dumps
 
-    leo = OpenMdaoWrapper(VCircComp())
-    geo = OpenMdaoWrapper(VCircComp())
-    transfer = OpenMdaoWrapper(TransferOrbitComp())
-    dv1 = OpenMdaoWrapper(DeltaVComp())
-    dv2 = OpenMdaoWrapper(DeltaVComp())
+    # Each component takes microseconds, so Workflow.fused may merge them
+    leo = OpenMdaoWrapper(VCircComp(), cost=1e-4)
+    geo = OpenMdaoWrapper(VCircComp(), cost=1e-4)
+    transfer = OpenMdaoWrapper(TransferOrbitComp(), cost=1e-4)
+    dv1 = OpenMdaoWrapper(DeltaVComp(), cost=1e-4)
+    dv2 = OpenMdaoWrapper(DeltaVComp(), cost=1e-4)
 
     dv_total = SumTask('dv_total', num_inputs=2)
     dinc_total = SumTask('dinc_total', num_inputs=2)
@@ -144,7 +522,7 @@ if __name__ == '__main__':
     workflow = Workflow('Hohmann Transfer', 'A test for the Workflow class.')
     workflow.add_task('leo', leo)
     workflow.add_task('geo', geo)
-    workflow.add_task('transfer', transfer)
+    workflow.add_task('transfer', transfer, thread_count=2)
     workflow.add_task('dv1', dv1)
     workflow.add_task('dv2', dv2)
     workflow.add_task('dv_total', dv_total)
@@ -184,6 +562,14 @@ if __name__ == '__main__':
 
     # print(dumps(workflow._definition(), indent=2))
 
+    # Run it locally first, as a baseline for the run on the server
+    print(dumps(workflow.run_local(), indent=2))
+
+    # The same with the cheap tasks fused, which should give the same outputs from fewer tasks
+    fused = workflow.fused()
+    print(list(fused.tasks.keys()))
+    print(dumps(fused.run_local(), indent=2))
+
     workflow.register_tasks()
     workflow.register()
     workflow.start(start_tasks=True)
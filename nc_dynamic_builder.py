@@ -1,15 +1,19 @@
 from __future__ import print_function
-from conductor.ConductorWorker import ConductorWorker
 from conductor.conductor import MetadataClient, WorkflowClient
 import json
+import os
 import requests
 import math
+import sys
 from time import sleep
 from openmdao.api import Component
 
 from vahana_scripts.hover_power import HoverPower
 from vahana_scripts.cruise_power import CruisePower
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conductor_helpers'))
+from worker import Worker
+
 
 def define_as_task(component):
     ipd = component._init_params_dict
@@ -146,10 +150,10 @@ if __name__ == '__main__':
                      inputjson=defaults)
 
     # Start workers
-    cw = ConductorWorker('http://localhost:8080/api', 1, 0.1)
-    cw.start(taskType=hp_task_def['name'],
+    cw = Worker('http://localhost:8080/api', 1)
+    cw.start(task_type=hp_task_def['name'],
              exec_function=run_hoverpower_component,
              wait=False)
-    cw.start(taskType=cp_task_def['name'],
+    cw.start(task_type=cp_task_def['name'],
              exec_function=run_cruisepower_component,
              wait=True)
@@ -1,11 +1,15 @@
 from __future__ import print_function
-from conductor.ConductorWorker import ConductorWorker
 from conductor.conductor import MetadataClient, WorkflowClient
 import json
+import os
 import requests
 import math
+import sys
 from time import sleep
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conductor_helpers'))
+from worker import Worker
+
 
 def define_task():
     return {
@@ -217,8 +221,8 @@ def main():
     mc.registerTaskDefs([task_def])
 
     # Start worker
-    cw = ConductorWorker('http://localhost:8080/api', 1, 0.1)
-    cw.start(taskType=task_def['name'],
+    cw = Worker('http://localhost:8080/api', 1)
+    cw.start(task_type=task_def['name'],
              exec_function=hover_power,
              wait=False)
 
@@ -233,8 +237,8 @@ def main():
     # sleep(200)
 
     # Start worker
-    cw = ConductorWorker('http://localhost:8080/api', 1, 0.1)
-    cw.start(taskType=task_def['name'],
+    cw = Worker('http://localhost:8080/api', 1)
+    cw.start(task_type=task_def['name'],
              exec_function=hover_power,
              wait=True)
 
@@ -1,5 +1,9 @@
 from __future__ import print_function
-from conductor.ConductorWorker import ConductorWorker
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conductor_helpers'))
+from async_runtime import AsyncRuntime
 
 
 def execute(task):
@@ -19,13 +23,13 @@ def execute4(task):
 
 def main():
     print('Starting Kitchensink workflows')
-    cc = ConductorWorker('http://localhost:5000/api', 1, 0.1)
-    for x in range(1, 30):
+    runtime = AsyncRuntime('http://localhost:5000/api')
+    for x in range(1, 31):
         if (x == 4):
-            cc.start('task_{0}'.format(x), execute4, False)
+            runtime.register_function('task_{0}'.format(x), execute4)
         else:
-            cc.start('task_{0}'.format(x), execute, False)
-    cc.start('task_30', execute, True)
+            runtime.register_function('task_{0}'.format(x), execute)
+    runtime.start(wait=True)
 
 
 if __name__ == '__main__':
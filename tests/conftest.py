@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The helpers import each other as top-level modules, as the scripts in the repo root run them
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, 'conductor_helpers'))
+sys.path.insert(0, os.path.join(root, 'vahana_scripts'))
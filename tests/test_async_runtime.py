@@ -0,0 +1,141 @@
+from async_runtime import AsyncRuntime
+from emulator import Emulator
+from sum_task import SumTask
+import asyncio
+import pytest
+import time
+
+
+@pytest.fixture
+def emulator():
+    emulator = Emulator().start()
+    yield emulator
+    emulator.stop()
+
+
+def queue(emulator, task_type, count):
+    for i in range(count):
+        emulator.add_task(task_type, {'i0': float(i), 'i1': 1.0})
+
+
+def check_sums(emulator):
+    for task in emulator.completed.values():
+        assert task['status'] == 'COMPLETED'
+        assert task['outputData']['sum'] == task['inputData']['i0'] + task['inputData']['i1']
+
+
+def test_serves_many_task_types(emulator):
+    runtime = AsyncRuntime(emulator.endpoint, polling_interval=0.01)
+    for name in ['a', 'b', 'c']:
+        runtime.register(SumTask(name, thread_count=2))
+    for name in ['a', 'b']:
+        queue(emulator, name, 10)
+
+    runtime.start()
+    try:
+        assert emulator.wait(20)
+    finally:
+        runtime.stop()
+    check_sums(emulator)
+
+    # Queue depths are fetched for every type at once, and only types with work are polled
+    assert emulator.requests['queue_sizes'] > 0
+    assert emulator.requests['poll'] == 20
+    summary = runtime.metrics.summary()
+    assert summary['a']['tasks'] == summary['b']['tasks'] == 10
+    assert 'c' not in summary
+
+
+def test_batches():
+    emulator = Emulator(batching=True).start()
+    runtime = AsyncRuntime(emulator.endpoint, polling_interval=0.01)
+    runtime.register(SumTask('sum', thread_count=4, batch_size=10))
+    queue(emulator, 'sum', 50)
+
+    runtime.start()
+    try:
+        assert emulator.wait(50)
+    finally:
+        runtime.stop()
+        emulator.stop()
+    check_sums(emulator)
+
+    assert emulator.requests['poll'] == 0
+    assert emulator.requests['poll_batch'] <= 10
+    assert emulator.requests['update_batch'] > 0
+
+
+def test_awaits_coroutine_functions(emulator):
+    async def run(task):
+        await asyncio.sleep(0.01)
+        return {'status': 'COMPLETED', 'output': {'doubled': 2 * task['inputData']['x']}, 'logs': []}
+
+    runtime = AsyncRuntime(emulator.endpoint, polling_interval=0.01)
+    runtime.register_function('double', run, max_in_flight=5)
+    for x in range(5):
+        emulator.add_task('double', {'x': x})
+
+    runtime.start()
+    try:
+        assert emulator.wait(5)
+    finally:
+        runtime.stop()
+
+    assert sorted(t['outputData']['doubled'] for t in emulator.completed.values()) == [0, 2, 4, 6, 8]
+
+
+def test_without_queue_sizes():
+    emulator = Emulator(error_rate={'queue_sizes': 1.0}).start()
+    runtime = AsyncRuntime(emulator.endpoint, polling_interval=0.01)
+    runtime.register(SumTask('sum'))
+    queue(emulator, 'sum', 5)
+
+    runtime.start()
+    try:
+        assert emulator.wait(5)
+    finally:
+        runtime.stop()
+        emulator.stop()
+    check_sums(emulator)
+
+    assert not runtime._queue_sizes_supported
+    assert emulator.requests['queue_sizes'] == 1
+
+
+def test_stop_finishes_running_tasks(emulator):
+    class Slow(SumTask):
+        def run(self, inputs, outputs):
+            time.sleep(0.3)
+            super(Slow, self).run(inputs, outputs)
+
+    runtime = AsyncRuntime(emulator.endpoint, polling_interval=0.01)
+    runtime.register(Slow('slow', thread_count=3))
+    queue(emulator, 'slow', 3)
+
+    runtime.start()
+    end = time.time() + 5
+    while sum(1 for t in emulator.tasks.values() if t['status'] == 'IN_PROGRESS') < 3 and time.time() < end:
+        time.sleep(0.01)
+    runtime.stop()
+
+    assert emulator.wait(3, timeout=5)
+    check_sums(emulator)
+
+
+def test_poll_errors_are_counted():
+    emulator = Emulator(error_rate={'poll': 1.0}).start()
+    runtime = AsyncRuntime(emulator.endpoint, polling_interval=0.01)
+    runtime.register(SumTask('sum'))
+    queue(emulator, 'sum', 1)
+
+    runtime.start()
+    try:
+        time.sleep(0.3)
+    finally:
+        runtime.stop()
+        emulator.stop()
+
+    summary = runtime.metrics.summary()['sum']
+    assert summary['errors'] == summary['polls'] > 0
+    assert summary['empty_polls'] == 0
+    assert '500' in summary['last_error']
@@ -0,0 +1,137 @@
+from client import ClientContext
+from emulator import Emulator
+import pytest
+import requests
+
+
+@pytest.fixture
+def emulator():
+    emulator = Emulator(batching=True).start()
+    yield emulator
+    emulator.stop()
+
+
+def method_not_allowed(emulator):
+    # Answer 405 to the batch endpoints, like a server that has the path for another method only
+    handler = emulator._server.RequestHandlerClass
+
+    class Handler(handler):
+        def _dispatch(self, method):
+            if '/batch' in self.path:
+                # The body is read first, so the connection can carry the next request
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                return self._send(405, 'Method not allowed')
+            return handler._dispatch(self, method)
+
+    emulator._server.RequestHandlerClass = Handler
+
+
+def task_client(emulator):
+    return ClientContext(emulator.endpoint).task_client
+
+
+def queue(emulator, count):
+    return [emulator.add_task('sum', {'i0': float(i)}) for i in range(count)]
+
+
+def test_batch_poll_ack_update(emulator):
+    task_ids = queue(emulator, 5)
+    tc = task_client(emulator)
+
+    tasks = tc.pollTasks('sum', 3, 100, 'worker')
+    assert [t['taskId'] for t in tasks] == task_ids[:3]
+    assert tc.ackTasks([t['taskId'] for t in tasks], 'worker') == {t['taskId']: True for t in tasks}
+
+    tc.updateTasks([{'taskId': t['taskId'], 'workflowInstanceId': None, 'status': 'COMPLETED',
+                     'outputData': {'sum': 1.0}} for t in tasks])
+    assert list(emulator.completed.keys()) == task_ids[:3]
+
+    assert emulator.requests['poll_batch'] == 1
+    assert emulator.requests['ack_batch'] == 1
+    assert emulator.requests['update_batch'] == 1
+    assert emulator.requests['poll'] == emulator.requests['ack'] == emulator.requests['update'] == 0
+    assert tc.batch_poll_supported and tc.batch_ack_supported and tc.batch_update_supported
+
+
+def test_batch_poll_of_empty_queue(emulator):
+    tc = task_client(emulator)
+    assert tc.pollTasks('sum', 3, 10, 'worker') == []
+    assert tc.batch_poll_supported
+
+
+@pytest.mark.parametrize('unsupported', ['404', '405'])
+def test_fallback_to_single_calls(unsupported):
+    if unsupported == '404':
+        emulator = Emulator(batch_poll=False).start()
+    else:
+        emulator = Emulator(batching=True).start()
+        method_not_allowed(emulator)
+
+    try:
+        task_ids = queue(emulator, 5)
+        tc = task_client(emulator)
+
+        tasks = tc.pollTasks('sum', 3, 100, 'worker')
+        assert [t['taskId'] for t in tasks] == task_ids[:3]
+        assert tc.ackTasks([t['taskId'] for t in tasks], 'worker') == {t['taskId']: True for t in tasks}
+        tc.updateTasks([{'taskId': t['taskId'], 'workflowInstanceId': None, 'status': 'COMPLETED',
+                         'outputData': {}} for t in tasks])
+
+        assert not (tc.batch_poll_supported or tc.batch_ack_supported or tc.batch_update_supported)
+        assert list(emulator.completed.keys()) == task_ids[:3]
+        assert emulator.requests['poll'] == 3
+        assert emulator.requests['ack'] == 3
+        assert emulator.requests['update'] == 3
+
+        # Once fallen back, the batch endpoints aren't tried again
+        assert len(tc.pollTasks('sum', 5, 100, 'worker')) == 2
+        assert emulator.requests['poll'] == 6
+    finally:
+        emulator.stop()
+
+
+def test_other_errors_are_raised():
+    emulator = Emulator(error_rate={'poll_batch': 1.0}).start()
+    try:
+        tc = task_client(emulator)
+        with pytest.raises(Exception):
+            tc.pollTasks('sum', 3, 100, 'worker')
+        assert tc.batch_poll_supported
+    finally:
+        emulator.stop()
+
+
+def test_stock_server():
+    # Batch polls, single acks and updates
+    emulator = Emulator().start()
+    try:
+        task_ids = queue(emulator, 3)
+        tc = task_client(emulator)
+
+        tasks = tc.pollTasks('sum', 3, 100, 'worker')
+        tc.ackTasks([t['taskId'] for t in tasks], 'worker')
+        tc.updateTasks([{'taskId': t['taskId'], 'workflowInstanceId': None, 'status': 'COMPLETED',
+                         'outputData': {}} for t in tasks])
+
+        assert list(emulator.completed.keys()) == task_ids
+        assert tc.batch_poll_supported
+        assert not (tc.batch_ack_supported or tc.batch_update_supported)
+        assert emulator.requests['poll_batch'] == 1
+        assert emulator.requests['ack'] == emulator.requests['update'] == 3
+    finally:
+        emulator.stop()
+
+
+@pytest.mark.parametrize('batch_poll_supported', [True, False])
+def test_dead_server_is_an_error(batch_poll_supported):
+    emulator = Emulator().start()
+    emulator.stop()
+
+    # A new client, as connections kept alive from before would still be served
+    tc = task_client(emulator)
+    tc.batch_poll_supported = batch_poll_supported
+    with pytest.raises(requests.ConnectionError):
+        tc.pollTasks('sum', 3, 10, 'worker')
+    with pytest.raises(requests.ConnectionError):
+        tc.pollTask('sum', 'worker')
+    assert tc.batch_poll_supported == batch_poll_supported
@@ -0,0 +1,83 @@
+from async_runtime import AsyncRuntime
+from batch_workflow import CaseFanOut, case_reference
+from emulator import Emulator
+from sum_task import SumTask
+from workflow import Workflow
+import pytest
+
+
+class PositiveSum(SumTask):
+    def run(self, inputs, outputs):
+        if inputs['i0'] < 0:
+            raise ValueError('negative input')
+        super(PositiveSum, self).run(inputs, outputs)
+
+
+@pytest.fixture
+def emulator():
+    emulator = Emulator().start()
+    yield emulator
+    emulator.stop()
+
+
+def total():
+    workflow = Workflow('total')
+    workflow.add_input('x', 1.0)
+    workflow.add_input('y', 2.0)
+    workflow.add_task('total', PositiveSum('total', num_inputs=2))
+    workflow.connect('x', 'total.i0')
+    workflow.connect('y', 'total.i1')
+    workflow.add_output('total', 'total.sum')
+    return workflow
+
+
+def run(batch, emulator, cases):
+    batch.register_tasks(emulator.endpoint)
+    batch.register(emulator.endpoint)
+
+    runtime = AsyncRuntime(emulator.endpoint, polling_interval=0.01)
+    for task in batch._all_tasks():
+        runtime.register(task)
+
+    runtime.start()
+    try:
+        return batch.run(cases, endpoint=emulator.endpoint)
+    finally:
+        runtime.stop()
+
+
+def test_fan_out():
+    outputs = {}
+    CaseFanOut().run({'workflow': 'total', 'version': 2, 'defaults': {'x': 1.0, 'y': 2.0},
+                      'cases': [{'x': 5.0}, {'y': 7.0}]}, outputs)
+
+    assert [t['taskReferenceName'] for t in outputs['dynamicTasks']] == [case_reference(0), case_reference(1)]
+    assert outputs['dynamicTasks'][0]['type'] == 'SUB_WORKFLOW'
+    assert outputs['dynamicTasks'][0]['subWorkflowParam'] == {'name': 'total', 'version': 2}
+    assert outputs['dynamicTasks'][0]['optional']
+    assert outputs['inputs'] == {case_reference(0): {'x': 5.0, 'y': 2.0}, case_reference(1): {'x': 1.0, 'y': 7.0}}
+
+
+def test_runs_every_case_in_one_execution(emulator):
+    batch = total().batch()
+    cases = {'x': [1.0, 2.0, 3.0], 'y': [10.0, 20.0]}
+
+    results = run(batch, emulator, cases)
+    assert results == batch.run_local(cases)
+    assert results[0] == {'total': 11.0}
+
+    # One start and one execution per case
+    assert emulator.requests['start_workflow'] == 1
+    assert len(emulator.workflows) == 7
+
+
+def test_failed_case_leaves_a_gap(emulator):
+    results = run(total().batch(), emulator, [{'x': 1.0}, {'x': -1.0}, {'x': 3.0}])
+    assert results == [{'total': 3.0}, None, {'total': 5.0}]
+
+
+def test_register_sends_the_case_workflow_first(emulator):
+    batch = total().batch()
+    assert batch.register(emulator.endpoint)
+    assert set(emulator.workflow_defs.keys()) == {('total', 1), ('total batch', 1)}
+    assert not batch.register(emulator.endpoint)
@@ -0,0 +1,67 @@
+from client import ClientContext, client_context
+from emulator import Emulator
+from sum_task import SumTask
+from workflow import Workflow
+import pytest
+import requests
+
+
+@pytest.fixture
+def emulator():
+    emulator = Emulator().start()
+    yield emulator
+    emulator.stop()
+
+
+def test_one_context_per_server():
+    context = client_context('http://localhost:1/api')
+    assert client_context('http://localhost:1/api') is context
+    assert client_context('http://localhost:2/api') is not context
+
+    own = ClientContext('http://localhost:1/api')
+    assert client_context(own) is own
+
+
+def test_clients_share_connections(emulator):
+    context = ClientContext(emulator.endpoint)
+    task = SumTask('sum')
+
+    task.register(context)
+    for i in range(10):
+        context.metadata_client.getAllTaskDefs()
+        context.task_client.pollTasks('sum', 1, 0, 'worker')
+        emulator.add_task('sum', {})
+    context.task_client.getTaskQueueSizes(['sum'])
+
+    stats = context.stats()
+    assert stats == {'requests': 22, 'connections': 1, 'reused': 21}
+    assert sum(emulator.requests.values()) == 22
+
+
+def test_workflow_and_worker_use_the_given_context(emulator):
+    context = ClientContext(emulator.endpoint)
+    workflow = Workflow('sum')
+    workflow.add_task('sum', SumTask('sum'))
+
+    workflow.register_tasks(context)
+    workflow.register(context)
+    workflow.start(wait=False, endpoint=context)
+    worker = workflow.tasks['sum'].start(context)
+    try:
+        assert emulator.wait(1)
+    finally:
+        worker.stop()
+
+    assert worker.task_client is context.task_client
+    assert context.stats()['requests'] == sum(emulator.requests.values())
+    assert context.stats()['connections'] <= 2
+
+
+def test_read_timeout():
+    emulator = Emulator(latency={'get_task_defs': 0.5}).start()
+    try:
+        context = ClientContext(emulator.endpoint, read_timeout=0.05)
+        with pytest.raises(requests.Timeout):
+            context.metadata_client.getAllTaskDefs()
+    finally:
+        emulator.stop()
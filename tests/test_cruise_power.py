@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+from cruise_power import CruisePower, lambda_residual, solve_lambda
+import numpy as np
+import pickle
+import pytest
+
+
+def solve(component, params):
+    unknowns = {k: v['val'] for k, v in component._init_unknowns_dict.items()}
+    component.solve_nonlinear(params, unknowns, {})
+    return unknowns
+
+
+def random_params(n, vehicles=('helicopter', 'tiltwing')):
+    rng = np.random.RandomState(0)
+    return {
+        'Vehicle': rng.choice(list(vehicles), n),
+        'rProp': rng.uniform(0.8, 2.5, n),
+        'V': rng.uniform(10.0, 90.0, n),
+        'W': rng.uniform(1000.0, 4000.0, n),
+    }
+
+
+def test_batch_matches_scalar():
+    # The scalar path runs five Newton steps, the batch path runs to LAMBDA_TOL; both are converged
+    params = random_params(200)
+    batch = CruisePower().solve_batch(params)
+
+    for i in range(200):
+        unknowns = solve(CruisePower(), {k: v[i] for k, v in params.items()})
+        for k, value in unknowns.items():
+            assert batch[k][i] == pytest.approx(value, rel=1e-12, abs=0.0), k
+
+    helicopter = params['Vehicle'] == 'helicopter'
+    assert batch['lambda_converged'].all()
+    assert (batch['lambda_iterations'][helicopter] > 0).all()
+    assert (batch['lambda_iterations'][~helicopter] == 0).all()
+
+
+def test_one_vehicle_per_point_with_scalar_params():
+    batch = CruisePower().solve_batch({'Vehicle': ['tiltwing', 'helicopter'], 'rProp': 1.4, 'V': 50.0, 'W': 2000.0})
+
+    for i, vehicle in enumerate(['tiltwing', 'helicopter']):
+        unknowns = solve(CruisePower(), {'Vehicle': vehicle, 'rProp': 1.4, 'V': 50.0, 'W': 2000.0})
+        assert batch['PBattery'][i] == pytest.approx(unknowns['PBattery'], rel=1e-12)
+
+
+def test_solve_lambda_converges():
+    params = random_params(200, ['helicopter'])
+    batch = CruisePower().solve_batch(params)
+    mu, alpha, Ct = batch['mu'], batch['alpha'], batch['Ct']
+
+    lam, iterations, converged = solve_lambda(mu, alpha, Ct, tol=1e-14)
+    assert converged.all()
+    assert (np.abs(lambda_residual(lam, mu, alpha, Ct)) <= 1e-14).all()
+    assert (iterations <= 5).all()
+
+    # Seeded with the answer, nothing is left to do
+    seeded, iterations, converged = solve_lambda(mu, alpha, Ct, lam=lam)
+    assert (iterations == 0).all()
+    assert (seeded == lam).all()
+
+    # Too few steps from a poor seed are reported, not hidden
+    lam, iterations, converged = solve_lambda(mu, alpha, Ct, lam=np.zeros_like(mu), maxiter=1)
+    assert not converged.any()
+    assert (iterations == 1).all()
+
+
+def test_warm_start_converges_to_the_same_lambda():
+    cold = CruisePower()
+    warm = CruisePower(warm_start=True)
+    for V in np.linspace(20.0, 80.0, 61):
+        params = {'Vehicle': 'helicopter', 'rProp': 1.4, 'V': V, 'W': 2000.0}
+        assert solve(warm, params)['lambda'] == pytest.approx(solve(cold, params)['lambda'], rel=1e-12)
+
+    stats = warm.lambda_stats
+    assert stats['solves'] == 61
+    assert stats['warm_starts'] > 0
+    assert stats['iterations'] < 61 * 5
+
+
+def test_warm_start_from_many_threads():
+    component = CruisePower(warm_start=True, store_size=16)
+    params = random_params(400, ['helicopter'])
+    batch = CruisePower().solve_batch(params)
+
+    def solve_slice(i):
+        s = slice(i, i + 10)
+        return component.solve_lambda(batch['mu'][s], batch['alpha'][s], batch['Ct'][s])[0]
+
+    with ThreadPoolExecutor(8) as executor:
+        lam = np.concatenate(list(executor.map(solve_slice, range(0, 400, 10))))
+
+    assert lam == pytest.approx(batch['lambda'], rel=1e-12)
+    assert component.lambda_stats['solves'] == 400
+    assert len(component.lambda_store.keys) == len(component.lambda_store) == 16
+
+
+def test_warm_start_survives_pickling():
+    component = CruisePower(warm_start=True)
+    solve(component, {'Vehicle': 'helicopter', 'rProp': 1.4, 'V': 50.0, 'W': 2000.0})
+
+    copy = pickle.loads(pickle.dumps(component.lambda_store))
+    assert len(copy) == 1
+    assert copy.lock.acquire(False)
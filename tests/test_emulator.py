@@ -0,0 +1,197 @@
+from client import ClientContext
+from emulator import Emulator
+import pytest
+import threading
+import time
+
+
+@pytest.fixture
+def emulator():
+    emulator = Emulator().start()
+    yield emulator
+    emulator.stop()
+
+
+def simple(name, **inputs):
+    return {'name': name, 'taskReferenceName': name, 'type': 'SIMPLE', 'inputParameters': inputs}
+
+
+def register(context, name, tasks, outputs=None):
+    context.metadata_client.updateWorkflowDefs([{'name': name, 'version': 1, 'tasks': tasks,
+                                                 'outputParameters': outputs or {}}])
+
+
+def scheduled(emulator):
+    return sorted(t['taskType'] for t in emulator.tasks.values() if t['status'] == 'SCHEDULED')
+
+
+def finish(context, task_type, status='COMPLETED', **outputs):
+    # Polls one task of task_type and answers it as a worker would
+    task = context.task_client.pollForTask(task_type, 'worker')
+    assert task is not None
+    context.task_client.updateTask({'taskId': task['taskId'], 'workflowInstanceId': task['workflowInstanceId'],
+                                    'status': status, 'outputData': outputs})
+    return task
+
+
+def test_fork_join(emulator):
+    context = ClientContext(emulator.endpoint)
+    register(context, 'fork', [
+        {'name': 'fork', 'taskReferenceName': 'fork', 'type': 'FORK_JOIN',
+         'forkTasks': [[simple('a', x='${workflow.input.x}')], [simple('b')]]},
+        {'name': 'join', 'taskReferenceName': 'join', 'type': 'JOIN', 'joinOn': ['a', 'b']},
+        simple('c', a='${a.output.y}', b='${b.output.y}'),
+    ], {'c': '${c.output.y}', 'joined': '${join.output}'})
+
+    id = context.workflow_client.startWorkflow('fork', {'x': 1})
+    assert scheduled(emulator) == ['a', 'b']
+
+    assert finish(context, 'a', y=2)['inputData'] == {'x': 1}
+    assert scheduled(emulator) == ['b']
+
+    finish(context, 'b', y=3)
+    assert finish(context, 'c', y=5)['inputData'] == {'a': 2, 'b': 3}
+
+    workflow = context.workflow_client.getWorkflow(id)
+    assert workflow['status'] == 'COMPLETED'
+    assert workflow['output'] == {'c': 5, 'joined': {'a': {'y': 2}, 'b': {'y': 3}}}
+    assert [t['referenceTaskName'] for t in workflow['tasks']] == ['fork', 'a', 'b', 'join', 'c']
+
+
+def test_failed_task_fails_its_workflow(emulator):
+    context = ClientContext(emulator.endpoint)
+    register(context, 'fork', [
+        {'name': 'fork', 'taskReferenceName': 'fork', 'type': 'FORK_JOIN',
+         'forkTasks': [[simple('a')], [simple('b')]]},
+        {'name': 'join', 'taskReferenceName': 'join', 'type': 'JOIN', 'joinOn': ['a', 'b']},
+    ])
+
+    id = context.workflow_client.startWorkflow('fork', {})
+    finish(context, 'a', status='FAILED')
+
+    workflow = context.workflow_client.getWorkflow(id)
+    assert workflow['status'] == 'FAILED'
+    assert 'Task a failed' in workflow['reasonForIncompletion']
+
+    # Nothing else of the workflow is handed out
+    assert {t['referenceTaskName']: t['status'] for t in workflow['tasks']}['b'] == 'CANCELED'
+    assert context.task_client.pollForTask('b', 'worker') is None
+
+
+def test_dynamic_fork_of_sub_workflows(emulator):
+    context = ClientContext(emulator.endpoint)
+    register(context, 'child', [simple('double', x='${workflow.input.x}')], {'y': '${double.output.y}'})
+    register(context, 'parent', [
+        simple('fan_out'),
+        {'name': 'fork', 'taskReferenceName': 'fork', 'type': 'FORK_JOIN_DYNAMIC',
+         'dynamicForkTasksParam': 'tasks', 'dynamicForkTasksInputParamName': 'inputs',
+         'inputParameters': {'tasks': '${fan_out.output.tasks}', 'inputs': '${fan_out.output.inputs}'}},
+        {'name': 'join', 'taskReferenceName': 'join', 'type': 'JOIN'},
+    ], {'results': '${join.output}'})
+
+    id = context.workflow_client.startWorkflow('parent', {})
+    refs = ['case_0', 'case_1', 'case_2']
+    finish(context, 'fan_out',
+           tasks=[{'name': 'child', 'taskReferenceName': ref, 'type': 'SUB_WORKFLOW',
+                   'subWorkflowParam': {'name': 'child'}, 'optional': ref == 'case_2'} for ref in refs],
+           inputs={ref: {'x': i} for i, ref in enumerate(refs)})
+
+    # One child execution per case, each with its own task
+    assert len(emulator.workflows) == 4
+    assert scheduled(emulator) == ['double'] * 3
+
+    for i in range(3):
+        task = context.task_client.pollForTask('double', 'worker')
+        x = task['inputData']['x']
+        context.task_client.updateTask({'taskId': task['taskId'], 'workflowInstanceId': task['workflowInstanceId'],
+                                        'status': 'FAILED' if x == 2 else 'COMPLETED', 'outputData': {'y': 2 * x}})
+
+    # The optional case failed without failing the parent
+    workflow = context.workflow_client.getWorkflow(id)
+    assert workflow['status'] == 'COMPLETED'
+    results = workflow['output']['results']
+    assert [results[ref].get('y') for ref in refs] == [0, 2, None]
+    assert {w['status'] for w in emulator.workflows.values() if w.get('parentWorkflowId') == id} == \
+        {'COMPLETED', 'FAILED'}
+
+
+def test_failed_sub_workflow_fails_its_parent(emulator):
+    context = ClientContext(emulator.endpoint)
+    register(context, 'child', [simple('a')])
+    register(context, 'parent', [{'name': 'child', 'taskReferenceName': 'child', 'type': 'SUB_WORKFLOW',
+                                  'subWorkflowParam': {'name': 'child'}}])
+
+    id = context.workflow_client.startWorkflow('parent', {})
+    finish(context, 'a', status='FAILED')
+    assert context.workflow_client.getWorkflow(id)['status'] == 'FAILED'
+
+
+def test_terminate(emulator):
+    context = ClientContext(emulator.endpoint)
+    register(context, 'one', [simple('a')])
+
+    id = context.workflow_client.startWorkflow('one', {})
+    context.workflow_client.terminateWorkflow(id, 'no longer needed')
+
+    workflow = context.workflow_client.getWorkflow(id)
+    assert workflow['status'] == 'TERMINATED'
+    assert workflow['reasonForIncompletion'] == 'no longer needed'
+    assert context.task_client.pollForTask('a', 'worker') is None
+
+
+def test_unanswered_task_is_queued_again():
+    emulator = Emulator(response_timeout=0.1).start()
+    try:
+        context = ClientContext(emulator.endpoint)
+        task_id = emulator.add_task('a', {})
+
+        assert context.task_client.pollForTask('a', 'lost')['taskId'] == task_id
+        assert context.task_client.pollForTask('a', 'worker') is None
+
+        time.sleep(0.2)
+        task = context.task_client.pollForTask('a', 'worker')
+        assert task['taskId'] == task_id
+        assert task['retried'] == 1
+
+        # Only the worker holding it now can ack it
+        assert not context.task_client.ackTask(task_id, 'lost')
+        assert context.task_client.ackTask(task_id, 'worker')
+    finally:
+        emulator.stop()
+
+
+def test_latency_and_errors_by_endpoint():
+    emulator = Emulator(latency={'queue_sizes': 0.1}, error_rate={'poll': 0.5}, seed=1).start()
+    try:
+        context = ClientContext(emulator.endpoint)
+
+        started = time.time()
+        context.task_client.getTaskQueueSizes(['a'])
+        assert time.time() - started >= 0.1
+
+        started = time.time()
+        for i in range(20):
+            context.task_client.pollForTask('a', 'worker')
+        assert time.time() - started < 0.1
+    finally:
+        emulator.stop()
+
+    assert emulator.requests['poll'] == 20
+    assert 0 < emulator.errors['poll'] < 20
+    assert not emulator.errors['queue_sizes']
+
+
+def test_batch_poll_waits_for_a_task(emulator):
+    context = ClientContext(emulator.endpoint)
+    timer = threading.Timer(0.1, emulator.add_task, ['a', {}])
+    timer.start()
+
+    started = time.time()
+    tasks = context.task_client.pollTasks('a', 2, 1000, 'worker')
+    assert len(tasks) == 1
+    assert 0.05 < time.time() - started < 0.5
+
+    # An empty queue is held open for the whole timeout
+    started = time.time()
+    assert context.task_client.pollTasks('a', 2, 100, 'worker') == []
+    assert time.time() - started >= 0.1
@@ -0,0 +1,37 @@
+from sum_task import SumTask
+from workflow import Workflow, fused_name
+
+
+def chain(length):
+    # x -> t0 -> t1 -> ... , each adding y
+    workflow = Workflow('chain')
+    workflow.add_input('x', 1.0)
+    workflow.add_input('y', 2.0)
+    for i in range(length):
+        name = 't{}'.format(i)
+        workflow.add_task(name, SumTask(name, num_inputs=2))
+        workflow.connect('x' if i == 0 else 't{}.sum'.format(i - 1), name + '.i0')
+        workflow.connect('y', name + '.i1')
+    workflow.add_output('total', 't{}.sum'.format(length - 1))
+    return workflow
+
+
+def test_fused_name_is_bounded():
+    workflow = chain(200)
+    fused = workflow.fused()
+
+    assert list(fused.tasks.keys()) == [fused_name(['t{}'.format(i) for i in range(200)])]
+    assert len(list(fused.tasks.keys())[0]) < 40
+    assert fused.run_local() == workflow.run_local() == {'total': 401.0}
+
+
+def test_fused_names_differ_by_members():
+    assert fused_name(['a', 'b']) != fused_name(['a', 'c'])
+    assert fused_name(['a', 'b']).startswith('fused__a__2_')
+
+
+def test_tasks_of_unknown_cost_are_not_fused():
+    workflow = chain(3)
+    for task in workflow.tasks.values():
+        task.cost = None
+    assert list(workflow.fused().tasks.keys()) == ['t0', 't1', 't2']
@@ -0,0 +1,47 @@
+from hover_power import HoverPower
+import numpy as np
+import pytest
+
+
+def solve(params):
+    component = HoverPower()
+    unknowns = {k: v['val'] for k, v in component._init_unknowns_dict.items()}
+    component.solve_nonlinear(params, unknowns, {})
+    return unknowns
+
+
+def test_batch_matches_scalar():
+    rng = np.random.RandomState(0)
+    n = 200
+    params = {
+        'Vehicle': rng.choice(['helicopter', 'tiltwing', 'Tilt-Wing'], n),
+        'rProp': rng.uniform(0.5, 3.0, n),
+        'W': rng.uniform(500.0, 4000.0, n),
+        'cruisePower_omega': rng.uniform(50.0, 200.0, n),
+    }
+    batch = HoverPower().solve_batch(params)
+
+    for i in range(n):
+        unknowns = solve({k: v[i] for k, v in params.items()})
+        for k, value in unknowns.items():
+            assert batch[k][i] == pytest.approx(value, rel=1e-13, abs=0.0), k
+
+
+def test_one_vehicle_per_point_with_scalar_params():
+    batch = HoverPower().solve_batch({'Vehicle': ['tiltwing', 'helicopter'], 'rProp': 1.4, 'W': 2000.0,
+                                      'cruisePower_omega': 122.0})
+
+    for i, vehicle in enumerate(['tiltwing', 'helicopter']):
+        unknowns = solve({'Vehicle': vehicle, 'rProp': 1.4, 'W': 2000.0, 'cruisePower_omega': 122.0})
+        assert batch['hoverPower_PBattery'][i] == pytest.approx(unknowns['hoverPower_PBattery'], rel=1e-13)
+
+
+def test_one_vehicle_for_every_point():
+    batch = HoverPower().solve_batch({'Vehicle': 'helicopter', 'rProp': np.linspace(1.0, 2.0, 5), 'W': 2000.0,
+                                      'cruisePower_omega': 122.0})
+
+    assert batch['hoverPower_PBattery'].shape == (5,)
+    # An unknown vehicle leaves every output at its default
+    unknown = HoverPower().solve_batch({'Vehicle': 'quadcopter', 'rProp': 1.4, 'W': 2000.0,
+                                        'cruisePower_omega': 122.0})
+    assert unknown['hoverPower_PBattery'] == 0.0
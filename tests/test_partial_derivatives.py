@@ -0,0 +1,47 @@
+from cruise_power import CruisePower
+from hover_power import HoverPower
+import pytest
+
+# Relative step of the central differences, and the relative error allowed between them and linearize
+STEP = 1e-6
+TOLERANCE = 1e-6
+
+
+def solve(component, params):
+    unknowns = {k: v['val'] for k, v in component._init_unknowns_dict.items()}
+    component.solve_nonlinear(params, unknowns, {})
+    return unknowns
+
+
+def check_partials(component, params, names):
+    unknowns = solve(component, params)
+    J = component.linearize(params, unknowns, {})
+
+    for name in names:
+        h = STEP * abs(params[name])
+        plus = solve(component, dict(params, **{name: params[name] + h}))
+        minus = solve(component, dict(params, **{name: params[name] - h}))
+
+        for k, value in unknowns.items():
+            if not isinstance(value, float):
+                continue
+            fd = (plus[k] - minus[k]) / (2 * h)
+            analytic = J.get((k, name), 0.0)
+            # Derivatives that are exactly zero come out of the differences as rounding noise
+            assert abs(analytic - fd) <= TOLERANCE * max(abs(fd), 1e-3 * abs(value) / abs(params[name])), \
+                'd{}/d{}: linearize {} finite difference {}'.format(k, name, analytic, fd)
+
+
+@pytest.mark.parametrize('vehicle', ['helicopter', 'tiltwing'])
+@pytest.mark.parametrize('rProp, W', [(1.4, 2000.0), (1.0, 1500.0), (2.0, 2500.0)])
+def test_hover_power(vehicle, rProp, W):
+    check_partials(HoverPower(), {'Vehicle': vehicle, 'rProp': rProp, 'W': W, 'cruisePower_omega': 122.0},
+                   ['rProp', 'W', 'cruisePower_omega'])
+
+
+@pytest.mark.parametrize('vehicle', ['helicopter', 'tiltwing'])
+@pytest.mark.parametrize('V', [20.0, 50.0, 80.0])
+@pytest.mark.parametrize('warm_start', [False, True])
+def test_cruise_power(vehicle, V, warm_start):
+    check_partials(CruisePower(warm_start=warm_start), {'Vehicle': vehicle, 'rProp': 1.4, 'V': V, 'W': 2000.0},
+                   ['rProp', 'V', 'W'])
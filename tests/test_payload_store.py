@@ -0,0 +1,139 @@
+from payload_store import LazyInputs, PayloadStore, decode, is_reference
+from result_cache import ResultCache
+from task import Task
+import json
+import numpy as np
+import os
+import pytest
+import time
+
+
+class Mean(Task):
+    def __init__(self, *args, **kwargs):
+        super(Mean, self).__init__(*args, **kwargs)
+        self.name = 'mean'
+        self.description = 'mean'
+        self.add_input('values')
+        self.add_input('scale', 1.0)
+        self.add_output('mean')
+
+    def run(self, inputs, outputs):
+        outputs['mean'] = inputs['scale'] * float(np.mean(inputs['values']))
+
+
+@pytest.fixture
+def store(tmpdir):
+    return PayloadStore(str(tmpdir.join('payloads')), threshold=1024)
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    # References loaded from any PayloadStore so far
+    loaded = []
+    get = PayloadStore.get.__func__
+
+    def counting_get(cls, reference):
+        loaded.append(reference)
+        return get(cls, reference)
+
+    monkeypatch.setattr(PayloadStore, 'get', classmethod(counting_get))
+    return loaded
+
+
+def stored(store):
+    return sorted(name for root, dirs, files in os.walk(store.directory) for name in files)
+
+
+def test_round_trip(store):
+    array = np.linspace(0.0, 1.0, 1000)
+    encoded = json.loads(json.dumps(store.encode({'big': array, 'small': np.arange(3.0), 'x': 1.0})))
+
+    assert is_reference(encoded['big'])
+    assert encoded['small'] == [0.0, 1.0, 2.0]
+    assert encoded['x'] == 1.0
+
+    inputs = decode(encoded)
+    assert isinstance(inputs, LazyInputs)
+    assert np.array_equal(inputs['big'], array)
+    assert decode({'x': 1.0}) == {'x': 1.0}
+
+
+def test_same_array_is_stored_once(store):
+    array = np.arange(1000.0)
+    assert store.put(array) == store.put(array.copy())
+    assert len(stored(store)) == 1
+
+
+def test_loads_only_what_is_read(store, loads):
+    inputs = decode({'a': store.put(np.arange(1000.0)), 'b': store.put(np.arange(2000.0)), 'x': 1.0})
+
+    assert inputs['x'] == 1.0
+    assert 'a' in inputs and len(inputs) == 3
+    assert not loads
+
+    assert inputs.get('a')[-1] == 999.0
+    assert inputs['a'][-1] == 999.0
+    assert len(loads) == 1
+
+    # Every other way of reading a value loads it too
+    for read in [lambda i: i.pop('a'), lambda i: i.setdefault('a'), lambda i: i.copy()['a'], lambda i: dict(i)['a'],
+                 lambda i: dict(**i)['a'], lambda i: i.items()[0][1], lambda i: i.values()[0]]:
+        inputs = LazyInputs({'a': store.put(np.arange(1000.0))})
+        assert isinstance(read(inputs), np.ndarray)
+
+    inputs = LazyInputs({'a': 1})
+    assert inputs.pop('b', None) is None
+    assert inputs.setdefault('b', 2) == 2
+    assert inputs.copy() == {'a': 1, 'b': 2}
+
+
+def test_task_reads_referenced_inputs(store, loads):
+    response = Mean()._run_task({'inputData': {'values': store.put(np.arange(1001.0)), 'scale': 2.0}})
+    assert response['output'] == {'mean': 1000.0}
+    assert len(loads) == 1
+
+
+def test_cache_key_uses_the_reference(store, loads, tmpdir):
+    task = Mean()
+    task.result_cache = ResultCache(str(tmpdir.join('cache.sqlite')))
+
+    reference = store.put(np.arange(1001.0))
+    key = task.result_cache.key(task.name, task.version, {'values': reference, 'scale': 1.0})
+    assert len(json.dumps(key)) < 200
+
+    for i in range(3):
+        assert task._run_task({'inputData': {'values': reference, 'scale': 1.0}})['output'] == {'mean': 500.0}
+
+    # Hits are answered without loading the array
+    assert task.result_cache.hits == 2
+    assert len(loads) == 1
+
+
+def test_cleanup_by_age(tmpdir):
+    store = PayloadStore(str(tmpdir.join('payloads')), threshold=1024, max_age=60.0, sweep_every=3)
+    old = store.put(np.arange(1000.0))
+    path = store._path(store.directory, old['__payload__'])
+    os.utime(path, (time.time() - 120, time.time() - 120))
+
+    store.put(np.arange(2000.0))
+    assert os.path.exists(path)
+
+    # The third put sweeps
+    store.put(np.arange(3000.0))
+    assert not os.path.exists(path)
+    assert len(stored(store)) == 2
+
+
+def test_cleanup_by_size(tmpdir):
+    store = PayloadStore(str(tmpdir.join('payloads')), threshold=1024, max_size=20000)
+    references = [store.put(np.arange(1000.0) + i) for i in range(4)]
+    for i, reference in enumerate(references):
+        t = time.time() - 100 + i
+        os.utime(store._path(store.directory, reference['__payload__']), (t, t))
+
+    # Putting the first one again makes it the newest
+    store.put(np.arange(1000.0))
+    assert store.cleanup() == 2
+
+    left = [os.path.exists(store._path(store.directory, r['__payload__'])) for r in references]
+    assert left == [True, False, False, True]
@@ -0,0 +1,77 @@
+from process_pool import ProcessPool
+from task import Task
+import os
+import pytest
+
+
+class Crashing(Task):
+    # Kills its process the first time it sees each marker file, then answers with its pid
+    def __init__(self, *args, **kwargs):
+        super(Crashing, self).__init__(*args, **kwargs)
+        self.name = 'crashing'
+        self.description = 'crashing'
+        self.add_input('marker', None)
+        self.add_input('crashes', 0)
+        self.add_output('pid')
+
+    def run(self, inputs, outputs):
+        marker = inputs['marker']
+        if marker is not None:
+            crashes = len(open(marker).read()) if os.path.exists(marker) else 0
+            if crashes < inputs['crashes']:
+                with open(marker, 'a') as f:
+                    f.write('x')
+                os._exit(1)
+        outputs['pid'] = os.getpid()
+
+
+def run(pool, **inputs):
+    return pool.run_task({'taskId': 'task', 'inputData': dict({'marker': None, 'crashes': 0}, **inputs)})
+
+
+def test_runs_in_other_processes():
+    pool = ProcessPool(Crashing(), processes=2)
+    try:
+        response = run(pool)
+    finally:
+        pool.shutdown()
+
+    assert response['status'] == 'COMPLETED'
+    assert response['output']['pid'] != os.getpid()
+    assert 'run' in response['timings']
+
+
+def test_restarts_after_a_crash(tmp_path):
+    pool = ProcessPool(Crashing(), processes=2)
+    try:
+        response = run(pool, marker=str(tmp_path / 'marker'), crashes=2)
+
+        # The rebuilt pool keeps working
+        assert run(pool)['status'] == 'COMPLETED'
+    finally:
+        pool.shutdown()
+
+    assert response['status'] == 'COMPLETED'
+    assert pool.restarts == 2
+
+
+def test_gives_up_after_max_retries(tmp_path):
+    pool = ProcessPool(Crashing(), processes=1, max_retries=1)
+    try:
+        with pytest.raises(RuntimeError):
+            run(pool, marker=str(tmp_path / 'marker'), crashes=5)
+    finally:
+        pool.shutdown()
+
+    assert pool.restarts == 2
+
+
+def test_task_uses_a_pool_when_processes_is_set():
+    exec_function, thread_count = Crashing(processes=3)._worker_config()
+    assert isinstance(exec_function.__self__, ProcessPool)
+    assert thread_count == 3
+    exec_function.__self__.shutdown()
+
+    exec_function, thread_count = Crashing(thread_count=2)._worker_config()
+    assert thread_count == 2
+    assert not isinstance(exec_function.__self__, ProcessPool)
@@ -0,0 +1,116 @@
+from profiling import SamplingProfiler
+from task import Task
+import os
+import pickle
+import pstats
+import threading
+import time
+
+
+def square(i):
+    return i * i
+
+
+def squares(n):
+    return sum(square(i) for i in range(n))
+
+
+def functions(stats):
+    return set(name for filename, line, name in stats.stats.keys())
+
+
+class Squares(Task):
+    def __init__(self, *args, **kwargs):
+        super(Squares, self).__init__(*args, **kwargs)
+        self.name = 'squares'
+        self.description = 'squares'
+        self.add_input('n', 100)
+        self.add_output('total')
+
+    def run(self, inputs, outputs):
+        outputs['total'] = squares(inputs['n'])
+
+
+def test_profiles_every_call_at_rate_one():
+    profiler = SamplingProfiler(rate=1.0)
+    for i in range(3):
+        assert profiler.call('squares', squares, 100) == 328350
+
+    assert profiler.summary() == {'calls': 3, 'profiled': 3, 'busy': 0}
+    assert 'square' in functions(profiler.stats('squares'))
+    assert profiler.stats('other') is None
+
+
+def test_samples_a_fraction_of_calls():
+    counts = []
+    for i in range(2):
+        profiler = SamplingProfiler(rate=0.2, seed=0)
+        for j in range(200):
+            profiler.call('squares', squares, 10)
+        counts.append(profiler.profiled)
+
+    # The same seed samples the same calls
+    assert counts[0] == counts[1]
+    assert 20 < counts[0] < 60
+    assert SamplingProfiler(rate=0.0).call('squares', squares, 10) == 285
+
+
+def test_one_call_is_profiled_at_a_time():
+    profiler = SamplingProfiler(rate=1.0)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        entered.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=profiler.call, args=('hold', hold))
+    thread.start()
+    try:
+        assert entered.wait(5)
+        assert profiler.call('squares', squares, 10) == 285
+    finally:
+        release.set()
+        thread.join()
+
+    assert profiler.summary() == {'calls': 2, 'profiled': 1, 'busy': 1}
+    assert profiler.stats('squares') is None
+
+
+def test_dump(tmp_path):
+    profiler = SamplingProfiler(rate=1.0, directory=str(tmp_path / 'profiles'))
+    profiler.call('cruise power', squares, 10)
+
+    paths = profiler.dump()
+    assert [os.path.basename(path) for path in paths] == ['cruise_power.{}.prof'.format(os.getpid())]
+    assert 'square' in functions(pstats.Stats(*paths))
+
+
+def test_dumps_every_interval(tmp_path):
+    profiler = SamplingProfiler(rate=1.0, directory=str(tmp_path), interval=0.05)
+    profiler.call('squares', squares, 10)
+
+    end = time.time() + 5
+    while not os.listdir(str(tmp_path)) and time.time() < end:
+        time.sleep(0.01)
+    assert os.listdir(str(tmp_path)) == ['squares.{}.prof'.format(os.getpid())]
+
+
+def test_pickled_copy_starts_empty():
+    profiler = SamplingProfiler(rate=0.5, directory='elsewhere', seed=3)
+    profiler.call('squares', squares, 10)
+
+    copy = pickle.loads(pickle.dumps(profiler))
+    assert (copy.rate, copy.directory, copy.seed) == (0.5, 'elsewhere', 3)
+    assert copy.summary() == {'calls': 0, 'profiled': 0, 'busy': 0}
+    assert copy.stats('squares') is None
+
+
+def test_task_runs_through_its_profiler():
+    task = Squares()
+    task.profiler = SamplingProfiler(rate=1.0)
+
+    response = task._run_task({'inputData': {'n': 10}})
+    assert response['output'] == {'total': 285}
+    assert task.profiler.summary()['profiled'] == 1
+    assert 'square' in functions(task.profiler.stats('squares'))
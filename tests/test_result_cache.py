@@ -0,0 +1,124 @@
+from result_cache import ResultCache
+from sum_task import SumTask
+import multiprocessing
+import numpy as np
+import pytest
+import time
+
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path / 'results.sqlite')
+
+
+def test_key():
+    key = ResultCache.key('sum', 1, {'a': 1.0, 'b': 2.0})
+    assert key == ResultCache.key('sum', 1, {'b': 2.0, 'a': 1.0})
+    assert key != ResultCache.key('sum', 2, {'a': 1.0, 'b': 2.0})
+    assert key != ResultCache.key('other', 1, {'a': 1.0, 'b': 2.0})
+    assert key != ResultCache.key('sum', 1, {'a': 1.0, 'b': 2.5})
+
+    # Arrays are keyed on their values
+    assert ResultCache.key('sum', 1, {'a': np.arange(3.0)}) == ResultCache.key('sum', 1, {'a': [0.0, 1.0, 2.0]})
+
+
+def test_round_trip_copies(filename):
+    cache = ResultCache(filename)
+    response = {'status': 'COMPLETED', 'output': {'sum': [1.0]}}
+    cache.put('k', response)
+    response['output']['sum'].append(2.0)
+
+    got = cache.get('k')
+    assert got == {'status': 'COMPLETED', 'output': {'sum': [1.0]}}
+    got['output']['sum'].append(3.0)
+    assert cache.get('k') == {'status': 'COMPLETED', 'output': {'sum': [1.0]}}
+
+    assert cache.get('missing') is None
+    assert cache.stats()['hits'] == 2
+    assert cache.stats()['misses'] == 1
+
+
+def test_lru(filename):
+    cache = ResultCache(filename, max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    # b was least recently used, so it left memory, but it's still on disk
+    assert list(cache._memory.keys()) == ['a', 'c']
+    assert cache.stats()['evictions'] == 1
+    assert cache.get('b') == 2
+    assert list(cache._memory.keys()) == ['c', 'b']
+
+
+def test_expiry(filename, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+
+    cache = ResultCache(filename, max_age=10)
+    cache.put('a', 1)
+    now[0] += 5
+    assert cache.get('a') == 1
+
+    now[0] += 10
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+    assert 'a' not in cache._disk
+
+
+def test_sweep_on_put(filename, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+
+    cache = ResultCache(filename, max_age=100, max_disk_size=5, sweep_every=4)
+    for i in range(3):
+        cache.put('old{}'.format(i), i)
+    now[0] += 200
+    for i in range(9):
+        now[0] += 1
+        cache.put('new{}'.format(i), i)
+
+    # Swept after the 4th put (the old entries expire), the 8th and the 12th (the oldest four go), without
+    # reading anything back
+    assert sorted(cache._disk.keys()) == ['new{}'.format(i) for i in range(4, 9)]
+    assert cache.stats()['expirations'] == 3
+    assert cache.stats()['disk_evictions'] == 4
+
+
+def _use_in_child(cache, queue):
+    queue.put(cache.get('parent'))
+    cache.put('child', {'output': 2})
+    cache._disk.commit()
+
+
+def test_reopens_after_fork(filename):
+    cache = ResultCache(filename)
+    cache.put('parent', {'output': 1})
+    cache._disk.commit()
+
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=_use_in_child, args=(cache, queue))
+    process.start()
+    process.join(30)
+
+    assert process.exitcode == 0
+    assert queue.get(timeout=5) == {'output': 1}
+    assert cache.get('child') == {'output': 2}
+
+
+def test_task_runs_once_per_input(filename):
+    class CachedSum(SumTask):
+        result_cache = ResultCache(filename)
+
+        def run(self, inputs, outputs):
+            self.runs = getattr(self, 'runs', 0) + 1
+            super(CachedSum, self).run(inputs, outputs)
+
+    task = CachedSum('cached_sum', num_inputs=2)
+    outputs = [task._run_task({'inputData': {'i0': i, 'i1': 1.0}})['output'] for i in [1.0, 2.0, 1.0, 1.0]]
+
+    assert outputs[0] == outputs[2] == outputs[3]
+    assert outputs[1] != outputs[0]
+    assert task.runs == 2
@@ -0,0 +1,182 @@
+from async_runtime import AsyncRuntime
+from emulator import Emulator
+from payload_store import LazyInputs, PayloadStore
+from result_cache import ResultCache
+from shared_memory import SharedArrays
+from task import Task
+from workflow import Workflow
+import json
+import numpy as np
+import os
+import pytest
+import time
+
+
+class Ramp(Task):
+    def __init__(self, *args, **kwargs):
+        super(Ramp, self).__init__(*args, **kwargs)
+        self.name = 'ramp'
+        self.description = 'ramp'
+        self.add_input('n', 10)
+        self.add_output('ramp')
+
+    def run(self, inputs, outputs):
+        outputs['ramp'] = np.linspace(0.0, 1.0, inputs['n'])
+
+
+class Mean(Task):
+    def __init__(self, name, *args, **kwargs):
+        super(Mean, self).__init__(*args, **kwargs)
+        self.name = name
+        self.description = name
+        self.add_input('values')
+        self.add_output('mean')
+
+    def run(self, inputs, outputs):
+        outputs['mean'] = float(np.mean(inputs['values']))
+
+
+@pytest.fixture
+def array():
+    return np.linspace(0.0, 1.0, 100000)
+
+
+@pytest.fixture
+def make_store(tmpdir):
+    def make_store(**kwargs):
+        return SharedArrays(str(tmpdir.join('shm')), threshold=1024,
+                            fallback=PayloadStore(str(tmpdir.join('shared')), threshold=1024), **kwargs)
+    return make_store
+
+
+def exists(store, reference):
+    return os.path.exists(store._path(store.directory, reference['__payload__']))
+
+
+def test_fallback_is_required(tmpdir):
+    with pytest.raises(ValueError):
+        SharedArrays(str(tmpdir.join('shm')))
+
+
+def test_reference_never_carries_the_array(make_store, array):
+    reference = make_store().put(array)
+
+    assert '__payload__' in reference['fallback']
+    assert len(json.dumps(reference)) < 600
+
+
+def test_same_host_reads_a_read_only_view(make_store, array):
+    store = make_store(linger=0.0)
+    reference = store.put(array)
+
+    view = SharedArrays.get(reference)
+    assert isinstance(view, np.memmap)
+    assert not view.flags.writeable
+    assert np.array_equal(view, array)
+
+    SharedArrays.release(reference)
+    assert not exists(store, reference)
+    assert view[-1] == 1.0
+
+
+def test_another_host_reads_the_fallback(make_store, array):
+    reference = dict(make_store().put(array), host='another-host')
+    assert np.array_equal(SharedArrays.get(reference), array)
+
+
+def test_removed_array_is_read_from_the_fallback(make_store, array):
+    store = make_store()
+    reference = store.put(array)
+    os.remove(store._path(store.directory, reference['__payload__']))
+
+    assert np.array_equal(SharedArrays.get(reference), array)
+
+
+def test_every_reader_is_counted_when_put(make_store, array):
+    store = make_store(linger=0.0)
+    reference = store.put(array, readers=2)
+
+    # Neither reader has started, and the array stays
+    assert store.cleanup() == 0
+    assert exists(store, reference)
+
+    for i in range(2):
+        assert np.array_equal(SharedArrays.get(reference), array)
+        SharedArrays.release(reference)
+        assert exists(store, reference) == (i == 0)
+
+
+def test_unread_inputs_are_given_back(make_store, array):
+    store = make_store(linger=0.0)
+    reference = store.put(array, readers=1)
+
+    inputs = LazyInputs({'values': reference, 'x': 1.0})
+    assert inputs['x'] == 1.0
+    inputs.close()
+    inputs.close()
+    assert not exists(store, reference)
+
+
+def test_counted_arrays_are_removed_after_max_age(make_store, array):
+    store = make_store(max_age=60.0)
+    reference = store.put(array, readers=1)
+    path = store._path(store.directory, reference['__payload__'])
+    os.utime(path, (time.time() - 120, time.time() - 120))
+
+    assert store.cleanup() == 1
+    assert os.listdir(os.path.dirname(path)) == []
+
+
+def test_small_arrays_are_sent_as_lists(make_store):
+    assert make_store().encode({'a': np.arange(3.0), 'b': 1.0}) == {'a': [0.0, 1.0, 2.0], 'b': 1.0}
+
+
+def test_shared_outputs_are_not_cached(make_store, tmpdir):
+    task = Ramp()
+    task.payload_store = make_store()
+    task.result_cache = ResultCache(str(tmpdir.join('cache.sqlite')))
+
+    for i in range(2):
+        task._run_task({'inputData': {'n': 10000, '__readers__': {'ramp': 1}}})
+        task._run_task({'inputData': {'n': 10}})
+
+    # Small outputs hold no reference, and are
+    assert task.result_cache.hits == 1
+
+
+def test_workflow_counts_the_readers_of_each_output(make_store):
+    ramp = Ramp()
+    ramp.payload_store = make_store(linger=60.0)
+
+    workflow = Workflow('ramp_means')
+    workflow.add_input('n', 10000)
+    workflow.add_task('ramp', ramp)
+    workflow.add_task('first', Mean('first'))
+    workflow.add_task('second', Mean('second'))
+    workflow.connect('n', 'ramp.n')
+    workflow.connect('ramp.ramp', 'first.values')
+    workflow.connect('ramp.ramp', 'second.values')
+    workflow.add_output('first', 'first.mean')
+    workflow.add_output('second', 'second.mean')
+
+    definition = workflow._definition()['tasks'][0]
+    assert definition['inputParameters']['__readers__'] == {'ramp': 2}
+
+    emulator = Emulator().start()
+    workflow.register_tasks(emulator.endpoint)
+    workflow.register(emulator.endpoint)
+    runtime = AsyncRuntime(emulator.endpoint, polling_interval=0.01)
+    for task in workflow._all_tasks():
+        runtime.register(task)
+
+    runtime.start()
+    try:
+        id = workflow.start(wait=False, endpoint=emulator.endpoint, inputs={'n': 10000})
+        assert workflow.wait(id, emulator.endpoint) == {'first': 0.5, 'second': 0.5}
+    finally:
+        runtime.stop()
+        emulator.stop()
+
+    # The last reader removed the array, well before it would have lingered out
+    stored = [name for root, dirs, files in os.walk(ramp.payload_store.directory) for name in files]
+    assert stored == []
@@ -0,0 +1,202 @@
+from fused_task import FusedTask
+from surrogate import Surrogate, _Model
+from task import Task
+import itertools
+import math
+import numpy as np
+
+
+class Smooth(Task):
+    # A smooth function of x and y per shape, with a count of real runs
+    def __init__(self, surrogate, *args, **kwargs):
+        super(Smooth, self).__init__(*args, **kwargs)
+        self.name = 'smooth'
+        self.description = 'smooth'
+        self.surrogate = surrogate
+        self.runs = 0
+        self.add_input('shape', 'a')
+        self.add_input('x', 0.0)
+        self.add_input('y', 0.0)
+        self.add_output('f')
+        self.add_output('label')
+
+    def run(self, inputs, outputs):
+        self.runs += 1
+        scale = 1.0 if inputs['shape'] == 'a' else 10.0
+        outputs['f'] = scale * (1.0 + math.sin(inputs['x']) * inputs['y'] + 0.5 * inputs['y'] ** 2)
+        outputs['label'] = inputs['shape']
+
+
+def counts(surrogate):
+    # Hits, audits and each kind of miss so far, to compare before and after some runs
+    stats = surrogate.stats()
+    return dict(stats['misses'], hits=stats['hits'], audits=stats['audits'])
+
+
+def run(task, **inputs):
+    return task._run_task({'inputData': inputs})['output']
+
+
+def train(task, shape='a', n=9):
+    for x, y in itertools.product(np.linspace(0.0, 1.0, n), repeat=2):
+        run(task, shape=shape, x=float(x), y=float(y))
+
+
+def test_answers_near_earlier_results():
+    task = Smooth(Surrogate(tolerance=1e-3, min_points=20))
+    train(task)
+    runs = task.runs
+    before = counts(task.surrogate)
+
+    output = run(task, shape='a', x=0.43, y=0.61)
+    assert task.runs == runs
+    assert abs(output['f'] - (1.0 + math.sin(0.43) * 0.61 + 0.5 * 0.61 ** 2)) < 1e-3
+    assert output['label'] == 'a'
+
+    assert counts(task.surrogate)['hits'] == before['hits'] + 1
+    assert task.surrogate.stats()['estimated_error']['max'] <= 1e-3
+
+
+def test_one_model_per_categorical_value():
+    task = Smooth(Surrogate(tolerance=1e-3, min_points=20))
+    train(task, 'a')
+    train(task, 'b')
+    runs = task.runs
+
+    assert task.surrogate.stats()['models'] == 2
+    assert abs(run(task, shape='b', x=0.5, y=0.5)['f'] - 10.0 * (1.0 + math.sin(0.5) * 0.5 + 0.125)) < 1e-2
+    assert run(task, shape='b', x=0.5, y=0.5)['label'] == 'b'
+    assert task.runs == runs
+
+    # A value never seen has no model yet
+    run(task, shape='c', x=0.5, y=0.5)
+    assert task.runs == runs + 1
+    assert task.surrogate.stats()['misses']['too_few_points'] > 0
+
+
+def test_falls_through():
+    task = Smooth(Surrogate(tolerance=1e-3, min_points=20))
+    train(task, n=3)
+    assert task.surrogate.stats()['misses']['too_few_points'] == 9
+
+    train(task)
+    runs = task.runs
+    before = counts(task.surrogate)
+
+    # Outside the box of the points seen
+    run(task, shape='a', x=1.5, y=0.5)
+    assert task.runs == runs + 1
+    assert counts(task.surrogate)['outside'] == before['outside'] + 1
+
+    # An error estimate over tolerance
+    task.surrogate.tolerance = 0.0
+    run(task, shape='a', x=0.43, y=0.61)
+    assert task.runs == runs + 2
+    assert counts(task.surrogate)['over_tolerance'] == before['over_tolerance'] + 1
+
+    # Inputs that aren't numbers or categories
+    run(task, shape='a', x=0.5, y=0.5, tag=[0.5])
+    assert task.runs == runs + 3
+    assert counts(task.surrogate)['unsupported'] == before['unsupported'] + 1
+    assert counts(task.surrogate)['hits'] == before['hits']
+
+
+def test_outputs_that_change_kind_stop_the_model():
+    surrogate = Surrogate(min_points=2)
+    for x in np.linspace(0.0, 1.0, 10):
+        surrogate.add('t', 1, {'x': float(x)}, {'y': float(x), 'label': 'same'})
+    assert surrogate.predict('t', 1, {'x': 0.5}) is not None
+
+    surrogate.add('t', 1, {'x': 0.25}, {'y': 0.25, 'label': 'different'})
+    assert surrogate.predict('t', 1, {'x': 0.5}) is None
+    assert surrogate.stats()['misses']['unsupported'] == 1
+
+
+def test_array_outputs_are_not_modelled():
+    surrogate = Surrogate(min_points=2)
+    for x in np.linspace(0.0, 1.0, 10):
+        surrogate.add('t', 1, {'a': float(x)}, {'y': 0.0, 'arr': np.arange(3)})
+
+    assert surrogate.predict('t', 1, {'a': 0.5}) is None
+    assert surrogate.stats()['misses']['unsupported'] == 1
+    assert surrogate.stats()['points'] == 0
+
+
+def test_task_with_array_output_still_runs():
+    class Ramp(Task):
+        surrogate = Surrogate(min_points=2)
+
+        def __init__(self, *args, **kwargs):
+            super(Ramp, self).__init__(*args, **kwargs)
+            self.name = 'ramp'
+            self.description = 'ramp'
+            self.add_input('n', 3)
+            self.add_output('ramp')
+
+        def run(self, inputs, outputs):
+            outputs['ramp'] = np.linspace(0.0, 1.0, int(inputs['n']))
+
+    t = Ramp()
+    for n in [3, 4, 5, 4]:
+        assert len(t._run_task({'inputData': {'n': n}})['output']['ramp']) == n
+    assert Ramp.surrogate.stats()['hits'] == 0
+
+
+def test_predictions_are_encoded():
+    class Encoded(Smooth):
+        def _encode_outputs(self, outputs, readers=None):
+            return dict(outputs, encoded=True)
+
+    task = Encoded(Surrogate(tolerance=1e-3, min_points=20))
+    train(task)
+    runs = task.runs
+
+    assert run(task, shape='a', x=0.43, y=0.61)['encoded']
+    assert task.runs == runs
+
+
+def test_audits_measure_real_errors():
+    # A window of 3 keeps only the errors of the points below
+    task = Smooth(Surrogate(tolerance=1e-3, min_points=20, audit_rate=1.0, window=3, seed=0))
+    train(task)
+    runs = task.runs
+    before = counts(task.surrogate)
+    measured = task.surrogate.stats()['actual_error']['count']
+
+    for x, y in [(0.43, 0.61), (0.6, 0.7), (0.77, 0.33)]:
+        run(task, shape='a', x=x, y=y)
+    assert task.runs == runs + 3
+
+    stats = task.surrogate.stats()
+    assert stats['hits'] == 0
+    assert stats['audits'] == before['audits'] + 3
+    assert stats['actual_error']['count'] == measured + 3
+    assert stats['actual_error']['max'] < 1e-3
+
+
+def test_fused_tasks_are_modelled():
+    task = FusedTask('fused', {'s': Smooth(None)}, {('s', 'shape'): None, ('s', 'x'): None, ('s', 'y'): None})
+    task.surrogate = Surrogate(tolerance=1e-3, min_points=20)
+    for x, y in itertools.product(np.linspace(0.0, 1.0, 9), repeat=2):
+        run(task, s__shape='a', s__x=float(x), s__y=float(y))
+    runs = task.members['s'].runs
+
+    output = run(task, s__shape='a', s__x=0.43, s__y=0.61)
+    assert abs(output['s__f'] - (1.0 + math.sin(0.43) * 0.61 + 0.5 * 0.61 ** 2)) < 1e-3
+    assert task.members['s'].runs == runs
+
+
+def test_fits_without_holding_the_lock(monkeypatch):
+    task = Smooth(Surrogate(tolerance=1e-3, min_points=20))
+    locked = []
+    fit = _Model.fit
+
+    def checking_fit(model, points):
+        locked.append(task.surrogate._lock.locked())
+        return fit(model, points)
+
+    monkeypatch.setattr(_Model, 'fit', checking_fit)
+    train(task)
+
+    assert locked and not any(locked)
+    assert task.surrogate.stats()['fits'] == len(locked)
@@ -0,0 +1,81 @@
+from emulator import Emulator
+from sum_task import SumTask
+from timing import BUCKETS, PHASES, RollingHistogram, TaskTimings, format_timings, queue_wait
+from worker import Worker
+import time
+
+
+class Slow(SumTask):
+    def run(self, inputs, outputs):
+        time.sleep(0.02)
+        super(Slow, self).run(inputs, outputs)
+
+
+def test_histogram_keeps_the_last_window():
+    histogram = RollingHistogram(window=10)
+    for i in range(100):
+        histogram.add(float(i))
+
+    summary = histogram.summary()
+    assert summary['count'] == 100
+    assert summary['mean'] == 94.5
+    assert summary['p50'] == 95.0
+    assert summary['max'] == 99.0
+    assert summary['buckets'] == [0] * len(BUCKETS) + [10]
+
+
+def test_histogram_buckets():
+    histogram = RollingHistogram()
+    for value in [5e-5, 1e-4, 5e-3, 5e-3, 0.5, 20.0]:
+        histogram.add(value)
+
+    # A value on a bucket's upper bound falls in that bucket
+    assert histogram.summary()['buckets'] == [2, 0, 2, 0, 1, 0, 1]
+    assert RollingHistogram().summary() == {'count': 0}
+
+
+def test_queue_wait_and_logs():
+    assert queue_wait({'scheduledTime': 1000, 'startTime': 1250}) == 0.25
+    assert queue_wait({'scheduledTime': 1000}) is None
+    assert format_timings({'queue_wait': 0.25, 'run': 0.0125, 'update': None}) == 'queue_wait=250.0ms run=12.5ms'
+
+
+def test_task_times_its_phases():
+    task = SumTask('sum')
+    task.timing_logs = True
+    response = task._run_task({'taskType': 'sum', 'inputData': {'i0': 1.0, 'i1': 2.0},
+                               'scheduledTime': 1000, 'startTime': 1003})
+
+    assert response['output'] == {'sum': 3.0}
+    assert set(response['timings'].keys()) == {'decode', 'run', 'encode'}
+    assert response['logs'][0].startswith('queue_wait=3.0ms decode=')
+
+    timings = TaskTimings()
+    timings.record_response({'taskType': 'sum', 'scheduledTime': 1000, 'startTime': 1003}, response)
+    summary = timings.summary('sum')
+    assert set(summary.keys()) == set(PHASES)
+    assert summary['queue_wait']['max'] == 0.003
+    assert summary['update'] == {'count': 0}
+    assert timings.summary('other') == {}
+
+
+def test_worker_records_every_phase():
+    emulator = Emulator().start()
+    task = Slow('slow')
+    for i in range(10):
+        emulator.add_task(task.name, {'i0': float(i), 'i1': 1.0})
+
+    worker = Worker(emulator.endpoint, thread_count=2, polling_interval=0.01)
+    worker.start(task.name, task._run_task)
+    try:
+        assert emulator.wait(10)
+        # The last update is recorded once the server has answered it
+        time.sleep(0.1)
+    finally:
+        worker.stop()
+        emulator.stop()
+
+    summary = worker.timings.summary(task.name)
+    assert all(summary[phase]['count'] == 10 for phase in PHASES)
+    assert summary['run']['p50'] >= 0.02
+    assert summary['run']['max'] < 1.0
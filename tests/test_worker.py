@@ -0,0 +1,199 @@
+from emulator import Emulator
+from task import Task
+from worker import Worker
+import pytest
+import threading
+import time
+
+
+class Blocking(Task):
+    # Holds every run() until release is set, counting the runs in progress
+    def __init__(self, *args, **kwargs):
+        super(Blocking, self).__init__(*args, **kwargs)
+        self.name = 'blocking'
+        self.description = 'blocking'
+        self.add_input('i', 0)
+        self.add_output('i')
+
+        self.release = threading.Event()
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def run(self, inputs, outputs):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.release.wait(10)
+        with self._lock:
+            self.running -= 1
+
+        if inputs['i'] < 0:
+            raise ValueError('negative input')
+        outputs['i'] = inputs['i']
+
+
+@pytest.fixture
+def emulator():
+    emulator = Emulator().start()
+    yield emulator
+    emulator.stop()
+
+
+def in_progress(emulator):
+    return sum(1 for task in emulator.tasks.values() if task['status'] == 'IN_PROGRESS')
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end, 'timed out'
+        time.sleep(0.01)
+
+
+def test_runs_on_thread_count_threads(emulator):
+    task = Blocking()
+    for i in range(10):
+        emulator.add_task(task.name, {'i': i})
+
+    worker = Worker(emulator.endpoint, thread_count=4, polling_interval=0.01)
+    worker.start(task.name, task._run_task)
+    try:
+        wait_for(lambda: task.running == 4)
+        task.release.set()
+        assert emulator.wait(10)
+    finally:
+        worker.stop()
+
+    assert task.max_running == 4
+    assert sorted(t['outputData']['i'] for t in emulator.completed.values()) == list(range(10))
+
+
+def test_holds_at_most_max_in_flight(emulator):
+    task = Blocking()
+    for i in range(10):
+        emulator.add_task(task.name, {'i': i})
+
+    worker = Worker(emulator.endpoint, thread_count=2, max_in_flight=3, polling_interval=0.01)
+    worker.start(task.name, task._run_task)
+    try:
+        wait_for(lambda: in_progress(emulator) == 3)
+
+        # Two running, one waiting for a thread, and no more taken off the queue while the slots are full
+        time.sleep(0.2)
+        assert task.running == 2
+        assert in_progress(emulator) == 3
+
+        task.release.set()
+        assert emulator.wait(10)
+    finally:
+        worker.stop()
+
+
+def test_failed_run_is_reported(emulator):
+    task = Blocking()
+    task.release.set()
+    emulator.add_task(task.name, {'i': -1})
+
+    worker = Worker(emulator.endpoint, polling_interval=0.01)
+    worker.start(task.name, task._run_task)
+    try:
+        assert emulator.wait(1)
+    finally:
+        worker.stop()
+
+    failed = list(emulator.completed.values())[0]
+    assert failed['status'] == 'FAILED'
+    assert 'negative input' in failed['reasonForIncompletion']
+
+
+def test_stop(emulator):
+    task = Blocking()
+    task.release.set()
+
+    worker = Worker(emulator.endpoint, polling_interval=0.01)
+    worker.start(task.name, task._run_task)
+    time.sleep(0.1)
+    worker.stop()
+    time.sleep(0.3)
+
+    emulator.add_task(task.name, {'i': 1})
+    time.sleep(0.3)
+    assert not emulator.completed
+
+
+def test_task_start_uses_its_pool_settings(emulator):
+    task = Blocking(thread_count=3, max_in_flight=5)
+    worker = task.start(emulator.endpoint)
+    worker.stop()
+
+    assert worker.thread_count == 3
+    assert worker.max_in_flight == 5
+
+
+@pytest.mark.parametrize('batching', [False, True])
+def test_batches(batching):
+    emulator = Emulator(batching=batching).start()
+    task = Blocking(batch_size=10, thread_count=4)
+    task.release.set()
+    for i in range(50):
+        emulator.add_task(task.name, {'i': i})
+
+    worker = task.start(emulator.endpoint)
+    try:
+        assert emulator.wait(50)
+    finally:
+        worker.stop()
+        emulator.stop()
+
+    assert sorted(t['outputData']['i'] for t in emulator.completed.values()) == list(range(50))
+    assert emulator.requests['poll'] == 0
+    assert emulator.requests['poll_batch'] <= 10
+    if batching:
+        assert emulator.requests['ack'] == emulator.requests['update'] == 0
+    else:
+        assert emulator.requests['ack'] == emulator.requests['update'] == 50
+
+
+def test_dead_server_shows_in_metrics():
+    emulator = Emulator().start()
+    endpoint = emulator.endpoint
+    emulator.stop()
+
+    worker = Worker(endpoint, polling_interval=0.01)
+    worker.start('blocking', Blocking()._run_task)
+    time.sleep(0.3)
+    worker.stop()
+
+    summary = worker.metrics.summary()['blocking']
+    assert summary['errors'] == summary['polls'] > 0
+    assert summary['empty_polls'] == 0
+    assert summary['last_error']
+
+
+@pytest.mark.parametrize('polling_interval', [None, 1.0])
+def test_idle_worker_picks_up_at_once(emulator, polling_interval):
+    task = Blocking()
+    task.release.set()
+
+    if polling_interval is None:
+        worker = Worker(emulator.endpoint)
+        assert worker.polling_interval == 0.1
+    else:
+        worker = Worker(emulator.endpoint, polling_interval=polling_interval)
+    # The server holds each poll open for the whole wait between polls
+    assert worker.long_poll_timeout == max(100, worker.polling_interval * 1000)
+
+    worker.start(task.name, task._run_task)
+    try:
+        # Long enough for the backoff to reach its cap
+        time.sleep(1.0)
+        polls = emulator.requests['poll_batch']
+        assert polls <= 1.2 / worker.polling_interval
+
+        added = time.time()
+        emulator.add_task(task.name, {'i': 1})
+        assert emulator.wait(1, timeout=2)
+        assert time.time() - added < 0.1
+    finally:
+        worker.stop()
@@ -0,0 +1,282 @@
+from async_runtime import AsyncRuntime
+from emulator import Emulator
+from sum_task import SumTask
+from workflow import Workflow
+import pytest
+import threading
+import time
+
+
+@pytest.fixture
+def emulator():
+    emulator = Emulator().start()
+    yield emulator
+    emulator.stop()
+
+
+def diamond():
+    # a and b each add up x and y, c adds up their sums, and d runs on its own
+    workflow = Workflow('diamond')
+    workflow.add_input('x', 1.0)
+    workflow.add_input('y', 2.0)
+    for name in ['a', 'b', 'c', 'd']:
+        workflow.add_task(name, SumTask(name, num_inputs=2))
+
+    for name in ['a', 'b', 'd']:
+        workflow.connect('x', name + '.i0')
+        workflow.connect('y', name + '.i1')
+    workflow.connect('a.sum', 'c.i0')
+    workflow.connect('b.sum', 'c.i1')
+
+    workflow.add_output('c', 'c.sum')
+    workflow.add_output('d', 'd.sum')
+    return workflow
+
+
+def run(workflow, emulator, **inputs):
+    # Registers and runs workflow on the emulator, serving its tasks until it finishes
+    workflow.register_tasks(emulator.endpoint)
+    workflow.register(emulator.endpoint)
+
+    runtime = AsyncRuntime(emulator.endpoint, polling_interval=0.01)
+    for task in workflow._all_tasks():
+        runtime.register(task)
+
+    runtime.start()
+    try:
+        id = workflow.start(wait=False, endpoint=emulator.endpoint, inputs=inputs)
+        return workflow.wait(id, emulator.endpoint)
+    finally:
+        runtime.stop()
+
+
+def test_independent_tasks_are_forked():
+    workflow = diamond()
+    assert workflow._levels() == [['a', 'b', 'd'], ['c']]
+
+    tasks = workflow._definition()['tasks']
+    assert [t['type'] for t in tasks] == ['FORK_JOIN', 'JOIN', 'SIMPLE']
+    assert [[t['taskReferenceName'] for t in branch] for branch in tasks[0]['forkTasks']] == [['a'], ['b'], ['d']]
+    assert tasks[1]['joinOn'] == ['a', 'b', 'd']
+    assert tasks[2]['taskReferenceName'] == 'c'
+    assert tasks[2]['inputParameters'] == {'i0': '${a.output.sum}', 'i1': '${b.output.sum}'}
+
+
+def test_levels_follow_the_longest_chain():
+    # a -> b -> c, and a -> c directly: c has to wait for b as well
+    workflow = Workflow('chain')
+    workflow.add_input('x', 1.0)
+    for name in ['a', 'b', 'c']:
+        workflow.add_task(name, SumTask(name, num_inputs=2))
+    workflow.connect('x', 'a.i0')
+    workflow.connect('x', 'a.i1')
+    workflow.connect('a.sum', 'b.i0')
+    workflow.connect('x', 'b.i1')
+    workflow.connect('a.sum', 'c.i0')
+    workflow.connect('b.sum', 'c.i1')
+
+    assert workflow._levels() == [['a'], ['b'], ['c']]
+    assert [t['type'] for t in workflow._definition()['tasks']] == ['SIMPLE'] * 3
+
+
+def test_cycle_is_rejected():
+    workflow = Workflow('cycle')
+    workflow.add_task('a', SumTask('a', num_inputs=1))
+    workflow.add_task('b', SumTask('b', num_inputs=1))
+    workflow.connect('a.sum', 'b.i0')
+    workflow.connect('b.sum', 'a.i0')
+
+    with pytest.raises(ValueError):
+        workflow._definition()
+
+
+def test_forked_tasks_are_queued_together(emulator):
+    workflow = diamond()
+    workflow.register(emulator.endpoint)
+    workflow.start(wait=False, endpoint=emulator.endpoint)
+
+    assert sorted(t['taskType'] for t in emulator.tasks.values() if t['status'] == 'SCHEDULED') == ['a', 'b', 'd']
+
+
+def test_runs_on_the_emulator(emulator):
+    assert run(diamond(), emulator, x=3.0) == {'c': 10.0, 'd': 5.0}
+
+
+def test_definition_is_compiled_once():
+    workflow = diamond()
+    definition = workflow._definition()
+    assert workflow._definition() is definition
+
+    for change in [lambda: workflow.add_input('z', 0.0),
+                   lambda: workflow.add_output('a', 'a.sum'),
+                   lambda: workflow.connect('z', 'd.i1'),
+                   lambda: workflow.add_task('e', SumTask('e', num_inputs=1))]:
+        change()
+        assert workflow._definition() is not definition
+        definition = workflow._definition()
+
+    assert definition['inputParameters'] == ['x', 'y', 'z']
+    assert definition['outputParameters']['a'] == '${a.output.sum}'
+    assert definition['tasks'][0]['forkTasks'][2][0]['inputParameters'] == {'i0': '${workflow.input.x}',
+                                                                            'i1': '${workflow.input.z}'}
+    assert [branch[0]['taskReferenceName'] for branch in definition['tasks'][0]['forkTasks']] == ['a', 'b', 'd', 'e']
+
+
+def test_reconnecting_an_input_replaces_it():
+    workflow = diamond()
+    workflow.connect('a.sum', 'd.i0')
+
+    assert workflow._levels() == [['a', 'b'], ['c', 'd']]
+    assert workflow._task_inputs['d'] == {'i0': ('a', '${a.output.sum}'), 'i1': (None, '${workflow.input.y}')}
+
+
+def wide(count):
+    # count independent tasks, each adding up x and y
+    workflow = Workflow('wide')
+    workflow.add_input('x', 1.0)
+    workflow.add_input('y', 2.0)
+    for i in range(count):
+        name = 't{}'.format(i)
+        workflow.add_task(name, SumTask(name, num_inputs=2))
+        workflow.connect('x', name + '.i0')
+        workflow.connect('y', name + '.i1')
+    return workflow
+
+
+def test_task_definitions_are_registered_in_bulk(emulator):
+    workflow = wide(200)
+    assert len(workflow.register_tasks(emulator.endpoint)) == 200
+    assert emulator.requests['get_task_defs'] == emulator.requests['register_task_defs'] == 1
+    assert len(emulator.task_defs) == 200
+
+    # The server's copies have its defaults filled in, and still count as unchanged
+    assert workflow.register_tasks(emulator.endpoint) == []
+    assert emulator.requests['register_task_defs'] == 1
+
+    workflow.tasks['t7'].description = 'changed'
+    assert workflow.register_tasks(emulator.endpoint) == ['t7']
+    assert emulator.requests['register_task_defs'] == 2
+    assert emulator.task_defs['t7']['description'] == 'changed'
+
+
+def test_all_task_definitions_are_registered_if_they_cant_be_fetched():
+    emulator = Emulator(error_rate={'get_task_defs': 1.0}).start()
+    try:
+        workflow = wide(3)
+        assert workflow.register_tasks(emulator.endpoint) == ['t0', 't1', 't2']
+        assert workflow.register_tasks(emulator.endpoint) == ['t0', 't1', 't2']
+    finally:
+        emulator.stop()
+
+    assert emulator.requests['register_task_defs'] == 2
+
+
+def test_workflow_definition_is_only_sent_when_changed(emulator):
+    workflow = diamond()
+    assert workflow.register(emulator.endpoint)
+    assert not workflow.register(emulator.endpoint)
+    assert emulator.requests['update_workflow_defs'] == 1
+
+    workflow.add_output('a', 'a.sum')
+    assert workflow.register(emulator.endpoint)
+    assert emulator.requests['update_workflow_defs'] == 2
+
+
+class Meeting(SumTask):
+    # Waits at a barrier with the other tasks sharing it, so they only finish if they run at the same time
+    def __init__(self, name, barrier):
+        super(Meeting, self).__init__(name, num_inputs=2)
+        self.barrier = barrier
+
+    def run(self, inputs, outputs):
+        self.barrier.wait(5)
+        super(Meeting, self).run(inputs, outputs)
+
+
+def test_run_local_matches_the_server(emulator):
+    workflow = diamond()
+    assert workflow.run_local({'x': 3.0}) == run(workflow, emulator, x=3.0) == {'c': 10.0, 'd': 5.0}
+    assert workflow.run_local(processes=2) == {'c': 6.0, 'd': 3.0}
+
+
+def test_run_local_runs_independent_tasks_at_once():
+    workflow = diamond()
+    barrier = threading.Barrier(3)
+    for name in ['a', 'b', 'd']:
+        workflow.tasks[name] = Meeting(name, barrier)
+
+    assert workflow.run_local(thread_count=3) == {'c': 6.0, 'd': 3.0}
+
+
+def test_run_local_uses_input_templates():
+    workflow = Workflow('defaults')
+    workflow.add_input('x', 1.0)
+    workflow.add_task('a', SumTask('a', num_inputs=2, use_defaults=True))
+    workflow.connect('x', 'a.i0')
+    workflow.add_output('a', 'a.sum')
+    workflow.add_output('missing', 'a.nothing')
+
+    # i1 keeps its default of 1.0, and an output nothing produced is None, as on the server
+    assert workflow.run_local({'x': 5.0}) == {'a': 6.0, 'missing': None}
+
+
+class Failing(SumTask):
+    def run(self, inputs, outputs):
+        raise ValueError('failing')
+
+
+def test_run_local_failure():
+    workflow = diamond()
+    workflow.tasks['b'] = Failing('b')
+
+    with pytest.raises(RuntimeError) as err:
+        workflow.run_local()
+    assert 'Task b' in str(err.value)
+
+
+def test_sweep(emulator):
+    workflow = diamond()
+    workflow.register_tasks(emulator.endpoint)
+    workflow.register(emulator.endpoint)
+
+    runtime = AsyncRuntime(emulator.endpoint, polling_interval=0.01)
+    for task in workflow._all_tasks():
+        runtime.register(task)
+    runtime.start()
+    started = time.time()
+    try:
+        results = list(workflow.sweep({'x': [1.0, 2.0, 3.0], 'y': [0.0, 1.0]}, max_in_flight=2,
+                                      endpoint=emulator.endpoint, check_interval=0.05))
+    finally:
+        elapsed = time.time() - started
+        runtime.stop()
+
+    assert sorted((case['x'], case['y'], status, output['c']) for case, status, output in results) == \
+        [(x, y, 'COMPLETED', 2 * (x + y)) for x in [1.0, 2.0, 3.0] for y in [0.0, 1.0]]
+    assert emulator.requests['start_workflow'] == 6
+
+    # Each round checks at most max_in_flight executions, and rounds are at least check_interval apart
+    assert emulator.requests['get_workflow'] <= 2 * (elapsed / 0.05 + 1)
+
+
+def test_sweep_yields_cases_that_fail_to_start(emulator):
+    # Not registered, so the server can't start it
+    results = list(diamond().sweep([{'x': 1.0}, {'x': 2.0}], endpoint=emulator.endpoint))
+
+    assert [(case, status) for case, status, output in results] == [({'x': 1.0}, 'FAILED'), ({'x': 2.0}, 'FAILED')]
+    assert all('404' in output['error'] for case, status, output in results)
+
+
+def test_sweep_gives_up_on_executions_it_cant_check():
+    emulator = Emulator(error_rate={'get_workflow': 1.0}).start()
+    try:
+        workflow = diamond()
+        workflow.register(emulator.endpoint)
+        results = list(workflow.sweep([{'x': 1.0}], endpoint=emulator.endpoint, check_interval=0.01,
+                                      max_check_errors=3))
+    finally:
+        emulator.stop()
+
+    assert [(case, status) for case, status, output in results] == [({'x': 1.0}, 'FAILED')]
+    assert '500' in results[0][2]['error']
+    assert emulator.requests['get_workflow'] == 3
@@ -23,13 +23,117 @@ import platform
 from subprocess import Popen, PIPE, STDOUT
 import os
 import math
+import threading
+
+# Default convergence controls for the induced velocity (lambda) Newton solve
+LAMBDA_TOL = 1e-14
+LAMBDA_MAXITER = 20
+
+
+def lambda_residual(lam, mu, alpha, Ct):
+    # Forward flight inflow equation (see "Helicopter Theory" section 4.1.1)
+    return lam - mu * np.tan(alpha) - Ct / (2.0 * np.sqrt(mu ** 2.0 + lam ** 2.0))
+
+
+def lambda_partials(lam, mu, alpha, Ct):
+    # Partials of a converged lambda wrt (mu, alpha, Ct), by implicit differentiation of lambda_residual = 0:
+    # dlambda/dx = -(dR/dx) / (dR/dlambda). Exact at the solution however many Newton steps it took to get there.
+    s = np.sqrt(mu ** 2.0 + lam ** 2.0)
+    dR_dlam = 1.0 + Ct * lam / (2.0 * s ** 3)
+    dR_dmu = -np.tan(alpha) + Ct * mu / (2.0 * s ** 3)
+    dR_dalpha = -mu / np.cos(alpha) ** 2
+    dR_dCt = -1.0 / (2.0 * s)
+    return -dR_dmu / dR_dlam, -dR_dalpha / dR_dlam, -dR_dCt / dR_dlam
+
+
+def solve_lambda(mu, alpha, Ct, lam=None, tol=LAMBDA_TOL, maxiter=LAMBDA_MAXITER):
+    # Solve for induced velocity /w Newton method over whole arrays of (mu, alpha, Ct). Points whose residual
+    # is within tol drop out of the active set and do no further work. lam seeds the solve; by default the
+    # closed-form estimate is used. Returns (lambda, iterations per point, converged per point).
+    mu, alpha, Ct = np.broadcast_arrays(np.asarray(mu, dtype=float),
+                                        np.asarray(alpha, dtype=float),
+                                        np.asarray(Ct, dtype=float))
+    shape = mu.shape
+    muTan = mu * np.tan(alpha)
+
+    if lam is None:
+        lam = muTan + Ct / (2.0 * np.sqrt(mu ** 2.0 + Ct / 2.0))
+    lam = np.array(np.broadcast_to(lam, shape), dtype=float).ravel()
+
+    mu, alpha, muTan, Ct = mu.ravel(), alpha.ravel(), muTan.ravel(), Ct.ravel()
+    iterations = np.zeros(lam.shape, dtype=int)
+
+    active = np.flatnonzero(np.abs(lambda_residual(lam, mu, alpha, Ct)) > tol)
+    for i in range(maxiter):
+        if active.size == 0:
+            break
+
+        m, t, c, l = mu[active], muTan[active], Ct[active], lam[active]
+        s = (m ** 2.0 + l ** 2) ** 1.5
+        l = (t + c / 2.0 * (m ** 2.0 + 2.0 * l ** 2) / s) / (1.0 + c / 2.0 * l / s)
+
+        lam[active] = l
+        iterations[active] += 1
+
+        resid = l - t - c / (2.0 * np.sqrt(m ** 2.0 + l ** 2.0))
+        active = active[np.abs(resid) > tol]
+
+    converged = np.ones(lam.shape, dtype=bool)
+    converged[active] = False
+
+    return lam.reshape(shape), iterations.reshape(shape), converged.reshape(shape)
+
+
+class LambdaStore(object):
+    # Small ring buffer of recently converged (mu, alpha, Ct) -> lambda solutions, used to warm-start the
+    # Newton solve from the nearest earlier point during sweeps and optimizations. A worker's threads share one
+    # component, so callers hold lock around reads and updates of the store (and of CruisePower.lambda_stats).
+
+    def __init__(self, size=64):
+        self.size = size
+        self.keys = np.empty((0, 3))
+        self.values = np.empty(0)
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, mu, alpha, Ct, lam):
+        keys = np.column_stack([np.ravel(mu), np.ravel(alpha), np.ravel(Ct)])
+        self.keys = np.vstack([self.keys, keys])[-self.size:]
+        self.values = np.concatenate([self.values, np.ravel(lam)])[-self.size:]
+
+    def nearest(self, mu, alpha, Ct):
+        # Distance is measured relative to the query so that mu, alpha and Ct carry equal weight
+        query = np.column_stack([np.ravel(mu), np.ravel(alpha), np.ravel(Ct)])
+        if not len(self):
+            return np.full(len(query), np.nan)
+
+        scale = np.abs(query) + 1e-12
+        dist = (((self.keys[np.newaxis, :, :] - query[:, np.newaxis, :]) / scale[:, np.newaxis, :]) ** 2).sum(axis=2)
+        return self.values[dist.argmin(axis=1)]
 
 
 class CruisePower(Component):
 
-    def __init__(self):
+    def __init__(self, warm_start=False, store_size=64):
         super(CruisePower, self).__init__()
 
+        # Optional warm start of the lambda solve from the nearest earlier solution
+        self.warm_start = warm_start
+        self.lambda_store = LambdaStore(store_size)
+        self.lambda_stats = {'solves': 0, 'warm_starts': 0, 'iterations': 0, 'cold_solves': 0,
+                             'cold_iterations': 0, 'iterations_saved_estimate': 0.0}
+
         self.add_param('Vehicle', val=u'helicopter', description='Vehicle type',
                        pass_by_obj=True)  # 'tiltwing' or 'helicopter'
         self.add_param('rProp', val=1.4, description='prop/rotor radius [m]')
@@ -155,14 +259,18 @@ class CruisePower(Component):
                     'rProp'] ** 2)
 
             # Solve for induced velocity /w Newton method (see "Helicopter Theory" section 4.1.1)
-            unknowns['lambda'] = unknowns['mu'] * math.tan(unknowns['alpha']) + unknowns['Ct'] / \
-                                 (2.0 * math.sqrt(unknowns['mu'] ** 2.0 + unknowns['Ct'] / 2.0))
-            for i in range(5):
-                unknowns['lambda'] = (unknowns['mu'] * math.tan(unknowns['alpha']) + \
-                                      unknowns['Ct'] / 2.0 * (unknowns['mu'] ** 2.0 + 2.0 * unknowns['lambda'] ** 2) / \
-                                      (unknowns['mu'] ** 2.0 + unknowns['lambda'] ** 2) ** 1.5) / \
-                                     (1.0 + unknowns['Ct'] / 2.0 * unknowns['lambda'] / (
-                                                 unknowns['mu'] ** 2 + unknowns['lambda'] ** 2.0) ** 1.5)
+            if self.warm_start:
+                lam, iterations, converged = self.solve_lambda(unknowns['mu'], unknowns['alpha'], unknowns['Ct'])
+                unknowns['lambda'] = float(lam)
+            else:
+                unknowns['lambda'] = unknowns['mu'] * math.tan(unknowns['alpha']) + unknowns['Ct'] / \
+                                     (2.0 * math.sqrt(unknowns['mu'] ** 2.0 + unknowns['Ct'] / 2.0))
+                for i in range(5):
+                    unknowns['lambda'] = (unknowns['mu'] * math.tan(unknowns['alpha']) + \
+                                          unknowns['Ct'] / 2.0 * (unknowns['mu'] ** 2.0 + 2.0 * unknowns['lambda'] ** 2) / \
+                                          (unknowns['mu'] ** 2.0 + unknowns['lambda'] ** 2) ** 1.5) / \
+                                         (1.0 + unknowns['Ct'] / 2.0 * unknowns['lambda'] / (
+                                                     unknowns['mu'] ** 2 + unknowns['lambda'] ** 2.0) ** 1.5)
             unknowns['v'] = unknowns['lambda'] * unknowns['omega'] * params['rProp'] - params['V'] * math.sin(
                 unknowns['alpha'])
 
@@ -187,6 +295,263 @@ class CruisePower(Component):
         else:
             pass
 
+    def linearize(self, params, unknowns, resids):
+        # Analytic partials of the unknowns wrt rProp, V and W, so gradient-based drivers don't finite difference
+        # this component. Each unknown's gradient is a vector over (rProp, V, W), built up through the same steps
+        # as solve_nonlinear; unknowns that are constants for the vehicle are left out (zero).
+        rProp, V, W = params['rProp'], params['V'], params['W']
+        dr, dV, dW = np.eye(3)
+        d = {}
+
+        # Altitude, compute atmospheric properties
+        rho = 1.225
+
+        if (params['Vehicle'].lower().replace('-', '') == "tiltwing"):
+            VStall = 35  # m/s
+
+            d['bRef'] = 6 * dr
+            d['SRef'] = dW / (0.5 * rho * VStall ** 2 * unknowns['CLmax'])
+            d['cRef'] = 0.5 * (d['SRef'] - unknowns['SRef'] * d['bRef'] / unknowns['bRef']) / unknowns['bRef']
+            d['AR'] = (2 * unknowns['bRef'] * d['bRef'] - unknowns['AR'] * d['SRef']) / unknowns['SRef']
+            d['Cd0'] = -unknowns['SCdFuse'] * d['SRef'] / unknowns['SRef'] ** 2
+            d['CL'] = unknowns['CL'] * (dW / W - 2 * dV / V - d['SRef'] / unknowns['SRef'])
+
+            # Quadratic drag polar: D = q * SRef * (Cd0 + CDi)
+            q = 0.5 * rho * V ** 2
+            CDi = unknowns['CL'] ** 2 / (math.pi * unknowns['AR'] * unknowns['e'])
+            dCDi = (2 * unknowns['CL'] * d['CL'] - CDi * math.pi * unknowns['e'] * d['AR']) / \
+                   (math.pi * unknowns['AR'] * unknowns['e'])
+            d['D'] = rho * V * dV * unknowns['SRef'] * (unknowns['Cd0'] + CDi) + \
+                     q * (d['SRef'] * (unknowns['Cd0'] + CDi) + unknowns['SRef'] * (d['Cd0'] + dCDi))
+
+            d['PCruise'] = d['D'] * V + unknowns['D'] * dV
+            d['PBattery'] = d['PCruise'] / unknowns['etaProp'] / unknowns['etaMotor']
+            d['LoverD'] = (dW - unknowns['LoverD'] * d['D']) / unknowns['D']
+
+        elif (params['Vehicle'].lower().replace('-', '') == "helicopter"):
+            alpha, mu, Ct = unknowns['alpha'], unknowns['mu'], unknowns['Ct']
+
+            d['omega'] = -(dV + unknowns['omega'] * dr) / rProp
+
+            # Tip speed omega * rProp, which appears throughout
+            VTip = unknowns['omega'] * rProp
+            dVTip = d['omega'] * rProp + unknowns['omega'] * dr
+
+            d['D'] = rho * V * unknowns['SCdFuse'] * dV
+            d['alpha'] = (W * d['D'] - unknowns['D'] * dW) / (W ** 2 + unknowns['D'] ** 2)
+            d['mu'] = (math.cos(alpha) * dV - V * math.sin(alpha) * d['alpha'] - mu * dVTip) / VTip
+            d['Ct'] = Ct * (dW / W - 2 * dr / rProp - 2 * dVTip / VTip)
+
+            # lambda is only known as the root of lambda_residual, so it's differentiated implicitly
+            dlam_dmu, dlam_dalpha, dlam_dCt = lambda_partials(unknowns['lambda'], mu, alpha, Ct)
+            d['lambda'] = dlam_dmu * d['mu'] + dlam_dalpha * d['alpha'] + dlam_dCt * d['Ct']
+            d['v'] = d['lambda'] * VTip + unknowns['lambda'] * dVTip - math.sin(alpha) * dV - \
+                     V * math.cos(alpha) * d['alpha']
+
+            # Power in forward flight, as climb + induced + profile terms (see "Helicopter Theory" section 5-12)
+            f = 1 + 4.5 * mu ** 2 + 1.61 * mu ** 3.7
+            df = (9.0 * mu + 1.61 * 3.7 * mu ** 2.7) * d['mu']
+            g = 0.03 + 0.1 * mu + 0.05 * math.sin(4.304 * mu - 0.20)
+            dg = (0.1 + 0.05 * 4.304 * math.cos(4.304 * mu - 0.20)) * d['mu']
+            sin2 = 1 - math.cos(alpha) ** 2
+            dsin2 = 2 * math.cos(alpha) * math.sin(alpha) * d['alpha']
+            h = 1 - g * sin2
+            dh = -(dg * sin2 + g * dsin2)
+
+            profile = unknowns['Cd0'] * VTip * f * h / 8 / (Ct / unknowns['sigma'])
+            dprofile = profile * (dVTip / VTip + df / f + dh / h - d['Ct'] / Ct)
+            induced = 1.3 * math.cosh(8 * mu ** 2) * unknowns['v']
+            dinduced = 1.3 * (16 * mu * math.sinh(8 * mu ** 2) * unknowns['v'] * d['mu'] +
+                              math.cosh(8 * mu ** 2) * d['v'])
+            climb = V * math.sin(alpha)
+            dclimb = math.sin(alpha) * dV + V * math.cos(alpha) * d['alpha']
+
+            d['PCruise'] = 1.1 * ((climb + induced + profile) * dW + W * (dclimb + dinduced + dprofile))
+            d['LoverD'] = unknowns['LoverD'] * (dW / W + dV / V - d['PCruise'] / unknowns['PCruise'])
+            d['PBattery'] = d['PCruise'] / unknowns['etaMotor']
+
+        J = {}
+        for k, grad in d.items():
+            for i, p in enumerate(['rProp', 'V', 'W']):
+                J[k, p] = grad[i]
+        return J
+
+    def solve_batch(self, params, tol=LAMBDA_TOL, maxiter=LAMBDA_MAXITER):
+        # Vectorized solve_nonlinear: rProp, V and W may be arrays (or scalars, broadcast against the others)
+        # and 'Vehicle' may be a single name or one name per point (broadcast with them too). Returns a dict of
+        # arrays, one per unknown, plus 'lambda_iterations' and 'lambda_converged' for the helicopter points. The
+        # lambda solve stops per point once its residual is within tol instead of running a fixed iteration count.
+        vehicle = np.char.replace(np.char.lower(np.asarray(params['Vehicle'], dtype=np.str_)), '-', '')
+        vehicle, rProp, V, W = np.broadcast_arrays(vehicle,
+                                                   np.asarray(params['rProp'], dtype=float),
+                                                   np.asarray(params['V'], dtype=float),
+                                                   np.asarray(params['W'], dtype=float))
+
+        unknowns = {k: np.full(rProp.shape, v['val'], dtype=float) for k, v in self._init_unknowns_dict.items()}
+        unknowns['lambda_iterations'] = np.zeros(rProp.shape, dtype=int)
+        unknowns['lambda_converged'] = np.ones(rProp.shape, dtype=bool)
+
+        # Altitude, compute atmospheric properties
+        rho = 1.225
+
+        # Fuselage / landing gear area
+        unknowns['SCdFuse'][...] = 0.35
+
+        tiltwing = vehicle == "tiltwing"
+        if tiltwing.any():
+            r, v, w = rProp[tiltwing], V[tiltwing], W[tiltwing]
+            out = {'SCdFuse': 0.35}
+
+            # Specify stall conditions
+            VStall = 35  # m/s
+            out['CLmax'] = 1.1  # Whole aircraft CL, section Clmax much higher
+
+            # Compute Wingspan assuming 2 props per wing with outboard props are at
+            # wingtips, 1 meter wide fuselage plus clearance between props and fuselage
+            out['bRef'] = 6 * r + 1.2  # Rough distance between hubs of outermost props
+
+            # Compute reference area (counting both wings)
+            out['SRef'] = w / (0.5 * rho * VStall ** 2 * out['CLmax'])
+
+            # Compute reference chord (chord of each wing)
+            out['cRef'] = 0.5 * out['SRef'] / out['bRef']
+
+            # Equivalent aspect ratio
+            out['AR'] = out['bRef'] ** 2 / out['SRef']
+
+            # Motor efficiency
+            out['etaMotor'] = 0.85
+
+            # Wing profile drag coefficent
+            out['Cd0Wing'] = 0.012
+
+            # Overall profile drag
+            out['Cd0'] = out['Cd0Wing'] + out['SCdFuse'] / out['SRef']
+
+            # Span efficiency
+            out['e'] = 1.3
+
+            # Solve for CL at cruise
+            out['CL'] = w / (0.5 * rho * v ** 2 * out['SRef'])
+
+            # Prop efficiency
+            out['etaProp'] = 0.8
+
+            # Estimate drag at cruise using quadratic drag polar
+            out['D'] = 0.5 * rho * v ** 2 * (out['SRef'] * (out['Cd0'] + out['CL'] ** 2 / (
+                    math.pi * out['AR'] * out['e'])))
+
+            # Compute cruise power estimate
+            out['PCruise'] = out['D'] * v
+
+            # Battery power
+            out['PBattery'] = out['PCruise'] / out['etaProp'] / out['etaMotor']
+
+            # Cruise L/D
+            out['LoverD'] = w / out['D']
+
+            for k, val in out.items():
+                unknowns[k][tiltwing] = val
+
+        helicopter = vehicle == "helicopter"
+        if helicopter.any():
+            r, v, w = rProp[helicopter], V[helicopter], W[helicopter]
+            out = {'SCdFuse': 0.35}
+
+            # Motor efficiency
+            out['etaMotor'] = 0.85 * 0.98  # Assumed motor and gearbox efficiencies (85%, and 98% respectively)
+
+            # Tip Mach number constraint
+            MTip = 0.65
+
+            # Tip loss factor
+            out['B'] = 0.97
+
+            # Blade solidity
+            out['sigma'] = 0.1
+
+            # Blade profile drag coefficient
+            out['Cd0'] = 0.012
+
+            # Compute rotation rate at cruise to be at tip mach limit
+            out['omega'] = (340.2940 * MTip - v) / r
+
+            # Fuselage drag
+            out['D'] = 0.5 * rho * (v ** 2) * out['SCdFuse']
+
+            # Inflow angle
+            out['alpha'] = np.arctan2(out['D'], w)
+
+            # Compute advance ratio
+            out['mu'] = v * np.cos(out['alpha']) / (out['omega'] * r)
+
+            # Thrust coefficient (including tip loss factor for effective disk area)
+            out['Ct'] = w / (rho * math.pi * r ** 2 * out['B'] ** 2 * out['omega'] ** 2 * r ** 2)
+
+            # Solve for induced velocity /w Newton method (see "Helicopter Theory" section 4.1.1)
+            out['lambda'], out['lambda_iterations'], out['lambda_converged'] = self.solve_lambda(
+                out['mu'], out['alpha'], out['Ct'], tol=tol, maxiter=maxiter)
+            out['v'] = out['lambda'] * out['omega'] * r - v * np.sin(out['alpha'])
+
+            # Power in forward flight (see "Helicopter Theory" section 5-12)
+            out['PCruise'] = w * (v * np.sin(out['alpha']) + 1.3 * np.cosh(8 * out['mu'] ** 2) * out['v'] +
+                                  out['Cd0'] * out['omega'] * r *
+                                  (1 + 4.5 * out['mu'] ** 2 + 1.61 * out['mu'] ** 3.7) *
+                                  (1 - (0.03 + 0.1 * out['mu'] + 0.05 * np.sin(4.304 * out['mu'] - 0.20)) *
+                                   (1 - np.cos(out['alpha']) ** 2)) / 8 / (out['Ct'] / out['sigma']))
+
+            # 10% power added for helicopter tail rotor
+            out['PCruise'] = 1.1 * out['PCruise']
+
+            # Equivalent L/D, assuming power = D * V and L = W
+            out['LoverD'] = w / (out['PCruise'] / v)
+
+            # Battery power
+            out['PBattery'] = out['PCruise'] / out['etaMotor']
+
+            for k, val in out.items():
+                unknowns[k][helicopter] = val
+
+        return unknowns
+
+    def solve_lambda(self, mu, alpha, Ct, tol=LAMBDA_TOL, maxiter=LAMBDA_MAXITER):
+        # solve_lambda, seeded from lambda_store when warm_start is on. The stored neighbour is only used
+        # where its residual beats the closed-form estimate, so a warm start never costs extra iterations.
+        if not self.warm_start:
+            return solve_lambda(mu, alpha, Ct, tol=tol, maxiter=maxiter)
+
+        mu, alpha, Ct = np.broadcast_arrays(np.asarray(mu, dtype=float),
+                                            np.asarray(alpha, dtype=float),
+                                            np.asarray(Ct, dtype=float))
+
+        cold = mu * np.tan(alpha) + Ct / (2.0 * np.sqrt(mu ** 2.0 + Ct / 2.0))
+        with self.lambda_store.lock:
+            seed = self.lambda_store.nearest(mu, alpha, Ct).reshape(mu.shape)
+
+        with np.errstate(invalid='ignore'):
+            warm = np.isfinite(seed) & (np.abs(lambda_residual(seed, mu, alpha, Ct)) <
+                                        np.abs(lambda_residual(cold, mu, alpha, Ct)))
+
+        lam, iterations, converged = solve_lambda(mu, alpha, Ct, lam=np.where(warm, seed, cold),
+                                                  tol=tol, maxiter=maxiter)
+
+        with self.lambda_store.lock:
+            self.lambda_store.add(mu[converged], alpha[converged], Ct[converged], lam[converged])
+
+            # Each warm start's cold solve never ran, so the iterations it saved are only an estimate: the mean
+            # iteration count of the cold solves seen so far, less its own
+            stats = self.lambda_stats
+            stats['solves'] += iterations.size
+            stats['iterations'] += int(iterations.sum())
+            stats['cold_solves'] += int((~warm).sum())
+            stats['cold_iterations'] += int(iterations[~warm].sum())
+            if warm.any() and stats['cold_solves']:
+                mean_cold = stats['cold_iterations'] / float(stats['cold_solves'])
+                stats['warm_starts'] += int(warm.sum())
+                stats['iterations_saved_estimate'] += float((mean_cold - iterations[warm]).sum())
+
+        return lam, iterations, converged
+
 
 if __name__ == "__main__":
     top = Problem()
@@ -237,6 +602,28 @@ if __name__ == "__main__":
     print("B:", top['Example.B'])
     print("sigma:", top['Example.sigma'])
 
+    # Analytic partials against finite differences, for both vehicles
+    top.check_partial_derivatives(compact_print=True)
+
+    top['Inputs.Vehicle'] = u'tiltwing'
+    top.run()
+    top.check_partial_derivatives(compact_print=True)
+    top['Inputs.Vehicle'] = u'helicopter'
+
+    # Batch mode: a cruise speed sweep in one vectorized call
+    sweep = CruisePower().solve_batch({'Vehicle': u'helicopter',
+                                       'rProp': 1.4,
+                                       'V': np.linspace(20.0, 80.0, 7),
+                                       'W': 2000.0})
+    print("PBattery sweep:", sweep['PBattery'])
+    print("lambda iterations:", sweep['lambda_iterations'])
+
+    # Warm-started sweep: each call seeds lambda from the nearest earlier solution
+    warm = CruisePower(warm_start=True)
+    for V in np.linspace(20.0, 80.0, 61):
+        warm.solve_batch({'Vehicle': u'helicopter', 'rProp': 1.4, 'V': V, 'W': 2000.0})
+    print("warm start stats:", warm.lambda_stats)
+
     # Example
     # top['Inputs.Vehicle'] = u'helicopter'
 
@@ -19,8 +19,16 @@
 from __future__ import print_function
 
 from openmdao.api import Component, Group, Problem, IndepVarComp
+import numpy as np
 import math
 
+# Altitude, compute atmospheric properties
+rho = 1.225
+
+# Blade parameters
+Cd0 = 0.012  # Blade airfoil profile drag coefficient
+sigma = 0.1  # Solidity (could estimate from Ct assuming some average blade CL)
+
 
 class HoverPower(Component):
 
@@ -41,122 +49,243 @@ class HoverPower(Component):
         self.add_output('QMax', val=0.0)
 
     def solve_nonlinear(self, params, unknowns, resids):
-        # Altitude, compute atmospheric properties
-        rho = 1.225
-
-        # Blade parameters
-        Cd0 = 0.012  # Blade airfoil profile drag coefficient
-        sigma = 0.1  # Solidity (could estimate from Ct assuming some average blade CL)
+        vehicle = params["Vehicle"].lower().replace('-', '')
 
         # Different assumptions per vehicle
-        if (params["Vehicle"].lower().replace('-', '') == "tiltwing"):
+        if (vehicle == "tiltwing"):
+            self._tiltwing(params['rProp'], params['W'], unknowns, math)
 
-            nProp = 8  # Number of props / motors
-            ToverW = 1.7  # Max required T/W to handle rotor out w/ manuever margin
-            k = 1.15  # Effective disk area factor (see "Helicopter Theory" Section 2-6.2)
-            etaMotor = 0.85  # Assumed electric motor efficiency
+        elif (vehicle == "helicopter"):
+            self._helicopter(params['rProp'], params['W'], params['cruisePower_omega'], unknowns, math)
 
-            # Tip Mach number constraint for noise reasons at max thrust condition
-            MTip = 0.65
+        else:
+            pass
+            # TODO: raise OpenMDAO exception
 
-            # Tip speed limit
-            unknowns['hoverPower_Vtip'] = 340.2940 * MTip / math.sqrt(
-                ToverW)  # Limit tip speed at max thrust, not hover
-            omega = unknowns['hoverPower_Vtip'] / params['rProp']
+    def linearize(self, params, unknowns, resids):
+        # Analytic partials of the unknowns wrt rProp, W and cruisePower_omega, each built up as a gradient vector
+        # over those three through the same steps as the vehicle models; unknowns a vehicle doesn't compute are
+        # left out (zero).
+        vehicle = params["Vehicle"].lower().replace('-', '')
 
-            # Thrust per prop / rotor at hover
-            THover = params['W'] / nProp
+        if (vehicle == "tiltwing"):
+            d = self._tiltwing_partials(params['rProp'], params['W'], unknowns)
 
-            # Compute thrust coefficient
-            Ct = THover / (rho * math.pi * params['rProp'] ** 2 * unknowns['hoverPower_Vtip'] ** 2)
+        elif (vehicle == "helicopter"):
+            d = self._helicopter_partials(params['rProp'], params['W'], params['cruisePower_omega'], unknowns)
 
-            # Average blade CL (see "Helicopter Theory" section 2-6.3)
-            AvgCL = 6.0 * Ct / sigma
+        else:
+            d = {}
+
+        J = {}
+        for k, grad in d.items():
+            for i, p in enumerate(['rProp', 'W', 'cruisePower_omega']):
+                J[k, p] = grad[i]
+        return J
+
+    def solve_batch(self, params):
+        # Vectorized solve_nonlinear: every numeric param may be an array (or scalar, broadcast against the
+        # others, 'Vehicle' included, which may be a single name or one name per point). Returns a dict of
+        # float arrays, one per unknown. Points are grouped by vehicle and run through the same expressions as
+        # the scalar path, so each element is what solve_nonlinear gives for that point, to within rounding
+        # (numpy's powers may round differently from math's). Outputs a vehicle does not compute keep their
+        # declared default, as they would in an OpenMDAO run.
+        vehicle = np.char.replace(np.char.lower(np.asarray(params['Vehicle'], dtype=np.str_)), '-', '')
+        vehicle, rProp, W, omega = np.broadcast_arrays(vehicle,
+                                                       np.asarray(params['rProp'], dtype=float),
+                                                       np.asarray(params['W'], dtype=float),
+                                                       np.asarray(params['cruisePower_omega'], dtype=float))
+
+        unknowns = {k: np.full(rProp.shape, v['val'], dtype=float) for k, v in self._init_unknowns_dict.items()}
+
+        tiltwing = vehicle == "tiltwing"
+        if tiltwing.any():
+            out = {}
+            self._tiltwing(rProp[tiltwing], W[tiltwing], out, np)
+            for k, v in out.items():
+                unknowns[k][tiltwing] = v
+
+        helicopter = vehicle == "helicopter"
+        if helicopter.any():
+            out = {}
+            self._helicopter(rProp[helicopter], W[helicopter], omega[helicopter], out, np)
+            for k, v in out.items():
+                unknowns[k][helicopter] = v
+
+        return unknowns
+
+    # The per-vehicle models below are shared by the scalar and batch paths; 'm' is either the math or the
+    # numpy module.
+
+    def _tiltwing(self, rProp, W, unknowns, m):
+        nProp = 8  # Number of props / motors
+        ToverW = 1.7  # Max required T/W to handle rotor out w/ manuever margin
+        k = 1.15  # Effective disk area factor (see "Helicopter Theory" Section 2-6.2)
+        etaMotor = 0.85  # Assumed electric motor efficiency
+
+        # Tip Mach number constraint for noise reasons at max thrust condition
+        MTip = 0.65
+
+        # Tip speed limit
+        unknowns['hoverPower_Vtip'] = 340.2940 * MTip / m.sqrt(
+            ToverW)  # Limit tip speed at max thrust, not hover
+        omega = unknowns['hoverPower_Vtip'] / rProp
+
+        # Thrust per prop / rotor at hover
+        THover = W / nProp
+
+        # Compute thrust coefficient
+        Ct = THover / (rho * m.pi * rProp ** 2 * unknowns['hoverPower_Vtip'] ** 2)
+
+        # Average blade CL (see "Helicopter Theory" section 2-6.3)
+        AvgCL = 6.0 * Ct / sigma
+
+        # Hover Power
+        PHover = nProp * THover * \
+                 (k * m.sqrt(THover / (2 * rho * m.pi * rProp ** 2)) + \
+                  sigma * Cd0 / 8 * unknowns['hoverPower_Vtip'] ** 3 / (
+                          THover / (rho * m.pi * rProp ** 2)))
+        FOM = nProp * THover * m.sqrt(THover / (2 * rho * m.pi * rProp ** 2)) / PHover
+
+        # Battery power
+        unknowns['hoverPower_PBattery'] = PHover / etaMotor
+
+        # Maximum thrust per motor
+        unknowns['TMax'] = THover * ToverW
+
+        # Maximum shaft power required (for motor sizing)
+        # Note: Tilt-wing multirotor increases thrust by increasing RPM at constant collective
+        VtipMax = unknowns['hoverPower_Vtip'] * m.sqrt(ToverW)
+        unknowns['hoverPower_PMax'] = nProp * unknowns['TMax'] * \
+                                      (k * m.sqrt(
+                                          unknowns['TMax'] / (2 * rho * m.pi * rProp ** 2)) + \
+                                       sigma * Cd0 / 8 * VtipMax ** 3 / (
+                                               unknowns['TMax'] / (rho * m.pi * rProp ** 2)))
+
+        # Max battery power
+        unknowns['hoverPower_PMaxBattery'] = unknowns['hoverPower_PMax'] / etaMotor
+
+        # Maximum torque per motor
+        QMax = unknowns['hoverPower_PMax'] / (omega * m.sqrt(ToverW))
+
+    def _helicopter(self, rProp, W, cruisePower_omega, unknowns, m):
+        nProp = 1.0  # Number of rotors
+        ToverW = 1.1  # Max required T/W for climb and operating at higher altitudes
+        k = 1.15  # Effective disk area factor (see "Helicopter Theory" Section 2-6.2)
+        etaMotor = 0.85 * 0.98  # Assumed motor and gearbox efficiencies (85% and 98% respectively)
+
+        omega = cruisePower_omega
+        unknowns['hoverPower_Vtip'] = omega * rProp
+
+        # Thrust per prop / rotor at hover
+        THover = W / nProp
+
+        # Compute thrust coefficient
+        Ct = THover / (rho * m.pi * rProp ** 2.0 * unknowns['hoverPower_Vtip'] ** 2.0)
+
+        # Average blade CL (see "Helicopter Theory" Section 2-6.4)
+        AvgCL = 6.0 * Ct / sigma
+
+        # Auto-rotation descent rate (see "Helicopter Theory" Section 3-2)
+        unknowns['hoverPower_VAutoRotation'] = 1.16 * m.sqrt(THover / (m.pi * rProp ** 2.0))
+
+        # Hover Power
+        PHover = nProp * THover * \
+                 (k * m.sqrt(THover / (2.0 * rho * m.pi * rProp ** 2.0)) + \
+                  sigma * Cd0 / 8.0 * unknowns['hoverPower_Vtip'] ** 3.0 / (
+                          THover / (rho * m.pi * rProp ** 2.0)))
+        FOM = nProp * THover * m.sqrt(THover / (2.0 * rho * m.pi * rProp ** 2.0)) / PHover
 
-            # Hover Power
-            PHover = nProp * THover * \
-                     (k * math.sqrt(THover / (2 * rho * math.pi * params['rProp'] ** 2)) + \
-                      sigma * Cd0 / 8 * (unknowns['hoverPower_Vtip']) ** 3 / (
-                                  THover / (rho * math.pi * params['rProp'] ** 2)))
-            FOM = nProp * THover * math.sqrt(THover / (2 * rho * math.pi * params['rProp'] ** 2)) / PHover
+        # Battery power
+        # ~10% power to tail rotor (see "Princples of Helicopter Aerodynamics" by Leishman)
+        PTailRotor = 0.1 * PHover
+        unknowns['hoverPower_PBattery'] = (PHover + PTailRotor) / etaMotor
 
-            # Battery power
-            unknowns['hoverPower_PBattery'] = PHover / etaMotor
+        # Maximum thrust per motor
+        unknowns['TMax'] = THover * ToverW
 
-            # Maximum thrust per motor
-            unknowns['TMax'] = THover * ToverW
+        # Maximum shaft power required (for motor sizing)
+        # Note: Helicopter increases thrust by increasing collective with constant RPM
+        unknowns['hoverPower_PMax'] = nProp * unknowns['TMax'] * \
+                                      (k * m.sqrt(
+                                          unknowns['TMax'] / (2.0 * rho * m.pi * rProp ** 2.0)) + \
+                                       sigma * Cd0 / 8.0 * unknowns['hoverPower_Vtip'] ** 3.0 / (
+                                               unknowns['TMax'] / (rho * m.pi * rProp ** 2.0)))
 
-            # Maximum shaft power required (for motor sizing)
-            # Note: Tilt-wing multirotor increases thrust by increasing RPM at constant collective
-            unknowns['hoverPower_PMax'] = nProp * unknowns['TMax'] * \
-                                          (k * math.sqrt(
-                                              unknowns['TMax'] / (2 * rho * math.pi * params['rProp'] ** 2)) + \
-                                           sigma * Cd0 / 8 * (unknowns['hoverPower_Vtip'] * math.sqrt(ToverW)) ** 3 / (
-                                                       unknowns['TMax'] / (rho * math.pi * params['rProp'] ** 2)))
+        # ~15% power to tail rotor for sizing (see "Princples of Helicopter Aerodynamics" by Leishman)
+        unknowns['hoverPower_PMax'] = 1.15 * unknowns['hoverPower_PMax']
 
-            # Max battery power
-            unknowns['hoverPower_PMaxBattery'] = unknowns['hoverPower_PMax'] / etaMotor
+        # Max battery power
+        unknowns['hoverPower_PMaxBattery'] = unknowns['hoverPower_PMax'] / etaMotor
 
-            # Maximum torque per motor
-            QMax = unknowns['hoverPower_PMax'] / (omega * math.sqrt(ToverW))
+        # Maximum torque per motor
+        unknowns['QMax'] = unknowns['hoverPower_PMax'] / omega
 
-        elif (params['Vehicle'].lower().replace('-', '') == "helicopter"):
+    # Partials of the vehicle models above, as gradients over (rProp, W, cruisePower_omega). The constants are
+    # the models' own.
 
-            nProp = 1.0  # Number of rotors
-            ToverW = 1.1  # Max required T/W for climb and operating at higher altitudes
-            k = 1.15  # Effective disk area factor (see "Helicopter Theory" Section 2-6.2)
-            etaMotor = 0.85 * 0.98  # Assumed motor and gearbox efficiencies (85% and 98% respectively)
+    def _tiltwing_partials(self, rProp, W, unknowns):
+        nProp = 8  # Number of props / motors
+        ToverW = 1.7  # Max required T/W to handle rotor out w/ manuever margin
+        k = 1.15  # Effective disk area factor (see "Helicopter Theory" Section 2-6.2)
+        etaMotor = 0.85  # Assumed electric motor efficiency
 
-            omega = params['cruisePower_omega']
-            unknowns['hoverPower_Vtip'] = omega * params['rProp']
+        dr, dW, domega = np.eye(3)
+        d = {}
 
-            # Thrust per prop / rotor at hover
-            THover = params['W'] / nProp
+        # Tip speed is fixed by the tip Mach number
+        Vtip = unknowns['hoverPower_Vtip']
 
-            # Compute thrust coefficient
-            Ct = THover / (rho * math.pi * params['rProp'] ** 2.0 * unknowns['hoverPower_Vtip'] ** 2.0)
+        THover = W / nProp
+        dTHover = dW / nProp
+        dPHover = _rotor_power_partials(nProp, k, THover, dTHover, rProp, dr, Vtip, 0 * dr)
+        d['hoverPower_PBattery'] = dPHover / etaMotor
 
-            # Average blade CL (see "Helicopter Theory" Section 2-6.4)
-            AvgCL = 6.0 * Ct / sigma
+        d['TMax'] = dTHover * ToverW
+        d['hoverPower_PMax'] = _rotor_power_partials(nProp, k, unknowns['TMax'], d['TMax'], rProp, dr,
+                                                     Vtip * math.sqrt(ToverW), 0 * dr)
+        d['hoverPower_PMaxBattery'] = d['hoverPower_PMax'] / etaMotor
 
-            # Auto-rotation descent rate (see "Helicopter Theory" Section 3-2)
-            unknowns['hoverPower_VAutoRotation'] = 1.16 * math.sqrt(THover / (math.pi * params['rProp'] ** 2.0))
+        return d
 
-            # Hover Power
-            PHover = nProp * THover * \
-                     (k * math.sqrt(THover / (2.0 * rho * math.pi * params['rProp'] ** 2.0)) + \
-                      sigma * Cd0 / 8.0 * (unknowns['hoverPower_Vtip'] ** 3.0) / (
-                                  THover / (rho * math.pi * params['rProp'] ** 2.0)))
-            FOM = nProp * THover * math.sqrt(THover / (2.0 * rho * math.pi * params['rProp'] ** 2.0)) / PHover
+    def _helicopter_partials(self, rProp, W, cruisePower_omega, unknowns):
+        nProp = 1.0  # Number of rotors
+        ToverW = 1.1  # Max required T/W for climb and operating at higher altitudes
+        k = 1.15  # Effective disk area factor (see "Helicopter Theory" Section 2-6.2)
+        etaMotor = 0.85 * 0.98  # Assumed motor and gearbox efficiencies (85% and 98% respectively)
 
-            # Battery power
-            # ~10% power to tail rotor (see "Princples of Helicopter Aerodynamics" by Leishman)
-            PTailRotor = 0.1 * PHover
-            unknowns['hoverPower_PBattery'] = (PHover + PTailRotor) / etaMotor
+        dr, dW, domega = np.eye(3)
+        d = {}
 
-            # Maximum thrust per motor
-            unknowns['TMax'] = THover * ToverW
+        omega = cruisePower_omega
+        d['hoverPower_Vtip'] = omega * dr + rProp * domega
 
-            # Maximum shaft power required (for motor sizing)
-            # Note: Helicopter increases thrust by increasing collective with constant RPM
-            unknowns['hoverPower_PMax'] = nProp * unknowns['TMax'] * \
-                                          (k * math.sqrt(
-                                              unknowns['TMax'] / (2.0 * rho * math.pi * params['rProp'] ** 2.0)) + \
-                                           sigma * Cd0 / 8.0 * (unknowns['hoverPower_Vtip'] ** 3.0) / (
-                                                       unknowns['TMax'] / (rho * math.pi * params['rProp'] ** 2.0)))
+        THover = W / nProp
+        dTHover = dW / nProp
 
-            # ~15% power to tail rotor for sizing (see "Princples of Helicopter Aerodynamics" by Leishman)
-            unknowns['hoverPower_PMax'] = 1.15 * unknowns['hoverPower_PMax']
+        d['hoverPower_VAutoRotation'] = unknowns['hoverPower_VAutoRotation'] * (0.5 * dTHover / THover - dr / rProp)
 
-            # Max battery power
-            unknowns['hoverPower_PMaxBattery'] = unknowns['hoverPower_PMax'] / etaMotor
+        dPHover = _rotor_power_partials(nProp, k, THover, dTHover, rProp, dr, unknowns['hoverPower_Vtip'],
+                                        d['hoverPower_Vtip'])
+        d['hoverPower_PBattery'] = 1.1 * dPHover / etaMotor
 
-            # Maximum torque per motor
-            unknowns['QMax'] = unknowns['hoverPower_PMax'] / omega
+        d['TMax'] = dTHover * ToverW
+        d['hoverPower_PMax'] = 1.15 * _rotor_power_partials(nProp, k, unknowns['TMax'], d['TMax'], rProp, dr,
+                                                            unknowns['hoverPower_Vtip'], d['hoverPower_Vtip'])
+        d['hoverPower_PMaxBattery'] = d['hoverPower_PMax'] / etaMotor
+        d['QMax'] = (d['hoverPower_PMax'] - unknowns['QMax'] * domega) / omega
 
-        else:
-            pass
-            # TODO: raise OpenMDAO exception
+        return d
+
+
+def _rotor_power_partials(nProp, k, T, dT, rProp, dr, Vtip, dVtip):
+    # Gradient of the rotor power of the vehicle models,
+    #   nProp * T * (k * sqrt(T / (2 rho pi rProp^2)) + sigma * Cd0 / 8 * Vtip^3 / (T / (rho pi rProp^2))),
+    # from the gradients of T, rProp and Vtip. Both terms are products of powers, so each one's gradient is
+    # itself times the sum of its exponents times the relative gradients.
+    induced = nProp * T * k * math.sqrt(T / (2.0 * rho * math.pi * (rProp * rProp)))
+    profile = nProp * sigma * Cd0 / 8.0 * (Vtip * Vtip * Vtip) * rho * math.pi * (rProp * rProp)
+    return induced * (1.5 * dT / T - dr / rProp) + profile * (3.0 * dVtip / Vtip + 2.0 * dr / rProp)
 
 
 if __name__ == "__main__":
@@ -189,3 +318,17 @@ if __name__ == "__main__":
     print("PMax:", top['Example.hoverPower_PMax'])
     print("PMaxBattery:", top['Example.hoverPower_PMaxBattery'])
     print("QMax:", top['Example.QMax'])
+
+    # Analytic partials against finite differences, for both vehicles
+    top.check_partial_derivatives(compact_print=True)
+
+    top['Inputs.Vehicle'] = u'tiltwing'
+    top.run()
+    top.check_partial_derivatives(compact_print=True)
+
+    # Batch mode: a whole rProp sweep in one vectorized call
+    sweep = HoverPower().solve_batch({'Vehicle': u'helicopter',
+                                      'rProp': np.linspace(1.0, 2.0, 5),
+                                      'W': 2000.0,
+                                      'cruisePower_omega': 122.0})
+    print("PBattery sweep:", sweep['hoverPower_PBattery'])